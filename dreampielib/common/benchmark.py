@@ -0,0 +1,276 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmarks for the communication with the subprocess.
+Run with "python -m dreampielib.common.benchmark".
+It isn't needed to run DreamPie.
+"""
+
+import sys
+import os
+import time
+import socket
+import struct
+import threading
+from cStringIO import StringIO
+
+from ..common import brine
+from ..common.objectstream import recv_object, ObjectStream
+
+def make_payloads():
+    """
+    Return a list of (name, obj) pairs, with objects similar to what is sent
+    between the GUI and the subprocess.
+    """
+    names = [u'%s_%d' % (prefix, i)
+             for i in range(5000)
+             for prefix in (u'array', u'Dtype', u'linalg', u'_private')]
+    names.sort()
+    public = [s for s in names if not s.startswith(u'_')]
+    private = [s for s in names if s.startswith(u'_')]
+    doc = u'\n'.join(u'    %d. Some documentation line, with a few words.' % i
+                     for i in range(6000))
+    return [
+        ('call', (17, u'complete_attributes', (u'numpy.linalg',))),
+        ('reply', (17, (True, None))),
+        ('result', (17, (True, 3, u'[1, 2, 3]', None, u''))),
+        ('completions', (17, (public, private))),
+        ('doc', (17, doc)),
+        ]
+
+def connected_sockets():
+    """Return a pair of connected sockets."""
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('localhost', 0))
+    listener.listen(1)
+    a = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    a.connect(listener.getsockname())
+    b, _addr = listener.accept()
+    listener.close()
+    return a, b
+
+def start_sender(sock, data, n):
+    """
+    Send data n times over sock from a child process, or from a thread if
+    fork isn't available, so that the sender doesn't compete with the
+    receiver for the GIL. Return a function which waits until it's done.
+    """
+    def send():
+        for _i in xrange(n):
+            sock.sendall(data)
+    if hasattr(os, 'fork'):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                send()
+            finally:
+                os._exit(0)
+        return lambda: os.waitpid(pid, 0)
+    t = threading.Thread(target=send)
+    t.start()
+    return t.join
+
+def cpu_time():
+    """Return the CPU time used by this process, not by its children."""
+    user, system = os.times()[:2]
+    return user + system
+
+def time_recv(recv, obj, total_bytes, max_messages=100000, batch=1,
+              repeat=3):
+    """
+    Send obj repeatedly from another process, until about total_bytes (but
+    not more than max_messages) were sent, and receive it using recv(sock).
+    The frames are sent batch at a time, like queued output.
+    Return (n_messages, n_bytes, seconds) of the fastest of repeat runs. If
+    the sender is a process, the seconds are the CPU time of the receiver,
+    so that the sender doesn't count on a single CPU.
+    """
+    timer = cpu_time if hasattr(os, 'fork') else time.time
+    s = brine.dump(obj)
+    frame = struct.pack('<l', len(s)) + s
+    frame_len = len(frame)
+    n = min(max(total_bytes // frame_len, 10), max_messages)
+    n -= n % batch
+    best = None
+    for _r in xrange(repeat):
+        a, b = connected_sockets()
+        # We send a pre-brined frame, so that only receiving is measured.
+        wait = start_sender(a, frame * batch, n // batch)
+        start = timer()
+        for _i in xrange(n):
+            recv(b)
+        elapsed = timer() - start
+        wait()
+        a.close()
+        b.close()
+        if best is None or elapsed < best:
+            best = elapsed
+    return n, n * frame_len, best
+
+def bench_recv(total_bytes=50*1024*1024, batch=64):
+    """
+    Compare the plain recv_object with ObjectStream.recv_object. Small
+    payloads are also sent batch frames at a time, so that a single recv
+    of ObjectStream gets many of them.
+    """
+    print 'Receiving objects (recv_object vs. ObjectStream):'
+    print '%-16s %14s %14s %10s %10s' % (
+        'payload', 'old msg/s', 'new msg/s', 'old MB/s', 'new MB/s')
+    cases = [(name, obj, 1) for name, obj in make_payloads()]
+    cases += [('%s x%d' % (name, batch), obj, batch)
+              for name, obj in make_payloads()
+              if len(brine.dump(obj)) < 1024]
+    for name, obj, n_batch in cases:
+        n, nbytes, old_t = time_recv(recv_object, obj, total_bytes,
+                                     batch=n_batch)
+        streams = {}
+        def stream_recv(sock):
+            if sock not in streams:
+                streams[sock] = ObjectStream(sock)
+            return streams[sock].recv_object()
+        n, nbytes, new_t = time_recv(stream_recv, obj, total_bytes,
+                                     batch=n_batch)
+        mb = nbytes / 1024. / 1024.
+        print '%-16s %14.0f %14.0f %10.1f %10.1f' % (
+            name, n / old_t, n / new_t, mb / old_t, mb / new_t)
+
+class ReferenceDecoder(object):
+    """
+    The stream-based, recursive brine decoder which was used before brine.load
+    became table-driven. It is kept here only for comparison.
+    """
+    def __init__(self):
+        imm_ints = dict((v, k) for k, v in brine.IMM_INTS.iteritems())
+        consts = {brine.TAG_NONE: None, brine.TAG_EMPTY_STR: u'',
+                  brine.TAG_EMPTY_TUPLE: (), brine.TAG_TRUE: True,
+                  brine.TAG_FALSE: False,
+                  brine.TAG_NOT_IMPLEMENTED: NotImplemented,
+                  brine.TAG_ELLIPSIS: Ellipsis}
+        self.consts = consts
+        self.imm_ints = imm_ints
+        I1, I4 = brine.I1, brine.I4
+        load = self._load
+        def str_n(n):
+            return lambda stream: stream.read(n).decode('utf8')
+        def tup_n(n):
+            return lambda stream: tuple(load(stream) for _i in xrange(n))
+        def read_len(struct, stream):
+            return struct.unpack(stream.read(struct.size))[0]
+        def complex_(stream):
+            real, imag = brine.C16.unpack(stream.read(16))
+            return complex(real, imag)
+        def slice_(stream):
+            start, stop, step = load(stream)
+            return slice(start, stop, step)
+        self.registry = {
+            brine.TAG_EMPTY_LIST: lambda stream: [],
+            brine.TAG_FLOAT: lambda stream: brine.F8.unpack(stream.read(8))[0],
+            brine.TAG_COMPLEX: complex_,
+            brine.TAG_STR1: str_n(1),
+            brine.TAG_STR2: str_n(2),
+            brine.TAG_STR3: str_n(3),
+            brine.TAG_STR4: str_n(4),
+            brine.TAG_STR_L1: lambda stream: str_n(read_len(I1, stream))(
+                stream),
+            brine.TAG_STR_L4: lambda stream: str_n(read_len(I4, stream))(
+                stream),
+            brine.TAG_TUP1: tup_n(1),
+            brine.TAG_TUP2: tup_n(2),
+            brine.TAG_TUP3: tup_n(3),
+            brine.TAG_TUP4: tup_n(4),
+            brine.TAG_TUP_L1: lambda stream: tup_n(read_len(I1, stream))(
+                stream),
+            brine.TAG_TUP_L4: lambda stream: tup_n(read_len(I4, stream))(
+                stream),
+            brine.TAG_LIST1: lambda stream: [load(stream)],
+            brine.TAG_LIST_L1: lambda stream: list(
+                tup_n(read_len(I1, stream))(stream)),
+            brine.TAG_LIST_L4: lambda stream: list(
+                tup_n(read_len(I4, stream))(stream)),
+            brine.TAG_SLICE: slice_,
+            brine.TAG_FSET: lambda stream: frozenset(load(stream)),
+            brine.TAG_INT_L1: lambda stream: int(
+                stream.read(read_len(I1, stream))),
+            brine.TAG_INT_L4: lambda stream: int(
+                stream.read(read_len(I4, stream))),
+            }
+
+    def _load(self, stream):
+        tag = stream.read(1)
+        if tag in self.imm_ints:
+            return self.imm_ints[tag]
+        if tag in self.consts:
+            return self.consts[tag]
+        return self.registry[tag](stream)
+
+    def load(self, data):
+        return self._load(StringIO(data))
+
+def time_func(func, arg, min_time=0.5):
+    """Return the number of calls to func(arg) per second."""
+    n = 0
+    start = time.time()
+    while True:
+        func(arg)
+        n += 1
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            return n / elapsed
+
+def dump_unpacked(obj):
+    """Dump obj without packing lists of strings, like older versions did."""
+    registry = brine._dump_registry
+    saved = registry[list]
+    registry[list] = brine._dump_list_items
+    try:
+        return brine.dump(obj)
+    finally:
+        registry[list] = saved
+
+def bench_brine():
+    """
+    Compare the reference brine decoder, with lists of strings dumped
+    item by item, to brine.load with packed lists of strings.
+    """
+    print 'Brining objects (reference decoder, unpacked lists vs. brine.load):'
+    print '%-12s %9s %9s %10s %10s %10s %10s %8s' % (
+        'payload', 'old bytes', 'new bytes', 'old dumps', 'new dumps',
+        'old loads', 'new loads', 'speedup')
+    ref_load = ReferenceDecoder().load
+    for name, obj in make_payloads():
+        old_s = dump_unpacked(obj)
+        new_s = brine.dump(obj)
+        assert ref_load(old_s) == obj and brine.load(bytearray(new_s)) == obj
+        old_dump = time_func(dump_unpacked, obj)
+        new_dump = time_func(brine.dump, obj)
+        old = time_func(ref_load, old_s)
+        # ObjectStream passes its bytearray buffer to brine.load
+        new = time_func(brine.load, bytearray(new_s))
+        print '%-12s %9d %9d %10.0f %10.0f %10.0f %10.0f %7.1fx' % (
+            name, len(old_s), len(new_s), old_dump, new_dump, old, new,
+            new / old)
+
+def main():
+    bench_brine()
+    print
+    bench_recv()
+
+if __name__ == '__main__':
+    main()
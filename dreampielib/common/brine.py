@@ -39,15 +39,13 @@ optimized for small integers [-48..160), suitable for Python 2/3k communication.
 the following types are supported: int (in the unsigned long range), bool,
 unicode (In Py2) / str (In Py3), float, slice, complex, tuple(of simple types),
 list(of simple types), frozenset(of simple types)
-as well as the following singletons: None, NotImplemented, Ellipsis
+as well as the following singletons: None, NotImplemented, Ellipsis.
+lists of strings are packed into a single length table and UTF-8 blob.
 """
 import sys
 py3k = (sys.version_info[0] == 3)
-if not py3k:
-    from cStringIO import StringIO
-else:
-    from io import BytesIO
 from struct import Struct
+from codecs import utf_8_decode
 
 if not py3k:
     def b(n):
@@ -94,6 +92,11 @@ TAG_LIST1 = b(0x1d)
 TAG_LIST_L1 = b(0x1e)
 TAG_LIST_L4 = b(0x1f)
 
+# Packed list of strings: the number of strings, a table of their lengths
+# (1 or 4 bytes each), and then all of them as one UTF-8 blob.
+TAG_STR_LIST_L1 = b(0xf0)
+TAG_STR_LIST_L4 = b(0xf1)
+
 IMM_INTS = dict((i, b(i + 0x50)) for i in range(-0x30, 0xa0))
 
 I1 = Struct("!B")
@@ -102,8 +105,6 @@ F8 = Struct("!d")
 C16 = Struct("!dd")
 
 _dump_registry = {}
-_load_registry = {}
-IMM_INTS_LOADER = dict((v, k) for k, v in IMM_INTS.iteritems())
 
 def register(coll, key):
     def deco(func):
@@ -148,7 +149,7 @@ def _dump_int(obj, stream):
     if obj in IMM_INTS:
         stream.append(IMM_INTS[obj])
     else:
-        obj = str(obj)
+        obj = str(obj).encode('ascii')
         l = len(obj)
         if l < 256:
             stream.append(TAG_INT_L1 + I1.pack(l) + obj)
@@ -214,6 +215,28 @@ def _dump_tuple(obj, stream):
 
 @register(_dump_registry, list)
 def _dump_list(obj, stream):
+    if len(obj) > 1:
+        for item in obj:
+            if type(item) is not unicode:
+                break
+        else:
+            _dump_str_list(obj, stream)
+            return
+    _dump_list_items(obj, stream)
+
+def _dump_str_list(obj, stream):
+    encoded = [item.encode('utf8') for item in obj]
+    lengths = [len(item) for item in encoded]
+    n = len(lengths)
+    if max(lengths) < 256:
+        stream.append(TAG_STR_LIST_L1 + I4.pack(n)
+                      + Struct('!%dB' % n).pack(*lengths))
+    else:
+        stream.append(TAG_STR_LIST_L4 + I4.pack(n)
+                      + Struct('!%dL' % n).pack(*lengths))
+    stream.append(empty_bytes.join(encoded))
+
+def _dump_list_items(obj, stream):
     l = len(obj)
     if l == 0:
         stream.append(TAG_EMPTY_LIST)
@@ -235,124 +258,232 @@ def _dump(obj, stream):
 #===============================================================================
 # loading
 #===============================================================================
-@register(_load_registry, TAG_NONE)
-def _load_none(_stream):
-    return None
-@register(_load_registry, TAG_NOT_IMPLEMENTED)
-def _load_nonimp(_stream):
-    return NotImplemented
-@register(_load_registry, TAG_ELLIPSIS)
-def _load_elipsis(_stream):
-    return Ellipsis
-@register(_load_registry, TAG_TRUE)
-def _load_true(_stream):
-    return True
-@register(_load_registry, TAG_FALSE)
-def _load_false(_stream):
-    return False
-@register(_load_registry, TAG_EMPTY_TUPLE)
-def _load_empty_tuple(_stream):
-    return ()
-@register(_load_registry, TAG_EMPTY_LIST)
-def _load_empty_list(_stream):
-    return []
-@register(_load_registry, TAG_EMPTY_STR)
-def _load_empty_str(_stream):
-    return u""
-#@register(_load_registry, TAG_UNICODE)
-#def _load_unicode(stream):
-#    obj = _load(stream)
-#    return obj.decode("utf-8")
-#@register(_load_registry, TAG_LONG)
-#def _load_long(stream):
-#    obj = _load(stream)
-#    return long(obj)
-
-@register(_load_registry, TAG_FLOAT)
-def _load_float(stream):
-    return F8.unpack(stream.read(8))[0]
-@register(_load_registry, TAG_COMPLEX)
-def _load_complex(stream):
-    real, imag = C16.unpack(stream.read(16))
-    return complex(real, imag)
-
-@register(_load_registry, TAG_STR1)
-def _load_str1(stream):
-    return stream.read(1).decode('utf8')
-@register(_load_registry, TAG_STR2)
-def _load_str2(stream):
-    return stream.read(2).decode('utf8')
-@register(_load_registry, TAG_STR3)
-def _load_str3(stream):
-    return stream.read(3).decode('utf8')
-@register(_load_registry, TAG_STR4)
-def _load_str4(stream):
-    return stream.read(4).decode('utf8')
-@register(_load_registry, TAG_STR_L1)
-def _load_str_l1(stream):
-    l, = I1.unpack(stream.read(1))
-    return stream.read(l).decode('utf8')
-@register(_load_registry, TAG_STR_L4)
-def _load_str_l4(stream):
-    l, = I4.unpack(stream.read(4))
-    return stream.read(l).decode('utf8')
-
-@register(_load_registry, TAG_TUP1)
-def _load_tup1(stream):
-    return (_load(stream),)
-@register(_load_registry, TAG_TUP2)
-def _load_tup2(stream):
-    return (_load(stream), _load(stream))
-@register(_load_registry, TAG_TUP3)
-def _load_tup3(stream):
-    return (_load(stream), _load(stream), _load(stream))
-@register(_load_registry, TAG_TUP4)
-def _load_tup4(stream):
-    return (_load(stream), _load(stream), _load(stream), _load(stream))
-@register(_load_registry, TAG_TUP_L1)
-def _load_tup_l1(stream):
-    l, = I1.unpack(stream.read(1))
-    return tuple(_load(stream) for i in range(l))
-@register(_load_registry, TAG_TUP_L4)
-def _load_tup_l4(stream):
-    l, = I4.unpack(stream.read(4))
-    return tuple(_load(stream) for i in xrange(l))
-
-@register(_load_registry, TAG_LIST1)
-def _load_list1(stream):
-    return [_load(stream)]
-@register(_load_registry, TAG_LIST_L1)
-def _load_list_l1(stream):
-    l, = I1.unpack(stream.read(1))
-    return list(_load(stream) for i in range(l))
-@register(_load_registry, TAG_LIST_L4)
-def _load_list_l4(stream):
-    l, = I4.unpack(stream.read(4))
-    return list(_load(stream) for i in xrange(l))
-
-
-@register(_load_registry, TAG_SLICE)
-def _load_slice(stream):
-    start, stop, step = _load(stream)
-    return slice(start, stop, step)
-@register(_load_registry, TAG_FSET)
-def _load_frozenset(stream):
-    return frozenset(_load(stream))
-
-@register(_load_registry, TAG_INT_L1)
-def _load_int_l1(stream):
-    l, = I1.unpack(stream.read(1))
-    return int(stream.read(l))
-@register(_load_registry, TAG_INT_L4)
-def _load_int_l4(stream):
-    l, = I4.unpack(stream.read(4))
-    return int(stream.read(l))
-
-def _load(stream):
-    tag = stream.read(1)
-    if tag in IMM_INTS_LOADER:
-        return IMM_INTS_LOADER[tag]
-    return _load_registry.get(tag)(stream)
+# The loader doesn't call a function per tag. Instead, each tag is mapped to an
+# (opcode, argument) pair, and a single loop walks the data, keeping the
+# containers which are being built on an explicit stack.
+_OP_CONST = 0      # arg is the value
+_OP_STR = 1        # arg is the length, or _LEN_L1 / _LEN_L4
+_OP_INT = 2        # arg is _LEN_L1 / _LEN_L4
+_OP_FLOAT = 3
+_OP_COMPLEX = 4
+_OP_TUPLE = 5      # arg is the number of items, or _LEN_L1 / _LEN_L4
+_OP_LIST = 6       # same as _OP_TUPLE
+_OP_EMPTY_LIST = 7
+_OP_SLICE = 8      # followed by a tuple
+_OP_FSET = 9       # followed by a tuple
+_OP_STR_LIST = 10  # arg is the size of each length
+
+_LEN_L1 = -1
+_LEN_L4 = -4
+
+# Kinds of containers on the stack. _OP_TUPLE, _OP_LIST, _OP_SLICE and _OP_FSET
+# are used as the kinds of the containers they open.
+_KIND_TOP = None
+
+_load_table = {}
+# Maps a byte to its value. Indexing a str or a buffer in Python 2 gives a
+# one-char string, and indexing bytes, bytearray or memoryview gives an int.
+_byte_value = {}
+
+def _register_op(tag, op, arg=None):
+    n = ord(tag)
+    _load_table[n] = _load_table[chr(n)] = (op, arg)
+
+for _n in range(256):
+    _byte_value[_n] = _byte_value[chr(_n)] = _n
+
+for _tag, _value in [(TAG_NONE, None),
+                     (TAG_EMPTY_STR, u""),
+                     (TAG_EMPTY_TUPLE, ()),
+                     (TAG_TRUE, True),
+                     (TAG_FALSE, False),
+                     (TAG_NOT_IMPLEMENTED, NotImplemented),
+                     (TAG_ELLIPSIS, Ellipsis)]:
+    _register_op(_tag, _OP_CONST, _value)
+for _value, _tag in IMM_INTS.iteritems():
+    _register_op(_tag, _OP_CONST, _value)
+_register_op(TAG_STR1, _OP_STR, 1)
+_register_op(TAG_STR2, _OP_STR, 2)
+_register_op(TAG_STR3, _OP_STR, 3)
+_register_op(TAG_STR4, _OP_STR, 4)
+_register_op(TAG_STR_L1, _OP_STR, _LEN_L1)
+_register_op(TAG_STR_L4, _OP_STR, _LEN_L4)
+_register_op(TAG_TUP1, _OP_TUPLE, 1)
+_register_op(TAG_TUP2, _OP_TUPLE, 2)
+_register_op(TAG_TUP3, _OP_TUPLE, 3)
+_register_op(TAG_TUP4, _OP_TUPLE, 4)
+_register_op(TAG_TUP_L1, _OP_TUPLE, _LEN_L1)
+_register_op(TAG_TUP_L4, _OP_TUPLE, _LEN_L4)
+_register_op(TAG_INT_L1, _OP_INT, _LEN_L1)
+_register_op(TAG_INT_L4, _OP_INT, _LEN_L4)
+_register_op(TAG_FLOAT, _OP_FLOAT)
+_register_op(TAG_COMPLEX, _OP_COMPLEX)
+_register_op(TAG_SLICE, _OP_SLICE)
+_register_op(TAG_FSET, _OP_FSET)
+_register_op(TAG_EMPTY_LIST, _OP_EMPTY_LIST)
+_register_op(TAG_LIST1, _OP_LIST, 1)
+_register_op(TAG_LIST_L1, _OP_LIST, _LEN_L1)
+_register_op(TAG_LIST_L4, _OP_LIST, _LEN_L4)
+_register_op(TAG_STR_LIST_L1, _OP_STR_LIST, 1)
+_register_op(TAG_STR_LIST_L4, _OP_STR_LIST, 4)
+
+# Used by the fast path for runs of short strings: tag -> length, or _LEN_L1.
+_short_str_len = {}
+for _tag, _value in [(TAG_STR1, 1), (TAG_STR2, 2), (TAG_STR3, 3),
+                     (TAG_STR4, 4), (TAG_STR_L1, _LEN_L1)]:
+    _short_str_len[ord(_tag)] = _short_str_len[chr(ord(_tag))] = _value
+
+del _n, _tag, _value
+
+def _load_str_list(data, pos, len_size):
+    """
+    Load a packed list of strings from data, starting at pos (after the tag).
+    Return (list, new_pos).
+    """
+    n, = I4.unpack_from(data, pos)
+    pos += 4
+    if len_size == 1:
+        lengths = Struct('!%dB' % n).unpack_from(data, pos)
+    else:
+        lengths = Struct('!%dL' % n).unpack_from(data, pos)
+    pos += n * len_size
+    total = sum(lengths)
+    blob = utf_8_decode(data[pos:pos+total], 'strict', True)[0]
+    items = []
+    append = items.append
+    start = 0
+    if len(blob) == total:
+        # All ASCII, so byte offsets are also character offsets.
+        for l in lengths:
+            end = start + l
+            append(blob[start:end])
+            start = end
+    else:
+        start = pos
+        for l in lengths:
+            end = start + l
+            append(utf_8_decode(data[start:end], 'strict', True)[0])
+            start = end
+    return items, pos + total
+
+def _load(data, pos):
+    """
+    Load an object from data, which may be a string, a bytearray, a buffer or
+    a memoryview, starting at offset pos.
+    """
+    table = _load_table
+    byte_value = _byte_value
+    short_str_len = _short_str_len
+    decode = utf_8_decode
+    i4_unpack_from = I4.unpack_from
+
+    stack = []
+    kind = _KIND_TOP  # The kind of the innermost container being built
+    items = None      # Its items
+    remaining = 0     # The number of items it still needs
+
+    while True:
+        op, arg = table[data[pos]]
+        pos += 1
+
+        if op == _OP_CONST:
+            obj = arg
+
+        elif op == _OP_STR:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            elif arg == _LEN_L4:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            obj = decode(data[pos:pos+arg], 'strict', True)[0]
+            pos += arg
+            # Fast path: strings in a container are usually followed by
+            # more strings (think of the lists of names used for completion),
+            # so take them here without going through the main loop.
+            while remaining > 1:
+                l = short_str_len.get(data[pos])
+                if l is None:
+                    break
+                if l == _LEN_L1:
+                    l = byte_value[data[pos+1]]
+                    pos += 2
+                else:
+                    pos += 1
+                items.append(obj)
+                remaining -= 1
+                obj = decode(data[pos:pos+l], 'strict', True)[0]
+                pos += l
+
+        elif op == _OP_TUPLE or op == _OP_LIST:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            elif arg == _LEN_L4:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            if arg > 0:
+                stack.append((kind, items, remaining))
+                kind = op
+                items = []
+                remaining = arg
+                continue
+            obj = () if op == _OP_TUPLE else []
+
+        elif op == _OP_EMPTY_LIST:
+            obj = []
+
+        elif op == _OP_INT:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            else:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            obj = int(decode(data[pos:pos+arg], 'strict', True)[0])
+            pos += arg
+
+        elif op == _OP_FLOAT:
+            obj, = F8.unpack_from(data, pos)
+            pos += 8
+
+        elif op == _OP_COMPLEX:
+            real, imag = C16.unpack_from(data, pos)
+            obj = complex(real, imag)
+            pos += 16
+
+        elif op == _OP_STR_LIST:
+            obj, pos = _load_str_list(data, pos, arg)
+
+        elif op == _OP_SLICE or op == _OP_FSET:
+            stack.append((kind, items, remaining))
+            kind = op
+            items = []
+            remaining = 1
+            continue
+
+        else:
+            raise ValueError("unknown tag: %r" % (data[pos-1],))
+
+        # Add obj to the innermost container, and close all containers which
+        # are complete.
+        while True:
+            if kind is _KIND_TOP:
+                return obj
+            items.append(obj)
+            remaining -= 1
+            if remaining:
+                break
+            if kind == _OP_TUPLE:
+                obj = tuple(items)
+            elif kind == _OP_LIST:
+                obj = items
+            elif kind == _OP_SLICE:
+                start, stop, step = items[0]
+                obj = slice(start, stop, step)
+            else:
+                obj = frozenset(items[0])
+            kind, items, remaining = stack.pop()
 
 #===============================================================================
 # API
@@ -363,13 +494,13 @@ def dump(obj):
     _dump(obj, stream)
     return empty_bytes.join(stream)
 
-def load(data):
-    """loads the given byte-string representation to an object"""
-    if not py3k:
-        stream = StringIO(data)
-    else:
-        stream = BytesIO(data)
-    return _load(stream)
+def load(data, start=0):
+    """
+    loads the given byte-string representation to an object.
+    data may also be a bytearray, a buffer or a memoryview, in which case the
+    representation is read from offset start.
+    """
+    return _load(data, start)
 
 
 simple_types = frozenset([type(None), int, long, bool, str, float, unicode, 
@@ -0,0 +1,217 @@
+# This file was automatically generated from a file in the source DreamPie dir.
+# DO NOT EDIT IT, as your changes will be gone when the file is created again.
+
+# Copyright 2009 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+# 
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Send objects over a socket by brining them.
+Each object is sent as a frame: a 4-byte length followed by the brined data.
+If the COMPRESSED bit is set in the length, the data is compressed with zlib.
+"""
+
+__all__ = ['send_object', 'recv_object', 'ObjectStream', 'get_features']
+
+import sys
+py3k = (sys.version_info[0] == 3)
+import struct
+import socket
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+# This was "from . import brine", but a bug in 2to3 in Python 2.6.5
+# converted it to "from .. import brine", so I changed that.
+from ..common import brine
+
+if not py3k:
+    empty_bytes = ''
+else:
+    empty_bytes = bytes()
+
+try:
+    bytearray
+    memoryview
+except NameError:
+    # Python 2.5 and old Jython
+    has_buffers = False
+else:
+    has_buffers = hasattr(socket.socket, 'recv_into')
+
+HEADER = struct.Struct('<l')
+# This bit is set in the length of compressed frames.
+COMPRESSED = 0x40000000
+# zlib compression level. Frames are compressed on the fly, so we prefer speed.
+COMPRESS_LEVEL = 1
+
+# Initial size of the receive buffer. It grows as needed to hold a frame.
+RECV_BUFSIZE = 64 * 1024
+# If the buffer grew beyond this size, it is shrunk back when it is emptied.
+MAX_IDLE_BUFSIZE = 1024 * 1024
+
+def get_features():
+    """
+    Return the features of the connection supported by this side, as a tuple
+    of (name, value) pairs. This is sent when the subprocess connects, and the
+    other side replies with the options to use (see ObjectStream.set_options).
+    """
+    return ((u'zlib', zlib is not None),)
+
+def send_object(sock, obj, compress_threshold=None):
+    """
+    Send an object over a socket.
+    If compress_threshold is not None, brined data of at least that size is
+    compressed (unless compression doesn't make it smaller).
+    """
+    s = brine.dump(obj)
+    length = len(s)
+    if compress_threshold is not None and length >= compress_threshold:
+        c = zlib.compress(s, COMPRESS_LEVEL)
+        if len(c) < length:
+            s = c
+            length = len(c) | COMPRESSED
+    msg = HEADER.pack(length) + s
+    sock.sendall(msg)
+
+
+def recv_object(sock):
+    """Receive an object over a socket"""
+    length_str = empty_bytes
+    while len(length_str) < 4:
+        r = sock.recv(4 - len(length_str))
+        if not r:
+            raise IOError("Socket closed unexpectedly")
+        length_str += r
+    length, = struct.unpack('<i', length_str)
+    flags = length & COMPRESSED
+    length &= ~COMPRESSED
+    parts = []
+    len_received = 0
+    while len_received < length:
+        r = sock.recv(length - len_received)
+        if not r:
+            raise IOError("Socket closed unexpectedly")
+        parts.append(r)
+        len_received += len(r)
+    s = empty_bytes.join(parts)
+    if flags:
+        s = zlib.decompress(s)
+    obj = brine.load(s)
+    return obj
+
+class ObjectStream(object):
+    """
+    Send and receive objects over a socket.
+    Received data is read with recv_into into a growable bytearray, so several
+    queued frames may be read by a single recv, and objects are decoded from
+    the buffer without copying the frames around.
+    If the Python implementation doesn't support this, the plain recv_object
+    function is used.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        # Sent frames of at least this size are compressed. None means never.
+        self.compress_threshold = None
+        self._buf = bytearray(RECV_BUFSIZE) if has_buffers else None
+        # self._buf[self._start:self._end] is data received and not decoded.
+        self._start = 0
+        self._end = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def set_options(self, options):
+        """
+        Set the options agreed on when connecting, given as (name, value)
+        pairs. Unknown options are ignored.
+        """
+        for name, value in options:
+            if name == u'compress-threshold' and zlib is not None:
+                self.compress_threshold = value
+
+    def send_object(self, obj):
+        """Send an object over the socket"""
+        send_object(self.sock, obj, self.compress_threshold)
+
+    def _frame_len(self):
+        """
+        Return the length of the frame at the beginning of the buffered data,
+        including the header, or None if the header wasn't received yet.
+        """
+        if self._end - self._start < HEADER.size:
+            return None
+        length, = HEADER.unpack_from(self._buf, self._start)
+        return HEADER.size + (length & ~COMPRESSED)
+
+    def has_object(self):
+        """
+        Return True if a complete object was already received, so recv_object
+        will return it without reading from the socket.
+        """
+        if self._buf is None:
+            return False
+        frame_len = self._frame_len()
+        return frame_len is not None and self._end - self._start >= frame_len
+
+    def _fill(self, frame_len):
+        """
+        Receive data into the buffer, making room for frame_len bytes
+        (or for a header, if frame_len is None).
+        """
+        buf = self._buf
+        needed = frame_len if frame_len is not None else HEADER.size
+        if self._start + needed > len(buf) or self._end == len(buf):
+            # Move the pending data to the beginning of the buffer, and grow it
+            # if it's too small.
+            pending = self._end - self._start
+            if self._start:
+                buf[:pending] = buf[self._start:self._end]
+                self._start = 0
+                self._end = pending
+            if needed > len(buf):
+                size = len(buf)
+                while size < needed:
+                    size *= 2
+                buf.extend(bytearray(size - len(buf)))
+        n = self.sock.recv_into(memoryview(buf)[self._end:])
+        if not n:
+            raise IOError("Socket closed unexpectedly")
+        self._end += n
+
+    def recv_object(self):
+        """Receive an object over the socket"""
+        if self._buf is None:
+            return recv_object(self.sock)
+        while True:
+            frame_len = self._frame_len()
+            if frame_len is not None and self._end - self._start >= frame_len:
+                break
+            self._fill(frame_len)
+        flags, = HEADER.unpack_from(self._buf, self._start)
+        data_start = self._start + HEADER.size
+        self._start += frame_len
+        if flags & COMPRESSED:
+            data = bytes(self._buf[data_start:self._start])
+            obj = brine.load(zlib.decompress(data))
+        else:
+            obj = brine.load(self._buf, data_start)
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buf) > MAX_IDLE_BUFSIZE:
+                self._buf = bytearray(RECV_BUFSIZE)
+        return obj
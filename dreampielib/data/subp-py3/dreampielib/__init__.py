@@ -0,0 +1,5 @@
+# This file was automatically generated from a file in the source DreamPie dir.
+# DO NOT EDIT IT, as your changes will be gone when the file is created again.
+
+__version__ = "1.2.1"
+release_timestamp = 1350550458 # calendar.timegm((2012, 10, 18, 8, 54, 18))
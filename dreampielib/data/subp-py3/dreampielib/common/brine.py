@@ -0,0 +1,535 @@
+# This file was automatically generated from a file in the source DreamPie dir.
+# DO NOT EDIT IT, as your changes will be gone when the file is created again.
+
+# This file is based on brine.py from RPyC.
+# See http://rpyc.wikidot.com/
+# and http://sebulbasvn.googlecode.com/svn/tags/rpyc/3.0.6/core/brine.py
+# Modified by Noam Yorav-Raphael for DreamPie use.
+
+# Copyright (c) 2005-2009
+# Tomer Filiba (tomerfiliba@gmail.com)
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+# 
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+brine - a simple, fast and secure object serializer,
+optimized for small integers [-48..160), suitable for Python 2/3k communication.
+the following types are supported: int (in the unsigned long range), bool,
+unicode (In Py2) / str (In Py3), float, slice, complex, tuple(of simple types),
+list(of simple types), frozenset(of simple types)
+as well as the following singletons: None, NotImplemented, Ellipsis.
+lists of strings are packed into a single length table and UTF-8 blob.
+"""
+import sys
+py3k = (sys.version_info[0] == 3)
+from struct import Struct
+from codecs import utf_8_decode
+
+if not py3k:
+    def b(n):
+        return chr(n)
+    empty_bytes = ''
+else:
+    def b(n):
+        return bytes([n])
+    empty_bytes = bytes()
+
+# singletons
+TAG_NONE = b(0x00)
+TAG_EMPTY_STR = b(0x01)
+TAG_EMPTY_TUPLE = b(0x02)
+TAG_TRUE = b(0x03)
+TAG_FALSE = b(0x04)
+TAG_NOT_IMPLEMENTED = b(0x05)
+TAG_ELLIPSIS = b(0x06)
+# types
+#TAG_UNICODE = b(0x08) # Removed - STR is unicode.
+#TAG_LONG = b(0x09) # Removed
+TAG_STR1 = b(0x0a)
+TAG_STR2 = b(0x0b)
+TAG_STR3 = b(0x0c)
+TAG_STR4 = b(0x0d)
+TAG_STR_L1 = b(0x0e)
+TAG_STR_L4 = b(0x0f)
+TAG_TUP1 = b(0x10)
+TAG_TUP2 = b(0x11)
+TAG_TUP3 = b(0x12)
+TAG_TUP4 = b(0x13)
+TAG_TUP_L1 = b(0x14)
+TAG_TUP_L4 = b(0x15)
+TAG_INT_L1 = b(0x16)
+TAG_INT_L4 = b(0x17)
+TAG_FLOAT = b(0x18)
+TAG_SLICE = b(0x19)
+TAG_FSET = b(0x1a)
+TAG_COMPLEX = b(0x1b)
+
+# List
+TAG_EMPTY_LIST = b(0x1c)
+TAG_LIST1 = b(0x1d)
+TAG_LIST_L1 = b(0x1e)
+TAG_LIST_L4 = b(0x1f)
+
+# Packed list of strings: the number of strings, a table of their lengths
+# (1 or 4 bytes each), and then all of them as one UTF-8 blob.
+TAG_STR_LIST_L1 = b(0xf0)
+TAG_STR_LIST_L4 = b(0xf1)
+
+IMM_INTS = dict((i, b(i + 0x50)) for i in range(-0x30, 0xa0))
+
+I1 = Struct("!B")
+I4 = Struct("!L")
+F8 = Struct("!d")
+C16 = Struct("!dd")
+
+_dump_registry = {}
+
+def register(coll, key):
+    def deco(func):
+        coll[key] = func
+        return func
+    return deco
+
+#===============================================================================
+# dumping
+#===============================================================================
+@register(_dump_registry, type(None))
+def _dump_none(_obj, stream):
+    stream.append(TAG_NONE)
+
+@register(_dump_registry, type(NotImplemented))
+def _dump_notimplemeted(_obj, stream):
+    stream.append(TAG_NOT_IMPLEMENTED)
+
+@register(_dump_registry, type(Ellipsis))
+def _dump_ellipsis(_obj, stream):
+    stream.append(TAG_ELLIPSIS)
+
+@register(_dump_registry, bool)
+def _dump_bool(obj, stream):
+    if obj:
+        stream.append(TAG_TRUE)
+    else:
+        stream.append(TAG_FALSE)
+
+@register(_dump_registry, slice)
+def _dump_slice(obj, stream):
+    stream.append(TAG_SLICE)
+    _dump((obj.start, obj.stop, obj.step), stream)
+
+@register(_dump_registry, frozenset)
+def _dump_frozenset(obj, stream):
+    stream.append(TAG_FSET)
+    _dump(tuple(obj), stream)
+
+@register(_dump_registry, int)
+def _dump_int(obj, stream):
+    if obj in IMM_INTS:
+        stream.append(IMM_INTS[obj])
+    else:
+        obj = str(obj).encode('ascii')
+        l = len(obj)
+        if l < 256:
+            stream.append(TAG_INT_L1 + I1.pack(l) + obj)
+        else:
+            stream.append(TAG_INT_L4 + I4.pack(l) + obj)
+
+#@register(_dump_registry, long)
+#def _dump_long(obj, stream):
+#    stream.append(TAG_LONG)
+#    _dump_int(obj, stream)
+
+@register(_dump_registry, str)
+def _dump_str(obj, stream):
+    obj = obj.encode('utf8')
+    l = len(obj)
+    if l == 0:
+        stream.append(TAG_EMPTY_STR)
+    elif l == 1:
+        stream.append(TAG_STR1 + obj)
+    elif l == 2:
+        stream.append(TAG_STR2 + obj)
+    elif l == 3:
+        stream.append(TAG_STR3 + obj)
+    elif l == 4:
+        stream.append(TAG_STR4 + obj)
+    elif l < 256:
+        stream.append(TAG_STR_L1 + I1.pack(l) + obj)
+    else:
+        stream.append(TAG_STR_L4 + I4.pack(l) + obj)
+
+@register(_dump_registry, float)
+def _dump_float(obj, stream):
+    stream.append(TAG_FLOAT + F8.pack(obj))
+
+@register(_dump_registry, complex)
+def _dump_complex(obj, stream):
+    stream.append(TAG_COMPLEX + C16.pack(obj.real, obj.imag))
+
+#@register(_dump_registry, unicode)
+#def _dump_unicode(obj, stream):
+#    stream.append(TAG_UNICODE)
+#    _dump_str(obj.encode("utf8"), stream)
+
+@register(_dump_registry, tuple)
+def _dump_tuple(obj, stream):
+    l = len(obj)
+    if l == 0:
+        stream.append(TAG_EMPTY_TUPLE)
+    elif l == 1:
+        stream.append(TAG_TUP1)
+    elif l == 2:
+        stream.append(TAG_TUP2)
+    elif l == 3:
+        stream.append(TAG_TUP3)
+    elif l == 4:
+        stream.append(TAG_TUP4)
+    elif l < 256:
+        stream.append(TAG_TUP_L1 + I1.pack(l))
+    else:
+        stream.append(TAG_TUP_L4 + I4.pack(l))
+    for item in obj:
+        _dump(item, stream)
+
+@register(_dump_registry, list)
+def _dump_list(obj, stream):
+    if len(obj) > 1:
+        for item in obj:
+            if type(item) is not str:
+                break
+        else:
+            _dump_str_list(obj, stream)
+            return
+    _dump_list_items(obj, stream)
+
+def _dump_str_list(obj, stream):
+    encoded = [item.encode('utf8') for item in obj]
+    lengths = [len(item) for item in encoded]
+    n = len(lengths)
+    if max(lengths) < 256:
+        stream.append(TAG_STR_LIST_L1 + I4.pack(n)
+                      + Struct('!%dB' % n).pack(*lengths))
+    else:
+        stream.append(TAG_STR_LIST_L4 + I4.pack(n)
+                      + Struct('!%dL' % n).pack(*lengths))
+    stream.append(empty_bytes.join(encoded))
+
+def _dump_list_items(obj, stream):
+    l = len(obj)
+    if l == 0:
+        stream.append(TAG_EMPTY_LIST)
+    elif l == 1:
+        stream.append(TAG_LIST1)
+    elif l < 256:
+        stream.append(TAG_LIST_L1 + I1.pack(l))
+    else:
+        stream.append(TAG_LIST_L4 + I4.pack(l))
+    for item in obj:
+        _dump(item, stream)
+
+def _undumpable(obj, stream):
+    raise TypeError("cannot dump %r" % (obj,))
+
+def _dump(obj, stream):
+    _dump_registry.get(type(obj), _undumpable)(obj, stream)
+
+#===============================================================================
+# loading
+#===============================================================================
+# The loader doesn't call a function per tag. Instead, each tag is mapped to an
+# (opcode, argument) pair, and a single loop walks the data, keeping the
+# containers which are being built on an explicit stack.
+_OP_CONST = 0      # arg is the value
+_OP_STR = 1        # arg is the length, or _LEN_L1 / _LEN_L4
+_OP_INT = 2        # arg is _LEN_L1 / _LEN_L4
+_OP_FLOAT = 3
+_OP_COMPLEX = 4
+_OP_TUPLE = 5      # arg is the number of items, or _LEN_L1 / _LEN_L4
+_OP_LIST = 6       # same as _OP_TUPLE
+_OP_EMPTY_LIST = 7
+_OP_SLICE = 8      # followed by a tuple
+_OP_FSET = 9       # followed by a tuple
+_OP_STR_LIST = 10  # arg is the size of each length
+
+_LEN_L1 = -1
+_LEN_L4 = -4
+
+# Kinds of containers on the stack. _OP_TUPLE, _OP_LIST, _OP_SLICE and _OP_FSET
+# are used as the kinds of the containers they open.
+_KIND_TOP = None
+
+_load_table = {}
+# Maps a byte to its value. Indexing a str or a buffer in Python 2 gives a
+# one-char string, and indexing bytes, bytearray or memoryview gives an int.
+_byte_value = {}
+
+def _register_op(tag, op, arg=None):
+    n = ord(tag)
+    _load_table[n] = _load_table[chr(n)] = (op, arg)
+
+for _n in range(256):
+    _byte_value[_n] = _byte_value[chr(_n)] = _n
+
+for _tag, _value in [(TAG_NONE, None),
+                     (TAG_EMPTY_STR, ""),
+                     (TAG_EMPTY_TUPLE, ()),
+                     (TAG_TRUE, True),
+                     (TAG_FALSE, False),
+                     (TAG_NOT_IMPLEMENTED, NotImplemented),
+                     (TAG_ELLIPSIS, Ellipsis)]:
+    _register_op(_tag, _OP_CONST, _value)
+for _value, _tag in IMM_INTS.items():
+    _register_op(_tag, _OP_CONST, _value)
+_register_op(TAG_STR1, _OP_STR, 1)
+_register_op(TAG_STR2, _OP_STR, 2)
+_register_op(TAG_STR3, _OP_STR, 3)
+_register_op(TAG_STR4, _OP_STR, 4)
+_register_op(TAG_STR_L1, _OP_STR, _LEN_L1)
+_register_op(TAG_STR_L4, _OP_STR, _LEN_L4)
+_register_op(TAG_TUP1, _OP_TUPLE, 1)
+_register_op(TAG_TUP2, _OP_TUPLE, 2)
+_register_op(TAG_TUP3, _OP_TUPLE, 3)
+_register_op(TAG_TUP4, _OP_TUPLE, 4)
+_register_op(TAG_TUP_L1, _OP_TUPLE, _LEN_L1)
+_register_op(TAG_TUP_L4, _OP_TUPLE, _LEN_L4)
+_register_op(TAG_INT_L1, _OP_INT, _LEN_L1)
+_register_op(TAG_INT_L4, _OP_INT, _LEN_L4)
+_register_op(TAG_FLOAT, _OP_FLOAT)
+_register_op(TAG_COMPLEX, _OP_COMPLEX)
+_register_op(TAG_SLICE, _OP_SLICE)
+_register_op(TAG_FSET, _OP_FSET)
+_register_op(TAG_EMPTY_LIST, _OP_EMPTY_LIST)
+_register_op(TAG_LIST1, _OP_LIST, 1)
+_register_op(TAG_LIST_L1, _OP_LIST, _LEN_L1)
+_register_op(TAG_LIST_L4, _OP_LIST, _LEN_L4)
+_register_op(TAG_STR_LIST_L1, _OP_STR_LIST, 1)
+_register_op(TAG_STR_LIST_L4, _OP_STR_LIST, 4)
+
+# Used by the fast path for runs of short strings: tag -> length, or _LEN_L1.
+_short_str_len = {}
+for _tag, _value in [(TAG_STR1, 1), (TAG_STR2, 2), (TAG_STR3, 3),
+                     (TAG_STR4, 4), (TAG_STR_L1, _LEN_L1)]:
+    _short_str_len[ord(_tag)] = _short_str_len[chr(ord(_tag))] = _value
+
+del _n, _tag, _value
+
+def _load_str_list(data, pos, len_size):
+    """
+    Load a packed list of strings from data, starting at pos (after the tag).
+    Return (list, new_pos).
+    """
+    n, = I4.unpack_from(data, pos)
+    pos += 4
+    if len_size == 1:
+        lengths = Struct('!%dB' % n).unpack_from(data, pos)
+    else:
+        lengths = Struct('!%dL' % n).unpack_from(data, pos)
+    pos += n * len_size
+    total = sum(lengths)
+    blob = utf_8_decode(data[pos:pos+total], 'strict', True)[0]
+    items = []
+    append = items.append
+    start = 0
+    if len(blob) == total:
+        # All ASCII, so byte offsets are also character offsets.
+        for l in lengths:
+            end = start + l
+            append(blob[start:end])
+            start = end
+    else:
+        start = pos
+        for l in lengths:
+            end = start + l
+            append(utf_8_decode(data[start:end], 'strict', True)[0])
+            start = end
+    return items, pos + total
+
+def _load(data, pos):
+    """
+    Load an object from data, which may be a string, a bytearray, a buffer or
+    a memoryview, starting at offset pos.
+    """
+    table = _load_table
+    byte_value = _byte_value
+    short_str_len = _short_str_len
+    decode = utf_8_decode
+    i4_unpack_from = I4.unpack_from
+
+    stack = []
+    kind = _KIND_TOP  # The kind of the innermost container being built
+    items = None      # Its items
+    remaining = 0     # The number of items it still needs
+
+    while True:
+        op, arg = table[data[pos]]
+        pos += 1
+
+        if op == _OP_CONST:
+            obj = arg
+
+        elif op == _OP_STR:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            elif arg == _LEN_L4:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            obj = decode(data[pos:pos+arg], 'strict', True)[0]
+            pos += arg
+            # Fast path: strings in a container are usually followed by
+            # more strings (think of the lists of names used for completion),
+            # so take them here without going through the main loop.
+            while remaining > 1:
+                l = short_str_len.get(data[pos])
+                if l is None:
+                    break
+                if l == _LEN_L1:
+                    l = byte_value[data[pos+1]]
+                    pos += 2
+                else:
+                    pos += 1
+                items.append(obj)
+                remaining -= 1
+                obj = decode(data[pos:pos+l], 'strict', True)[0]
+                pos += l
+
+        elif op == _OP_TUPLE or op == _OP_LIST:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            elif arg == _LEN_L4:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            if arg > 0:
+                stack.append((kind, items, remaining))
+                kind = op
+                items = []
+                remaining = arg
+                continue
+            obj = () if op == _OP_TUPLE else []
+
+        elif op == _OP_EMPTY_LIST:
+            obj = []
+
+        elif op == _OP_INT:
+            if arg == _LEN_L1:
+                arg = byte_value[data[pos]]
+                pos += 1
+            else:
+                arg, = i4_unpack_from(data, pos)
+                pos += 4
+            obj = int(decode(data[pos:pos+arg], 'strict', True)[0])
+            pos += arg
+
+        elif op == _OP_FLOAT:
+            obj, = F8.unpack_from(data, pos)
+            pos += 8
+
+        elif op == _OP_COMPLEX:
+            real, imag = C16.unpack_from(data, pos)
+            obj = complex(real, imag)
+            pos += 16
+
+        elif op == _OP_STR_LIST:
+            obj, pos = _load_str_list(data, pos, arg)
+
+        elif op == _OP_SLICE or op == _OP_FSET:
+            stack.append((kind, items, remaining))
+            kind = op
+            items = []
+            remaining = 1
+            continue
+
+        else:
+            raise ValueError("unknown tag: %r" % (data[pos-1],))
+
+        # Add obj to the innermost container, and close all containers which
+        # are complete.
+        while True:
+            if kind is _KIND_TOP:
+                return obj
+            items.append(obj)
+            remaining -= 1
+            if remaining:
+                break
+            if kind == _OP_TUPLE:
+                obj = tuple(items)
+            elif kind == _OP_LIST:
+                obj = items
+            elif kind == _OP_SLICE:
+                start, stop, step = items[0]
+                obj = slice(start, stop, step)
+            else:
+                obj = frozenset(items[0])
+            kind, items, remaining = stack.pop()
+
+#===============================================================================
+# API
+#===============================================================================
+def dump(obj):
+    """dumps the given object to a byte-string representation"""
+    stream = []
+    _dump(obj, stream)
+    return empty_bytes.join(stream)
+
+def load(data, start=0):
+    """
+    loads the given byte-string representation to an object.
+    data may also be a bytearray, a buffer or a memoryview, in which case the
+    representation is read from offset start.
+    """
+    return _load(data, start)
+
+
+simple_types = frozenset([type(None), int, int, bool, str, float, str, 
+    slice, complex, type(NotImplemented), type(Ellipsis)])
+def dumpable(obj):
+    """indicates whether the object is dumpable by brine"""
+    if type(obj) in simple_types:
+        return True
+    if type(obj) in (tuple, list, frozenset):
+        return all(dumpable(item) for item in obj)
+    return False
+
+
+if __name__ == "__main__":
+    x = ("he", 7, "llo", 8, (), 900, None, True, Ellipsis, 18.2, 18.2j + 13, 
+        slice(1,2,3), frozenset([5,6,7]), [8,9,10], NotImplemented)
+    assert dumpable(x)
+    y = dump(x)
+    z = load(y)
+    assert x == z
+    
+
+
+
+
+
+
+
+
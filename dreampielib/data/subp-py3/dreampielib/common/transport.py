@@ -0,0 +1,182 @@
+# This file was automatically generated from a file in the source DreamPie dir.
+# DO NOT EDIT IT, as your changes will be gone when the file is created again.
+
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Create the socket used for communicating with the subprocess.
+
+The GUI creates a listener, and passes its address to the subprocess as a
+command line argument. The address is one of:
+    fd:N        - a connected socket inherited as file descriptor N
+                  (one end of a socketpair).
+    abstract:S  - an AF_UNIX socket named S in the abstract namespace (Linux).
+    tcp:N       - a TCP socket listening on localhost port N. A bare port
+                  number is also accepted, as this is what older versions
+                  passed.
+"""
+
+__all__ = ['connect', 'make_listener', 'default_transports', 'TRANSPORTS',
+           'set_cloexec']
+
+import sys
+import os
+import socket
+import random
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def set_cloexec(fd):
+    """
+    Make sure that the file descriptor isn't inherited by child processes.
+    """
+    if fcntl is None:
+        return
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+def connect(address):
+    """
+    Called by the subprocess. Return a socket connected to the GUI.
+    """
+    if ':' in address:
+        kind, arg = address.split(':', 1)
+    else:
+        kind, arg = 'tcp', address
+    if kind == 'fd':
+        fd = int(arg)
+        # fromfd duplicates the file descriptor
+        sock = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+        os.close(fd)
+    elif kind == 'abstract':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect('\0' + arg)
+    elif kind == 'tcp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect(('localhost', int(arg)))
+    else:
+        raise ValueError("Unknown address: %r" % address)
+    # Don't pass the socket to processes started by user code
+    set_cloexec(sock.fileno())
+    return sock
+
+class SocketPairListener(object):
+    """
+    Pass one end of a socketpair to the subprocess. The connection exists
+    before the subprocess starts, so there's nothing to wait for.
+    """
+    name = 'socketpair'
+
+    def __init__(self):
+        self._sock, self._child_sock = socket.socketpair()
+        set_cloexec(self._sock.fileno())
+        self.address = 'fd:%d' % self._child_sock.fileno()
+
+    def child_started(self):
+        """
+        Called after the subprocess was started, so it has inherited what
+        it needs.
+        """
+        self._child_sock.close()
+
+    def accept(self, timeout):
+        """
+        Return the socket connected to the subprocess, or None if the
+        subprocess didn't connect within timeout seconds.
+        """
+        return self._sock
+
+    def close(self):
+        """Release resources which are only needed while connecting."""
+        self._child_sock.close()
+
+class AbstractUnixListener(object):
+    """
+    Listen on an AF_UNIX socket in the Linux abstract namespace, which has no
+    file in the filesystem.
+    """
+    name = 'abstract'
+
+    def __init__(self):
+        name = 'dreampie-%d-%08x' % (os.getpid(), random.getrandbits(32))
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind('\0' + name)
+        self._sock.listen(1)
+        set_cloexec(self._sock.fileno())
+        self.address = 'abstract:%s' % name
+
+    def child_started(self):
+        pass
+
+    def accept(self, timeout):
+        self._sock.settimeout(timeout)
+        try:
+            sock, _addr = self._sock.accept()
+        except socket.timeout:
+            return None
+        sock.setblocking(True)
+        set_cloexec(sock.fileno())
+        return sock
+
+    def close(self):
+        self._sock.close()
+
+class TCPListener(AbstractUnixListener):
+    """
+    Listen on a TCP socket on localhost. This works everywhere.
+    """
+    name = 'tcp'
+
+    def __init__(self):
+        # Find a socket to listen to
+        ports = list(range(10000, 10100))
+        random.shuffle(ports)
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for port in ports:
+            try:
+                s.bind(('localhost', port))
+            except socket.error:
+                pass
+            else:
+                break
+        else:
+            raise IOError("Couldn't find a port to bind to")
+        # Now the socket is bound to port.
+        s.listen(1)
+        set_cloexec(s.fileno())
+        self._sock = s
+        self.address = 'tcp:%d' % port
+
+TRANSPORTS = dict((cls.name, cls) for cls in
+                  (SocketPairListener, AbstractUnixListener, TCPListener))
+
+def default_transports():
+    """
+    Return the names of the transports to try, by order of preference.
+    """
+    if (sys.platform != 'win32' and hasattr(socket, 'AF_UNIX')
+        and hasattr(socket, 'socketpair')):
+        return ['socketpair', 'tcp']
+    else:
+        return ['tcp']
+
+def make_listener(name):
+    """Create a listener for the transport with the given name."""
+    return TRANSPORTS[name]()
@@ -16,10 +16,11 @@
 # along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
 
 # This file is a script (not a module) run by the DreamPie GUI.
-# It expects one argument: the port to connect to.
+# It expects one argument: the address to connect to (see
+# dreampielib.common.transport).
 # It creates a package called dreampielib from subp-py2.zip or subp-py3.zip
 # (which are expected to be in the directory of __file__),
-# and runs dreampielib.subprocess.main(port).
+# and runs dreampielib.subprocess.main(address).
 
 # This is a hack to solve bug #527630. Python2.5 ignores the PYTHONIOENCODING
 # environment variable, but we want to set the output encoding to utf-8 so that
@@ -35,7 +36,7 @@ site.main()
 from os.path import abspath, join, dirname
 
 def main():
-    port = int(sys.argv[1])
+    address = sys.argv[1]
 
     py_ver = sys.version_info[0]
     lib_name = abspath(join(dirname(__file__), 'subp-py%d' % py_ver))
@@ -48,7 +49,7 @@ def main():
         sys.stderr.write("Warning: DreamPie doesn't support Python 3.0. \n"
                          "Please upgrade to Python 3.1.\n")
     
-    subprocess_main(port)
+    subprocess_main(address)
 
 if __name__ == '__main__':
     main()
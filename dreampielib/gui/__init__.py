@@ -90,7 +90,7 @@ from .. import __version__
 from .SimpleGladeApp import SimpleGladeApp
 from .keyhandler import (make_keyhandler_decorator, handle_keypress,
                          parse_keypress_event)
-from .config import Config
+from .config import Config, get_config_fn
 from .config_dialog import ConfigDialog
 from .write_command import write_command
 from .newline_and_indent import newline_and_indent
@@ -100,7 +100,11 @@ from .selection import Selection
 from .status_bar import StatusBar
 from .vadj_to_bottom import VAdjToBottom
 from .history import History
+from .command_index import CommandIndex
 from .hist_persist import HistPersist
+from .scrollback import Scrollback
+from .result_pages import ResultPages
+from .profile_summary import format_profile
 from .autocomplete import Autocomplete
 from .call_tips import CallTips
 from .autoparen import Autoparen
@@ -109,7 +113,8 @@ from .subprocess_handler import SubprocessHandler, StartError
 from .common import beep, get_text, TimeoutError
 from .file_dialogs import save_dialog
 from .tags import (OUTPUT, STDIN, STDOUT, STDERR, EXCEPTION, PROMPT, COMMAND,
-                   COMMAND_DEFS, COMMAND_SEP, MESSAGE, RESULT_IND, RESULT)
+                   COMMAND_DEFS, COMMAND_SEP, MESSAGE, RESULT_IND, RESULT,
+                   MORE_RESULT, PROFILE)
 from . import tags
 from .update_check import update_check
 from . import bug_report
@@ -194,8 +199,20 @@ class DreamPie(SimpleGladeApp):
         self.vadj_to_bottom = VAdjToBottom(self.scrolledwindow_textview
                                            .get_vadjustment())
 
+        if self.config.get_bool('remember-commands'):
+            commands_fn = get_config_fn() + '-commands'
+        else:
+            commands_fn = None
+        self.command_index = CommandIndex(commands_fn)
+        # Commands added before this are of previous sessions
+        self.session_command_seq = self.command_index.get_seq()
+
         self.history = History(self.textview, self.sourceview, self.sv_changed,
-                               self.config)
+                               self.config, self.command_index)
+
+        self.scrollback = Scrollback(self.textbuffer)
+
+        self.result_pages = ResultPages(self.textbuffer, self.get_result_page)
 
         self.recent_manager = gtk.recent_manager_get_default()
         self.menuitem_recent = [self.menuitem_recent0, self.menuitem_recent1,
@@ -204,7 +221,9 @@ class DreamPie(SimpleGladeApp):
         self.recent_manager.connect('changed', self.on_recent_manager_changed)
 
         self.histpersist = HistPersist(self.window_main, self.textview,
-                                       self.status_bar, self.recent_manager)
+                                       self.status_bar, self.recent_manager,
+                                       self.scrollback,
+                                       self.history.index_commands)
         self.update_recent()
         
         self.autocomplete = Autocomplete(self.sourceview,
@@ -217,6 +236,9 @@ class DreamPie(SimpleGladeApp):
                                          self.get_module_members,
                                          self.complete_filenames,
                                          self.complete_dict_keys,
+                                         self.get_completion_page,
+                                         self.cancel_subp_call,
+                                         self.config,
                                          INDENT_WIDTH)
         
         # Hack: we connect this signal here, so that it will have lower
@@ -227,10 +249,11 @@ class DreamPie(SimpleGladeApp):
         
         self.call_tips = CallTips(self.sourceview, self.sv_changed,
                                   self.window_main, self.get_func_doc,
-                                  INDENT_WIDTH)
+                                  self.cancel_subp_call, INDENT_WIDTH)
         
         self.autoparen = Autoparen(self.sourcebuffer, self.sv_changed,
                                    self.is_callable_only,
+                                   self.cancel_subp_call,
                                    self.get_expects_str,
                                    self.autoparen_show_call_tip,
                                    INDENT_WIDTH)
@@ -238,9 +261,7 @@ class DreamPie(SimpleGladeApp):
         self.subp = SubprocessHandler(
             pyexec, data_dir,
             self.on_stdout_recv, self.on_stderr_recv, self.on_object_recv,
-            self.on_subp_terminated)
-        # Number of RPC calls that timed out and expecting results
-        self._n_unclaimed_results = 0
+            self.on_subp_terminated, self.get_compress_threshold())
         try:
             self.subp.start()
         except StartError, e:
@@ -460,6 +481,8 @@ class DreamPie(SimpleGladeApp):
     
     def set_is_executing(self, is_executing):
         self.is_executing = is_executing
+        # The namespace may change while executing
+        self.autocomplete.clear_cache()
         label = _(u'Execute Code') if not is_executing else _(u'Write Input')
         self.menuitem_execute.child.props.label = label
         self.menuitem_discard_hist.props.sensitive = not is_executing
@@ -487,8 +510,7 @@ class DreamPie(SimpleGladeApp):
             # If we don't get a reply for pause_idle, we don't execute.
             self.call_subp_noblock(u'pause_idle')
         except TimeoutError:
-            self.subp.send_object((u'resume_idle', ()))
-            self._n_unclaimed_results += 1
+            self.subp.abandon(self.subp.send_call(u'resume_idle', ()))
 
             self.status_bar.set_status(_("The subprocess is currently busy"))
             beep()
@@ -514,6 +536,7 @@ class DreamPie(SimpleGladeApp):
         else:
             self.set_is_executing(True)
             write_command(self.write, source.strip())
+            self.command_index.add(source)
             self.output.start_new_section()
             if not self.config.get_bool('leave-code'):
                 sb.delete(sb.get_start_iter(), sb.get_end_iter())
@@ -527,6 +550,7 @@ class DreamPie(SimpleGladeApp):
             s += '\n'
 
         self.write_output(s, [COMMAND, STDIN], addbreaks=False)
+        self.command_index.add(s)
         self.write('\r', COMMAND_SEP)
         self.output.start_new_section()
         self.vadj_to_bottom.scroll_to_bottom()
@@ -737,8 +761,8 @@ class DreamPie(SimpleGladeApp):
         
         return self.autoparen.add_parens()
 
-    def is_callable_only(self, expr):
-        return self.call_subp_catch(u'is_callable_only', expr)
+    def is_callable_only(self, expr, callback):
+        return self.call_subp_async(callback, u'is_callable_only', expr)
     
     def get_expects_str(self):
         return set(self.config.get('expects-str-2').split())
@@ -767,9 +791,22 @@ class DreamPie(SimpleGladeApp):
         self.write(s, MESSAGE)
         self.output.start_new_section()
 
+    def get_compress_threshold(self):
+        """
+        Return the size above which objects sent to and from the subprocess
+        are compressed, or None if they shouldn't be compressed.
+        """
+        if self.config.get_bool('compress-rpc'):
+            return self.config.get_int('compress-rpc-threshold')
+        else:
+            return None
+
     def configure_subp(self):
         config = self.config
         
+        # This takes effect when the next subprocess is started
+        self.subp.compress_threshold = self.get_compress_threshold()
+        
         if config.get_bool('use-reshist'):
             reshist_size = config.get_int('reshist-size')
         else:
@@ -779,9 +816,15 @@ class DreamPie(SimpleGladeApp):
         
         self.call_subp(u'set_pprint', config.get_bool('pprint'))
         
+        self.call_subp(u'set_profile', config.get_bool('profile'))
+        
         self.call_subp(u'set_matplotlib_ia',
                        config.get_bool('matplotlib-ia-switch'),
                        config.get_bool('matplotlib-ia-warn'))
+
+        self.call_subp(u'index_modules', get_config_fn() + u'-modules')
+
+        self.call_subp(u'use_code_cache', get_config_fn() + u'-code')
         
     def run_init_code(self, runfile=None):
         """
@@ -794,11 +837,15 @@ class DreamPie(SimpleGladeApp):
         init_code = unicode(eval(self.config.get('init-code')))
         if runfile:
             msg = "Running %s" % runfile
-            # This should be both valid py3 and py2 code.
-            init_code += ('\n\nprint(%r)\nexec(open(%r).read())\n'
+            # This should be both valid py3 and py2 code. run_file runs the
+            # file like exec(open(runfile).read()), using the code cache.
+            init_code += ('\n\nprint(%r)\n'
+                          '__import__("dreampielib.subprocess.code_cache", '
+                          'fromlist=["run_file"]).run_file(%r, globals())\n'
                           % (msg, runfile))
         if init_code:
-            is_ok, syntax_error_info = self.call_subp(u'execute', init_code)
+            is_ok, syntax_error_info = self.call_subp(u'execute', init_code,
+                                                      True)
             if not is_ok:
                 msg, lineno, offset = syntax_error_info
                 warning = _(
@@ -820,14 +867,16 @@ class DreamPie(SimpleGladeApp):
             return
         # This may raise an exception if subprocess couldn't be started,
         # but hopefully if it was started once it will be started again.
-        self._n_unclaimed_results = 0
         self.subp.start()
         self.set_is_executing(False)
         self.write('\n')
         self.write(
             '==================== New Session ====================\n',
             MESSAGE)
+        self.result_pages.clear()
+        self.session_command_seq = self.command_index.get_seq()
         self.output.start_new_section()
+        self.trim_scrollback()
         self.configure_subp()
         self.run_init_code()
         self.vadj_to_bottom.scroll_to_bottom()
@@ -848,57 +897,45 @@ class DreamPie(SimpleGladeApp):
         """
         assert not self.is_executing
         
-        while self._n_unclaimed_results:
-            self.subp.recv_object()
-            
-        self.subp.send_object((funcname, args))
-        return self.subp.recv_object()
+        req_id = self.subp.send_call(funcname, args)
+        return self.subp.wait_for_reply(req_id)
 
     def call_subp_noblock(self, funcname, *args):
         """
         Make a non-blocking RPC call.
         Will wait for SUBP_WAIT_TIMEOUT_S and if no answer is received will
         raise a TimeoutError. The query will be executed when the subprocess
-        becomes responsive again, but will be discarded.
+        becomes responsive again, but its reply will be dropped.
         """
         assert not self.is_executing
         
-        while self._n_unclaimed_results:
-            returned = self.subp.wait_for_object(SUBP_WAIT_TIMEOUT_S)
-            if returned:
-                self.subp.recv_object()
-            else:
-                raise TimeoutError
-            
-        self.subp.send_object((funcname, args))
-        returned = self.subp.wait_for_object(SUBP_WAIT_TIMEOUT_S)
-        if returned:
-            return self.subp.recv_object()
-        else:
-            self._n_unclaimed_results += 1
-            raise TimeoutError
+        req_id = self.subp.send_call(funcname, args)
+        return self.subp.wait_for_reply(req_id, SUBP_WAIT_TIMEOUT_S)
 
-    def call_subp_catch(self, funcname, *args):
+    def call_subp_async(self, callback, funcname, *args):
         """
-        Make a non-blocking RPC call.
-        If executing, return None.
-        If a TimeoutError is raised, catch it and return None.
+        Make an RPC call without waiting for the answer. callback will be
+        called with the answer when it arrives.
+        Return the request id, which can be passed to cancel_subp_call.
+        If executing, call callback(None) at once and return None.
         """
         if self.is_executing:
+            callback(None)
             return None
-        try:
-            return self.call_subp_noblock(funcname, *args)
-        except TimeoutError:
-            return None
+        return self.subp.send_call(funcname, args, callback)
+
+    def cancel_subp_call(self, req_id):
+        """
+        Cancel a call made by call_subp_async, if its answer didn't arrive
+        yet. Its callback won't be called.
+        """
+        self.subp.cancel(req_id)
     
     def on_object_recv(self, obj):
-        if self._n_unclaimed_results:
-            self._n_unclaimed_results -= 1
-            return
-        
         assert self.is_executing
 
-        is_success, val_no, val_str, exception_string, rem_stdin = obj
+        (is_success, val_no, val_str, val_rest, exception_string,
+         rem_stdin, profile) = obj
 
         if not is_success:
             self.write_output(exception_string, EXCEPTION, onnewline=True)
@@ -909,9 +946,34 @@ class DreamPie(SimpleGladeApp):
                     self.write_output('%d:%s' % (val_no, sep), RESULT_IND,
                                       onnewline=True)
                 self.write_output(val_str+'\n', RESULT)
+                if val_rest is not None:
+                    self.write_output(
+                        self.result_pages.marker_text(val_no, val_rest),
+                        [RESULT_IND, MORE_RESULT])
+                    self.result_pages.add(val_no, val_rest)
+        if profile is not None:
+            self.write_profile(profile)
         self.write('>>> ', COMMAND, PROMPT)
         self.set_is_executing(False)
         self.handle_rem_stdin(rem_stdin)
+        self.trim_scrollback()
+
+    def write_profile(self, profile):
+        """
+        Write the profile summary of a command as a folded section, so only
+        its first line is visible until it's unfolded.
+        """
+        tb = self.textbuffer
+        text = format_profile(profile)
+        start_mark = tb.create_mark(None, tb.get_end_iter(), left_gravity=True)
+        self.write(text, PROFILE, RESULT_IND)
+        if text.count('\n') > 1:
+            self.folding.fold(PROFILE, tb.get_iter_at_mark(start_mark))
+        tb.delete_mark(start_mark)
+
+    def trim_scrollback(self):
+        if self.config.get_bool('limit-scrollback'):
+            self.scrollback.trim(self.config.get_int('scrollback-size'))
 
     def handle_rem_stdin(self, rem_stdin):
         """
@@ -1019,13 +1081,24 @@ class DreamPie(SimpleGladeApp):
         all history, and if tag == MESSAGE, this discards previous sessions.
         """
         tb = self.textbuffer
-        
         tag = tb.get_tag_table().lookup(tag)
-        it = tb.get_end_iter()
-        it.backward_to_tag_toggle(tag)
-        if not it.begins_tag(tag):
+        
+        def find_last():
+            it = tb.get_end_iter()
             it.backward_to_tag_toggle(tag)
-        tb.delete(tb.get_start_iter(), it)
+            if not it.begins_tag(tag):
+                it.backward_to_tag_toggle(tag)
+            return it
+        
+        it = find_last()
+        if it.compare(self.scrollback.get_live_start()) < 0:
+            # The last tag was archived (the placeholder is a MESSAGE too), so
+            # only archived parts are discarded.
+            self.scrollback.discard_previous_sessions()
+        else:
+            # The archived parts are older than what's discarded
+            self.scrollback.clear()
+            tb.delete(tb.get_start_iter(), find_last())
 
     def on_discard_history(self, _widget):
         xml = glade.XML(gladefile, 'discard_hist_dialog')
@@ -1043,10 +1116,18 @@ class DreamPie(SimpleGladeApp):
         
         if r == gtk.RESPONSE_OK:
             tb = self.textbuffer
+            # If commands are remembered, they can be recalled in later
+            # sessions anyway, so they are kept. Otherwise, the index holds
+            # only commands of the textbuffer, so it forgets those discarded.
+            forget_commands = self.command_index.filename is None
             if previous_rad.props.active:
                 self.discard_hist_before_tag(MESSAGE)
+                if forget_commands:
+                    self.command_index.discard_until(self.session_command_seq)
             else:
                 self.discard_hist_before_tag(COMMAND)
+                if forget_commands:
+                    self.command_index.clear()
                 tb.insert_with_tags_by_name(
                     tb.get_start_iter(),
                     '================= History Discarded =================\n',
@@ -1128,7 +1209,9 @@ class DreamPie(SimpleGladeApp):
     
     def on_double_click(self, event):
         """If we are on a folded section, unfold it and return True, to
-        avoid event propagation."""
+        avoid event propagation. The same goes for the scrollback placeholder,
+        which is expanded, and for the marker after a result which wasn't
+        shown whole, which shows more of it."""
         tv = self.textview
 
         if tv.get_window(gtk.TEXT_WINDOW_TEXT) is not event.window:
@@ -1137,6 +1220,13 @@ class DreamPie(SimpleGladeApp):
         x, y = tv.window_to_buffer_coords(gtk.TEXT_WINDOW_TEXT,
                                           int(event.x), int(event.y))
         it = tv.get_iter_at_location(x, y)
+        if self.scrollback.is_placeholder(it):
+            self.scrollback.expand()
+            return True
+        if self.result_pages.is_marker(it):
+            if self.is_executing or not self.result_pages.expand(it):
+                beep()
+            return True
         r = self.folding.get_section_status(it)
         if r is not None:
             typ, is_folded, start_it = r
@@ -1223,33 +1313,47 @@ class DreamPie(SimpleGladeApp):
     def on_show_completions(self, _widget):
         self.autocomplete.show_completions(is_auto=False, complete=False)
 
-    def complete_dict_keys(self, expr):
-        return self.call_subp_catch(u'complete_dict_keys', expr)
+    # The functions used by the editor features don't wait for the answer of
+    # the subprocess, so that typing is never blocked. See call_subp_async.
+
+    def complete_dict_keys(self, expr, may_eval, callback):
+        return self.call_subp_async(callback, u'complete_dict_keys', expr,
+                                    may_eval)
 
-    def complete_attributes(self, expr):
-        return self.call_subp_catch(u'complete_attributes', expr)
+    def complete_attributes(self, expr, may_eval, callback):
+        return self.call_subp_async(callback, u'complete_attributes', expr,
+                                    may_eval)
 
-    def complete_firstlevels(self):
-        return self.call_subp_catch(u'complete_firstlevels')
+    def complete_firstlevels(self, callback):
+        return self.call_subp_async(callback, u'complete_firstlevels')
     
-    def get_func_args(self, expr):
-        return self.call_subp_catch(u'get_func_args', expr)
+    def get_func_args(self, expr, callback):
+        return self.call_subp_async(callback, u'get_func_args', expr)
     
-    def find_modules(self, expr):
-        return self.call_subp_catch(u'find_modules', expr)
+    def find_modules(self, expr, callback):
+        return self.call_subp_async(callback, u'find_modules', expr)
     
-    def get_module_members(self, expr):
-        return self.call_subp_catch(u'get_module_members', expr)
+    def get_module_members(self, expr, callback):
+        return self.call_subp_async(callback, u'get_module_members', expr)
     
-    def complete_filenames(self, str_prefix, text, str_char, add_quote):
-        return self.call_subp_catch(u'complete_filenames', str_prefix, text, str_char,
-                                    add_quote)
+    def get_completion_page(self, handle, prefix, include_private,
+                            offset, count, callback):
+        return self.call_subp_async(callback, u'get_completion_page', handle,
+                                    prefix, include_private, offset, count)
+    
+    def get_result_page(self, res_no, callback):
+        return self.call_subp_async(callback, u'get_result_page', res_no)
+
+    def complete_filenames(self, str_prefix, text, str_char, add_quote,
+                           callback):
+        return self.call_subp_async(callback, u'complete_filenames',
+                                    str_prefix, text, str_char, add_quote)
 
     def on_show_calltip(self, _widget):
         self.call_tips.show(is_auto=False)
 
-    def get_func_doc(self, expr):
-        return self.call_subp_catch(u'get_func_doc', expr)
+    def get_func_doc(self, expr, may_eval, callback):
+        return self.call_subp_async(callback, u'get_func_doc', expr, may_eval)
 
     def configure(self):
         """
@@ -1444,6 +1548,8 @@ class DreamPie(SimpleGladeApp):
                 typ, is_folded, _start_it = r
                 if typ == OUTPUT:
                     typ_s = _('Output Section')
+                elif typ == PROFILE:
+                    typ_s = _('Profile Section')
                 else:
                     typ_s = _('Code Section')
                 self.fold_unfold_section_menu.props.visible = (
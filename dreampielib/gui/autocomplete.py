@@ -21,7 +21,8 @@ import string
 import re
 
 from .hyper_parser import HyperParser
-from .autocomplete_window import AutocompleteWindow, find_prefix_range
+from .autocomplete_window import AutocompleteWindow
+from .completion_set import CompletionSet, PagedCompletionSet
 from .common import beep, get_text
 
 # This string includes all chars that may be in an identifier
@@ -29,10 +30,24 @@ ID_CHARS = string.ascii_letters + string.digits + "_"
 ID_CHARS_DOT = ID_CHARS + '.'
 
 class Autocomplete(object):
+    """
+    Show the completion list.
+
+    The completions are asked from the subprocess without waiting for them:
+    complete_attributes and the other functions get a callback, which is
+    called with the answer, and return a request id which can be passed to
+    cancel_call. The list is shown when the answer arrives, if the user
+    didn't type anything which makes it irrelevant in the meantime. Asking
+    for completions again cancels the previous request.
+
+    Long lists of attributes and module members stay in the subprocess (see
+    PagedCompletionSet), and the first page of the matching ones is asked for
+    before the list is shown.
+    """
     def __init__(self, sourceview, sv_changed, window_main,
                  complete_attributes, complete_firstlevels, get_func_args,
                  find_modules, get_module_members, complete_filenames,
-                 complete_dict_keys,
+                 complete_dict_keys, get_completion_page, cancel_call, config,
                  INDENT_WIDTH):
         self.sourceview = sourceview
         sv_changed.append(self._on_sv_changed)
@@ -43,14 +58,82 @@ class Autocomplete(object):
         self.get_module_members = get_module_members
         self.complete_filenames = complete_filenames
         self.complete_dict_keys = complete_dict_keys
+        self.get_completion_page = get_completion_page
+        self.cancel_call = cancel_call
+        self.config = config
         self.INDENT_WIDTH = INDENT_WIDTH
 
         self.window = AutocompleteWindow(sourceview, sv_changed, window_main,
-                                         self._on_complete)
+                                         self._on_complete, cancel_call,
+                                         config)
+
+        # The last CompletionSet, and the key of the context it was fetched
+        # for. As long as the same expression is completed, more typed chars
+        # only narrow the set, so it is reused instead of asking the
+        # subprocess again.
+        self.last_key = None
+        self.last_set = None
+
+        # The id of the request whose answer we wait for, or None
+        self.pending_req = None
 
     def _on_sv_changed(self, new_sv):
         self.sourceview = new_sv
+
+    def clear_cache(self):
+        """
+        Forget the last completion set. Should be called when the namespace
+        of the subprocess may have changed.
+        """
+        self.cancel()
+        self.last_key = None
+        self.last_set = None
+
+    def cancel(self):
+        """Cancel the request for completions we wait for, if any."""
+        if self.pending_req is not None:
+            self.cancel_call(self.pending_req)
+            self.pending_req = None
+
+    def _get_completion_set(self, key, fetch, callback):
+        """
+        Call callback with a CompletionSet for the context identified by key.
+        If it's not the context of the last set, call fetch(on_reply), which
+        should make a request and return its id, and later call on_reply with
+        (public, private, is_case_insen), with a PagedCompletionSet, or with
+        None if it can't. In that case, callback will be called with None.
+        """
+        if key is not None and key == self.last_key:
+            callback(self.last_set)
+            return
+        def on_reply(r):
+            self.pending_req = None
+            if r is None:
+                callback(None)
+                return
+            if isinstance(r, PagedCompletionSet):
+                comp_set = r
+            else:
+                comp_set = CompletionSet(*r)
+            if key is not None:
+                self.last_key = key
+                self.last_set = comp_set
+            callback(comp_set)
+        self.pending_req = fetch(on_reply)
     
+    def _convert_lists(self, r):
+        """
+        Get the answer of complete_attributes or get_module_members, which is
+        either (public, private) or, if the lists are long,
+        (handle, n_public, n_private). Return what _get_completion_set expects.
+        """
+        if len(r) == 3:
+            handle, n_public, n_private = r
+            return PagedCompletionSet(handle, n_public, n_private,
+                                      self.get_completion_page)
+        public, private = r
+        return public, private, False
+
     def show_completions(self, is_auto, complete):
         """
         If complete is False, just show the completion list.
@@ -58,7 +141,11 @@ class Autocomplete(object):
         one completion, don't show the window.
 
         If is_auto is True, don't beep if can't find completions.
+
+        If the completions aren't known, they are asked for, and this is
+        done when they arrive.
         """
+        self.cancel()
         sb = self.sourceview.get_buffer()
         text = get_text(sb, sb.get_start_iter(), sb.get_end_iter())
         index = sb.get_iter_at_mark(sb.get_insert()).get_offset()
@@ -91,23 +178,57 @@ class Autocomplete(object):
             # Not in string and not in code
             res = None
 
-        if res is not None:
-            comp_prefix, public, private, is_case_insen = res
-        else:
+        if res is None:
             if not is_auto:
                 beep()
             return
+        comp_prefix, key, fetch = res
 
-        combined = public + private
-        if is_case_insen:
-            combined.sort(key = lambda s: s.lower())
-            combined_keys = [s.lower() for s in combined]
-        else:
-            combined.sort()
-            combined_keys = combined
-        comp_prefix_key = comp_prefix.lower() if is_case_insen else comp_prefix
-        start, end = find_prefix_range(combined_keys, comp_prefix_key)
+        def on_comp_set(comp_set):
+            self._show_comp_set(comp_set, text, index, comp_prefix,
+                                is_auto, complete)
+        self._get_completion_set(key, fetch, on_comp_set)
+
+    def _show_comp_set(self, comp_set, text, index, comp_prefix,
+                       is_auto, complete, page=None):
+        """
+        Show the completions, which were asked for when the sourcebuffer had
+        the given text and the cursor was at index.
+        If comp_set is paged, the first page is asked for, and then this is
+        called again with page=(prefix, answer of get_page).
+        """
+        if comp_set is None:
+            if not is_auto:
+                beep()
+            return
+
+        # The user may have typed since the completions were asked for. If
+        # only identifier chars were added, they extend the prefix.
+        sb = self.sourceview.get_buffer()
+        new_index = sb.get_iter_at_mark(sb.get_insert()).get_offset()
+        if new_index < index:
+            return
+        if get_text(sb, sb.get_start_iter(),
+                    sb.get_iter_at_offset(index)) != text[:index]:
+            return
+        added = get_text(sb, sb.get_iter_at_offset(index),
+                         sb.get_iter_at_offset(new_index))
+        if any(c not in ID_CHARS for c in added):
+            return
+        if comp_set.is_paged:
+            self._show_paged(comp_set, text, index, comp_prefix, added,
+                             is_auto, complete, page)
+            return
+        comp_prefix += added
+
+        combined, combined_keys, start, end = comp_set.prefix_range(
+            comp_prefix, True)
         if start == end:
+            if (comp_prefix and self.config.get_bool('fuzzy-complete')
+                and comp_set.fuzzy_match(comp_prefix)):
+                # Show the completions which contain the typed chars
+                self.window.show(comp_set, len(comp_prefix))
+                return
             # No completions
             if not is_auto:
                 beep()
@@ -128,12 +249,50 @@ class Autocomplete(object):
                 self._on_complete()
                 return
 
-        self.window.show(public, private, is_case_insen, len(comp_prefix))
+        self.window.show(comp_set, len(comp_prefix))
         
+    def _show_paged(self, comp_set, text, index, orig_prefix, added,
+                    is_auto, complete, page):
+        # The part of _show_comp_set for a PagedCompletionSet. added are the
+        # chars typed after index.
+        comp_prefix = orig_prefix + added
+        if page is None or page[0] != comp_prefix:
+            def on_page(answer):
+                self.pending_req = None
+                if answer is None:
+                    # The subprocess is busy, or no longer has the
+                    # completions
+                    self.last_key = self.last_set = None
+                    if not is_auto:
+                        beep()
+                    return
+                self._show_comp_set(comp_set, text, index, orig_prefix,
+                                    is_auto, complete, (comp_prefix, answer))
+            self.pending_req = comp_set.get_page(comp_prefix, None, 0,
+                                                 on_page)
+            return
+
+        include_private, n, common, _items = page[1]
+        if n == 0:
+            if not is_auto:
+                beep()
+            return
+        if complete:
+            # All the matching completions start with common, so the page
+            # is still right after completing it.
+            if len(common) > len(comp_prefix):
+                sb = self.sourceview.get_buffer()
+                sb.insert_at_cursor(common[len(comp_prefix):])
+                comp_prefix = common
+            if n == 1:
+                self._on_complete()
+                return
+        self.window.show(comp_set, len(comp_prefix), include_private,
+                         page[1])
+
     def _complete_dict_keys(self, text, index, hp, is_auto):
         """
-        Return (comp_prefix, public, private, is_case_insen) 
-        (string, list, list, bool).
+        Return (comp_prefix, key, fetch) (see _get_completion_set).
         If shouldn't complete - return None.
         """
         # Check whether auto-completion is really appropriate,
@@ -153,25 +312,26 @@ class Autocomplete(object):
                 return self._complete_attributes(text, index, hp, is_auto)
             else:
                 return self._complete_filenames(text, index, hp, is_auto)
-        if is_auto and '(' in comp_what:
-            # Don't evaluate expressions which may contain a function call.
-            return
-        key_reprs = self.complete_dict_keys(comp_what)
-        if key_reprs is None:
-            return
-        if text[index:index+1] != ']':
-            key_reprs = [x+']' for x in key_reprs]
+        # Unless asked to complete, the subprocess only finds the dict if
+        # it needn't run any code for that.
+        may_eval = not is_auto
+        add_bracket = text[index:index+1] != ']'
+        def fetch(callback):
+            def on_reply(key_reprs):
+                if key_reprs is None:
+                    callback(None)
+                    return
+                if add_bracket:
+                    key_reprs = [x+']' for x in key_reprs]
+                callback((key_reprs, [], False))
+            return self.complete_dict_keys(comp_what, may_eval, on_reply)
 
         comp_prefix = text[opener+1:index]
-        public = key_reprs
-        private = []
-        is_case_insen = False
-        return (comp_prefix, public, private, is_case_insen)
+        return comp_prefix, ('dict_keys', comp_what, add_bracket), fetch
 
     def _complete_attributes(self, text, index, hp, is_auto):
         """
-        Return (comp_prefix, public, private, is_case_insen) 
-        (string, list, list, bool).
+        Return (comp_prefix, key, fetch) (see _get_completion_set).
         If shouldn't complete - return None.
         """
         # Check whether autocompletion is really appropriate
@@ -187,21 +347,21 @@ class Autocomplete(object):
             comp_what = hp.get_expression()
             if not comp_what:
                 return
-            if is_auto and '(' in comp_what:
-                # Don't evaluate expressions which may contain a function call.
-                return
-            public_and_private = self.complete_attributes(comp_what)
-            if public_and_private is None: # The subprocess is busy
-                return
-            public, private = public_and_private
+            # Unless asked to complete, the subprocess only finds the object
+            # if it needn't run any code for that, and doesn't call __dir__.
+            may_eval = not is_auto
+            def fetch(callback):
+                def on_reply(r):
+                    if r is None: # The subprocess is busy
+                        callback(None)
+                        return
+                    callback(self._convert_lists(r))
+                return self.complete_attributes(comp_what, may_eval, on_reply)
+            key = ('attributes', comp_what, may_eval)
         else:
-            public_and_private = self.complete_firstlevels()
-            if public_and_private is None: # The subprocess is busy
-                return
-            public, private = public_and_private
-            
             # If we are inside a function call after a ',' or '(',
             # get argument names.
+            func_expr = None
             if text[:i].rstrip()[-1:] in (',', '('):
                 opener, _closer = hp.get_surrounding_brackets('(')
                 if opener:
@@ -209,13 +369,27 @@ class Autocomplete(object):
                     expr = hp.get_expression()
                     if expr and '(' not in expr:
                         # Don't need to execute a function just to get arguments
-                        args = self.get_func_args(expr)
+                        func_expr = expr
+            def fetch(callback):
+                def on_reply(public_and_private):
+                    if public_and_private is None: # The subprocess is busy
+                        callback(None)
+                        return
+                    public, private = public_and_private
+                    if func_expr is None:
+                        callback((public, private, False))
+                        return
+                    def on_args_reply(args):
                         if args is not None:
-                            public.extend(args)
-                            public.sort()
+                            callback((public + args, private, False))
+                        else:
+                            callback((public, private, False))
+                    self.pending_req = self.get_func_args(func_expr,
+                                                          on_args_reply)
+                return self.complete_firstlevels(on_reply)
+            key = ('firstlevels', func_expr)
         
-        is_case_insen = False
-        return comp_prefix, public, private, is_case_insen
+        return comp_prefix, key, fetch
 
     def _complete_import(self, line):
         """
@@ -225,17 +399,15 @@ class Autocomplete(object):
         while i and line[i-1] in ID_CHARS:
             i -= 1
         comp_prefix = line[i:]
-        public = ['import']
-        private = []
-        is_case_insen = False
-        return comp_prefix, public, private, is_case_insen
+        def fetch(callback):
+            callback((['import'], [], False))
+        return comp_prefix, None, fetch
         
     
     def _complete_modules(self, line, is_auto):
         """
         line - the stripped line from its beginning to the cursor.
-        Return (comp_prefix, public, private, is_case_insen) 
-        (string, list, list, bool).
+        Return (comp_prefix, key, fetch) (see _get_completion_set).
         If shouldn't complete - return None.
         """
         # Check whether autocompletion is really appropriate
@@ -255,20 +427,21 @@ class Autocomplete(object):
         else:
             comp_what = u''
         
-        modules = self.find_modules(comp_what)
-        if modules is None:
-            return None
-        
-        public = [s for s in modules if s[0] != '_']
-        private = [s for s in modules if s[0] == '_']
-        is_case_insen = False
-        return comp_prefix, public, private, is_case_insen
+        def fetch(callback):
+            def on_reply(modules):
+                if modules is None:
+                    callback(None)
+                    return
+                public = [s for s in modules if s[0] != '_']
+                private = [s for s in modules if s[0] == '_']
+                callback((public, private, False))
+            return self.find_modules(comp_what, on_reply)
+        return comp_prefix, ('modules', comp_what), fetch
         
     def _complete_module_members(self, line, is_auto):
         """
         line - the stripped line from its beginning to the cursor.
-        Return (comp_prefix, public, private, is_case_insen) 
-        (string, list, list, bool).
+        Return (comp_prefix, key, fetch) (see _get_completion_set).
         If shouldn't complete - return None.
         """
         # Check whether autocompletion is really appropriate
@@ -285,17 +458,18 @@ class Autocomplete(object):
             return
         comp_what = m.group(1)
         
-        public_and_private = self.get_module_members(comp_what)
-        if public_and_private is None:
-            return
-        public, private = public_and_private
-        is_case_insen = False
-        return comp_prefix, public, private, is_case_insen
+        def fetch(callback):
+            def on_reply(r):
+                if r is None:
+                    callback(None)
+                    return
+                callback(self._convert_lists(r))
+            return self.get_module_members(comp_what, on_reply)
+        return comp_prefix, ('module_members', comp_what), fetch
         
     def _complete_filenames(self, text, index, hp, is_auto):
         """
-        Return (comp_prefix, public, private, is_case_insen) 
-        (string, list, list, bool).
+        Return (comp_prefix, key, fetch) (see _get_completion_set).
         If shouldn't complete - return None.
         """
         # Check whether autocompletion is really appropriate
@@ -339,13 +513,12 @@ class Autocomplete(object):
         
         add_quote = not (len(text) > index and text[index] == str_char)
         
-        res = self.complete_filenames(
-            str_prefix, text[str_start:comp_prefix_index], str_char, add_quote)
-        if res is None:
-            return
-        public, private, is_case_insen = res
-        
-        return comp_prefix, public, private, is_case_insen
+        # Filenames aren't cached, since files may be created at any time.
+        def fetch(callback):
+            return self.complete_filenames(
+                str_prefix, text[str_start:comp_prefix_index], str_char,
+                add_quote, callback)
+        return comp_prefix, None, fetch
     
     def _on_complete(self):
         # Called when the user completed. This is relevant if he completed
@@ -17,12 +17,13 @@
 
 __all__ = ['AutocompleteWindow', 'find_prefix_range']
 
-import gobject
 import gtk
 from gtk import gdk
 
 from .keyhandler import make_keyhandler_decorator, handle_keypress
 from .common import beep, get_text
+from .completion_set import find_prefix_range
+from .completion_model import CompletionModel
 
 N_ROWS = 10
 
@@ -31,21 +32,24 @@ keyhandlers = {}
 keyhandler = make_keyhandler_decorator(keyhandlers)
 
 class AutocompleteWindow(object):
-    def __init__(self, sourceview, sv_changed, window_main, on_complete):
+    def __init__(self, sourceview, sv_changed, window_main, on_complete,
+                 cancel_call, config):
         self.sourceview = sourceview
         sv_changed.append(self.on_sv_changed)
         self.sourcebuffer = sb = sourceview.get_buffer()
         self.window_main = window_main
         self.on_complete = on_complete
+        self.cancel_call = cancel_call
+        self.config = config
         
-        self.liststore = gtk.ListStore(gobject.TYPE_STRING)        
+        self.model = CompletionModel()
         self.cellrend = gtk.CellRendererText()
         self.cellrend.props.ypad = 0
 
         self.col = gtk.TreeViewColumn("col", self.cellrend, text=0)
         self.col.props.sizing = gtk.TREE_VIEW_COLUMN_FIXED
 
-        self.treeview = gtk.TreeView(self.liststore)
+        self.treeview = gtk.TreeView(self.model)
         self.treeview.props.headers_visible = False
         self.treeview.append_column(self.col)
         self.treeview.props.fixed_height_mode = True
@@ -75,17 +79,27 @@ class AutocompleteWindow(object):
         self.keypress_handler_blocked = True
 
         self.is_shown = False
+        # The shown CompletionSet
+        self.comp_set = None
+        # The list of the completion set which is shown, and its keys
         self.cur_list = None
-        # cur_list_keys is cur_list if not is_case_insen, otherwise,
-        # lowercase strings.
         self.cur_list_keys = None
-        self.is_case_insen = None
-        self.private_list = None
         self.showing_private = None
         self.cur_prefix = None
         # Indices to self.cur_list - range which is displayed
         self.start = None
         self.end = None
+        # If no completion starts with the prefix, the list of fuzzy matches
+        # which is displayed instead.
+        self.fuzzy_matches = None
+        # If a PagedCompletionSet is shown: the prefix of the shown rows
+        # (which may differ from cur_prefix while a page is asked for), the
+        # number of completions starting with it and their common prefix,
+        # and the id of the request for a page, if we wait for one.
+        self.shown_prefix = None
+        self.n_matches = None
+        self.common_prefix = None
+        self.page_req = None
 
         # A list with (widget, handler) pairs, to be filled with self.connect()
         self.signals = []
@@ -114,11 +128,21 @@ class AutocompleteWindow(object):
             widget.disconnect(handler)
         self.signals[:] = []
 
-    def show(self, public, private, is_case_insen, start_len):
+    def show(self, comp_set, start_len, showing_private=False, page=None):
+        """
+        Show the completions which start with the start_len chars before
+        the cursor. If comp_set is paged, page should be the answer of its
+        get_page() for them. If it isn't given, it is asked for, and the
+        list is shown when it arrives.
+        """
         sb = self.sourcebuffer
 
         if self.is_shown:
             self.hide()
+        self._cancel_page()
+        if comp_set.is_paged and page is None:
+            self._show_when_loaded(comp_set, start_len, showing_private)
+            return
         self.is_shown = True
 
         it = sb.get_iter_at_mark(sb.get_insert())
@@ -126,21 +150,20 @@ class AutocompleteWindow(object):
         sb.move_mark(self.mark, it)
 
         # Update list and check if is empty
-        self.cur_list = public
-        self.is_case_insen = is_case_insen
-        if not is_case_insen:
-            self.cur_list_keys = self.cur_list
+        self.comp_set = comp_set
+        self.showing_private = showing_private
+        if comp_set.is_paged:
+            self.cur_list = self.cur_list_keys = None
         else:
-            self.cur_list_keys = [s.lower() for s in self.cur_list]
-        self.private_list = private
-        self.showing_private = False
+            self.cur_list, self.cur_list_keys = \
+                comp_set.get_lists(showing_private)
         self.cur_prefix = None
         
         if self.changed_after_hide_handler is not None:
             sb.disconnect(self.changed_after_hide_handler)
             self.changed_after_hide_handler = None
 
-        isnt_empty = self.update_list()
+        isnt_empty = self.update_list(page)
         if not isnt_empty:
             return
         
@@ -153,6 +176,8 @@ class AutocompleteWindow(object):
 
         self.connect(self.treeview, 'button-press-event',
                      self.on_tv_button_press)
+        self.connect(self.scrolledwindow.get_vadjustment(), 'value-changed',
+                     self.on_scroll)
         self.connect(self.sourceview, 'focus-out-event', self.on_focus_out)
         self.connect(self.window_main, 'configure-event', self.on_configure)
 
@@ -161,10 +186,85 @@ class AutocompleteWindow(object):
 
         self.window.show_all()
 
-    def update_list(self):
+    def _show_when_loaded(self, comp_set, start_len, showing_private):
+        # Ask for the first page of a PagedCompletionSet, and show the list
+        # when it arrives, if the prefix wasn't changed.
+        sb = self.sourcebuffer
+        def get_prefix():
+            insert = sb.get_iter_at_mark(sb.get_insert())
+            it = insert.copy()
+            it.backward_chars(start_len)
+            return insert.get_offset(), get_text(sb, it, insert)
+        orig = get_prefix()
+        def on_page(page):
+            self.page_req = None
+            if page is not None and get_prefix() == orig:
+                self.show(comp_set, start_len, showing_private, page)
+        include_private = True if showing_private else None
+        self.page_req = comp_set.get_page(orig[1], include_private, 0,
+                                          on_page)
+
+    def _ask_page(self, offset):
+        # Ask for a page of the completions starting with cur_prefix
+        self._cancel_page()
+        prefix = self.cur_prefix
+        def on_page(page):
+            self.page_req = None
+            self._on_page(prefix, offset, page)
+        include_private = True if self.showing_private else None
+        self.page_req = self.comp_set.get_page(prefix, include_private, offset,
+                                               on_page)
+
+    def _cancel_page(self):
+        if self.page_req is not None:
+            self.cancel_call(self.page_req)
+            self.page_req = None
+
+    def _on_page(self, prefix, offset, page):
+        # Show a page of a PagedCompletionSet
+        if not self.is_shown or prefix != self.cur_prefix:
+            return
+        if page is None:
+            self.hide()
+            return
+        include_private, n, common, items = page
+        if n == 0:
+            # If no completion starts with the prefix without its last char
+            # either, the list will be hidden again when the page arrives.
+            if prefix:
+                self._reopen_on_backspace(self.showing_private,
+                                          len(prefix)-1)
+            self.hide()
+            return
+        if offset == 0:
+            self.set_rows(items)
+        elif prefix == self.shown_prefix and offset == len(self.model):
+            self.model.append_rows(items)
+        else:
+            return
+        self.showing_private = include_private
+        self.shown_prefix = prefix
+        self.n_matches = n
+        self.common_prefix = common
+
+    def _reopen_on_backspace(self, showing_private, start_len):
+        # Re-open the list if the last char is removed
+        sb = self.sourcebuffer
+        text = get_text(sb, sb.get_start_iter(), sb.get_end_iter())
+        offset = sb.get_iter_at_mark(sb.get_insert()).get_offset()
+        expected_text = text[:offset-1] + text[offset:]
+        self.changed_after_hide_handler = \
+            sb.connect('changed', self.on_changed_after_hide,
+                       expected_text, self.comp_set,
+                       showing_private, start_len)
+
+    def update_list(self, page=None):
         # Update the ListStore.
         # Return True if something is shown.
         # Otherwise, calls hide(), and returns False.
+        # If a PagedCompletionSet is shown, page may be the answer of
+        # get_page for the prefix. Otherwise, a page is asked for, and until
+        # it arrives the shown rows are not changed.
         if not self.is_shown:
             # Could be a result of a callback after the list was alrady hidden.
             # See bug #529939.
@@ -175,54 +275,51 @@ class AutocompleteWindow(object):
         if prefix == self.cur_prefix:
             return True
         self.cur_prefix = prefix
-        prefix_key = prefix.lower() if self.is_case_insen else prefix
+        if self.comp_set.is_paged:
+            if page is not None:
+                self._on_page(prefix, 0, page)
+            else:
+                self._ask_page(0)
+            return self.is_shown
+        prefix_key = self.comp_set.key(prefix)
 
         start, end = find_prefix_range(self.cur_list_keys, prefix_key)
-        public_list = None
+        was_showing_private = self.showing_private
         if start == end and not self.showing_private:
             self.showing_private = True
-            public_list = self.cur_list[:]
-            self.cur_list.extend(self.private_list)
-            if self.is_case_insen:
-                self.cur_list.sort(key = lambda s: s.lower())
-                self.cur_list_keys = [s.lower() for s in self.cur_list]
-            else:
-                self.cur_list.sort()
-                self.cur_list_keys = self.cur_list
-            start, end = find_prefix_range(self.cur_list_keys, prefix_key)
+            self.cur_list, self.cur_list_keys, start, end = \
+                self.comp_set.prefix_range(prefix, True)
         self.start, self.end = start, end
-        if start == end:
+        self.fuzzy_matches = None
+        if (start == end and prefix
+            and self.config.get_bool('fuzzy-complete')):
+            self.fuzzy_matches = self.comp_set.fuzzy_match(prefix) or None
+        if start == end and self.fuzzy_matches is None:
             # We check to see if removing the last char (by pressing backspace)
             # should re-open the list.
             start2, end2 = find_prefix_range(self.cur_list_keys, prefix_key[:-1])
             if start2 != end2:
-                # Re-open the list if the last char is removed
-                if public_list is not None:
-                    # We were not showing private
-                    public = public_list
-                    private = self.private_list
-                else:
-                    # We were showing private - now everything is public
-                    public = self.cur_list
-                    private = []
-                if public is None or private is None:
-                    import pdb; pdb.set_trace()
-                text = get_text(sb, sb.get_start_iter(), sb.get_end_iter())
-                offset = sb.get_iter_at_mark(sb.get_insert()).get_offset()
-                expected_text = text[:offset-1] + text[offset:]
-                self.changed_after_hide_handler = \
-                    sb.connect('changed', self.on_changed_after_hide,
-                               expected_text, public, private,
-                               self.is_case_insen, len(prefix)-1)
+                self._reopen_on_backspace(was_showing_private, len(prefix)-1)
             self.hide()
             return False
 
-        self.liststore.clear()
-        for i in xrange(end-start):
-            self.liststore.insert(i, [self.cur_list[start+i]])
+        if self.fuzzy_matches is not None:
+            self.set_rows(self.fuzzy_matches)
+        else:
+            self.set_rows(self.cur_list, start, end)
+        return True
+
+    def set_rows(self, rows, start=0, end=None):
+        """
+        Show rows[start:end], and select the first. The model is detached
+        from the treeview while it is changed. The treeview then only reads
+        the text of the rows it draws.
+        """
+        self.treeview.set_model(None)
+        self.model.set_rows(rows, start, end)
+        self.treeview.set_model(self.model)
         self.treeview.get_selection().select_path(0)
         self.treeview.scroll_to_cell((0,))
-        return True
 
     def place_window(self):
         sv = self.sourceview
@@ -242,6 +339,15 @@ class AutocompleteWindow(object):
             self.window.hide()
         self.window.move(x, y-self.window_height)
 
+    def on_scroll(self, adj):
+        # Ask for more rows of a PagedCompletionSet when the last of the
+        # shown rows are near.
+        if (self.comp_set.is_paged and self.page_req is None
+            and self.shown_prefix == self.cur_prefix
+            and len(self.model) < self.n_matches
+            and adj.value + 2 * adj.page_size >= adj.upper):
+            self._ask_page(len(self.model))
+
     def on_mark_set(self, sb, it, mark):
         if mark is sb.get_insert():
             if it.compare(sb.get_iter_at_mark(self.mark)) < 0:
@@ -282,7 +388,7 @@ class AutocompleteWindow(object):
     @keyhandler('Down', 0)
     def on_down(self):
         index = self.treeview.get_selection().get_selected_rows()[1][0][0]
-        if index < len(self.liststore) - 1:
+        if index < len(self.model) - 1:
             self.select_row(index + 1)
         else:
             beep()
@@ -295,7 +401,7 @@ class AutocompleteWindow(object):
 
     @keyhandler('End', 0)
     def on_end(self):
-        self.select_row(len(self.liststore)-1)
+        self.select_row(len(self.model)-1)
         return True
 
     @keyhandler('Page_Up', 0)
@@ -318,7 +424,7 @@ class AutocompleteWindow(object):
         # page and then display the row.
         tv = self.treeview
         sel = tv.get_selection()
-        last_row = len(self.liststore) - 1
+        last_row = len(self.model) - 1
         r = tv.get_path_at_pos(0, tv.get_size_request()[1])
         if r is not None:
             row = r[0][0]
@@ -336,13 +442,20 @@ class AutocompleteWindow(object):
     def tab(self):
         """
         Complete the text to the common prefix, and if there's only one,
-        close the window.
+        close the window. If fuzzy matches are shown, complete the selected
+        one.
         """
-        if len(self.liststore) == 1:
+        if self.comp_set.is_paged and self.shown_prefix != self.cur_prefix:
+            # Wait for the rows of the typed prefix
+            return True
+        if len(self.model) == 1 or self.fuzzy_matches is not None:
             self.complete()
             return True
-        first = self.cur_list_keys[self.start]
-        last = self.cur_list_keys[self.end-1]
+        if self.comp_set.is_paged:
+            first = last = self.common_prefix
+        else:
+            first = self.cur_list_keys[self.start]
+            last = self.cur_list_keys[self.end-1]
         i = 0
         while i < len(first) and i < len(last) and first[i] == last[i]:
             i += 1
@@ -356,10 +469,21 @@ class AutocompleteWindow(object):
     @keyhandler('KP_Enter', 0)
     def complete(self):
         sel_row = self.treeview.get_selection().get_selected_rows()[1][0][0]
-        text = self.liststore[sel_row][0].decode('utf8')
-        insert = text[len(self.cur_prefix):]
+        text = self.model.get_text(sel_row)
+        sb = self.sourcebuffer
+        key = self.comp_set.key
+        if (self.fuzzy_matches is not None
+            or not key(text).startswith(key(self.cur_prefix))):
+            # Replace the typed chars, since they aren't a prefix of text.
+            # (The rows of a PagedCompletionSet may be of another prefix,
+            # if the page of the typed one didn't arrive yet.)
+            sb.delete(sb.get_iter_at_mark(self.mark),
+                      sb.get_iter_at_mark(sb.get_insert()))
+            insert = text
+        else:
+            insert = text[len(self.cur_prefix):]
         self.hide()
-        self.sourcebuffer.insert_at_cursor(insert)
+        sb.insert_at_cursor(insert)
         self.on_complete()
         return True
 
@@ -384,15 +508,21 @@ class AutocompleteWindow(object):
             self.keypress_handler_blocked = True
 
         self.window.hide()
+        self._cancel_page()
 
         self.is_shown = False
+        self.comp_set = None
         self.cur_list = None
-        self.private_list = None
+        self.cur_list_keys = None
         self.showing_private = None
         self.cur_prefix = None
+        self.fuzzy_matches = None
+        self.shown_prefix = None
+        self.n_matches = None
+        self.common_prefix = None
     
     def on_changed_after_hide(self, sb, expected_text,
-                              public, private, is_case_insen, start_len):
+                              comp_set, showing_private, start_len):
         """
         This is called on the first 'changed' signal after the completion list
         was hidden because a "wrong" character was typed. If it is deleted,
@@ -403,40 +533,10 @@ class AutocompleteWindow(object):
         self.changed_after_hide_handler = None
         
         if sb.get_text(sb.get_start_iter(), sb.get_end_iter()) == expected_text:
-            self.show(public, private, is_case_insen, start_len)
+            self.show(comp_set, start_len, showing_private)
         
         
 
-        
-def find_prefix_range(L, prefix):
-    # Find the range in the list L which begins with prefix, using binary
-    # search.
-
-    # start.
-    l = 0
-    r = len(L)
-    while r > l:
-        m = (l + r) // 2
-        if L[m] == prefix:
-            l = r = m
-        elif L[m] < prefix:
-            l = m + 1
-        else:
-            r = m
-    start = l
-
-    # end
-    l = 0
-    r = len(L)
-    while r > l:
-        m = (l + r) // 2
-        if L[m][:len(prefix)] > prefix:
-            r = m
-        else:
-            l = m + 1
-    end = l
-
-    return start, end
 
 
 class BackspaceUndo(object):
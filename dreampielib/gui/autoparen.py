@@ -44,13 +44,19 @@ prefixes = set(s[:i] for s in undo_strings for i in range(1, len(s)))
 class Autoparen(object):
     """
     Add parentheses if a space was pressed after a callable-only object.
+
+    is_callable_only(expr, callback) asks the subprocess without waiting, and
+    returns a request id which can be passed to cancel_call. So the space is
+    inserted, and replaced by parentheses when the answer arrives, if nothing
+    else was typed in the meantime.
     """
 
-    def __init__(self, sourcebuffer, sv_changed, is_callable_only, get_expects_str,
-                 show_call_tip, INDENT_WIDTH):
+    def __init__(self, sourcebuffer, sv_changed, is_callable_only, cancel_call,
+                 get_expects_str, show_call_tip, INDENT_WIDTH):
         self.sourcebuffer = sb = sourcebuffer
         sv_changed.append(self.on_sv_changed)
         self.is_callable_only = is_callable_only
+        self.cancel_call = cancel_call
         self.get_expects_str = get_expects_str
         self.show_call_tip = show_call_tip
         self.INDENT_WIDTH = INDENT_WIDTH
@@ -69,6 +75,9 @@ class Autoparen(object):
         self.insert_handler = None
         self.delete_handler = None
 
+        # The id of the request whose answer we wait for, or None
+        self.pending_req = None
+
     def on_sv_changed(self, new_sv):
         self.sourcebuffer.delete_mark(self.mark)
         self.disconnect()
@@ -80,9 +89,13 @@ class Autoparen(object):
         This is called if the user pressed space on the sourceview, and
         the subprocess is not executing commands (so is_callable_only can work.)
         Should return True if event-handling should stop, or False if it should
-        continue as usual.
+        continue as usual. Since the parentheses are only added when the
+        subprocess answers, this always returns False.
         """
         sb = self.sourcebuffer
+        if self.pending_req is not None:
+            self.cancel_call(self.pending_req)
+            self.pending_req = None
         
         # Quickly discard some cases
         insert = sb.get_iter_at_mark(sb.get_insert())
@@ -119,21 +132,43 @@ class Autoparen(object):
         expr = hp.get_expression()
         if not expr:
             return False
-        if '(' in expr:
-            # Don't evaluate expressions which may contain a function call.
-            return False
+        # The subprocess finds the object without running code, so expr may
+        # also include calls.
         
-        r = self.is_callable_only(expr)
+        def on_reply(r):
+            self.pending_req = None
+            self._on_callable_only(r, expr, text, index)
+        self.pending_req = self.is_callable_only(expr, on_reply)
+        return False
+
+    def _on_callable_only(self, r, expr, text, index):
+        """
+        Called with the answer of is_callable_only, which was asked for when
+        the sourcebuffer had the given text and the cursor was at index,
+        before the space was inserted.
+        """
         if r is None:
-            return False
+            return
         is_callable_only, expects_str = r
         if not is_callable_only:
-            return False
-        
+            return
+
+        # Add the parens only if nothing but the space was typed since
+        sb = self.sourcebuffer
+        insert = sb.get_iter_at_mark(sb.get_insert())
+        if (insert.get_offset() != index + 1
+            or get_text(sb, sb.get_start_iter(), sb.get_end_iter())
+               != text[:index] + ' ' + text[index:]):
+            return
+
+        sb.begin_user_action()
+        it = insert.copy()
+        it.backward_char()
+        sb.delete(it, insert)
+        insert = it
         sb.move_mark(self.mark, insert)
         
         last_name = expr.rsplit('.', 1)[-1]
-        sb.begin_user_action()
         if expects_str or last_name in self.get_expects_str():
             sb.insert(insert, '("")')
             insert.backward_chars(2)
@@ -150,8 +185,6 @@ class Autoparen(object):
             self.delete_handler = sb.connect('delete-range', self.on_delete_range)
 
         self.show_call_tip()
-        
-        return True
     
     def disconnect(self):
         if self.insert_handler:
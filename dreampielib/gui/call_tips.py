@@ -29,13 +29,22 @@ from .call_tip_window import CallTipWindow
 from .common import beep, get_text
 
 class CallTips(object):
+    """
+    Show the arguments and the documentation of the called function.
+
+    get_func_doc(expr, may_eval, callback) asks the subprocess for them
+    without waiting, and returns a request id which can be passed to
+    cancel_call. The call tip is shown when the answer arrives, if the cursor
+    is still in the same call.
+    """
     def __init__(self, sourceview, sv_changed, window_main, get_func_doc,
-                 INDENT_WIDTH):
+                 cancel_call, INDENT_WIDTH):
         self.sourceview = sourceview
         self.sourcebuffer = sb = sourceview.get_buffer()
         sv_changed.append(self.on_sv_changed)
         self.window_main = window_main
         self.get_func_doc = get_func_doc
+        self.cancel_call = cancel_call
         self.INDENT_WIDTH = INDENT_WIDTH
 
         self.ctwindow = CallTipWindow(sourceview, sv_changed)
@@ -47,6 +56,9 @@ class CallTips(object):
 
         self.is_shown = False
 
+        # The id of the request whose answer we wait for, or None
+        self.pending_req = None
+
         # A list with (widget, handler) pairs, to be filled with self.connect()
         self.signals = []
 
@@ -72,32 +84,62 @@ class CallTips(object):
             widget.disconnect(handler)
         self.signals[:] = []
 
-    def show(self, is_auto):
+    def _find_call(self):
+        """
+        Return (opener, closer, expr) for the call surrounding the cursor:
+        the offsets of its brackets and the called expression. Return None
+        if there's no call which should be shown.
+        """
         sb = self.sourcebuffer
         text = get_text(sb, sb.get_start_iter(), sb.get_end_iter())
         index = sb.get_iter_at_mark(sb.get_insert()).get_offset()
         hp = HyperParser(text, index, self.INDENT_WIDTH)
 
-        # This is used to write "return and_maybe_beep()".
-        def and_maybe_beep():
-            if not is_auto:
-                beep()
-            return None
-
         opener, closer = hp.get_surrounding_brackets('(')
         if not opener:
-            return and_maybe_beep()
+            return None
         if not closer:
             closer = len(text)
         hp.set_index(opener)
         expr = hp.get_expression()
-        if not expr or (is_auto and expr.find('(') != -1):
-            return and_maybe_beep()
-        arg_text = self.get_func_doc(expr)
+        if not expr:
+            return None
+        return opener, closer, expr
+
+    def show(self, is_auto):
+        if self.pending_req is not None:
+            self.cancel_call(self.pending_req)
+            self.pending_req = None
+
+        call = self._find_call()
+        if call is None:
+            if not is_auto:
+                beep()
+            return
+        _opener, _closer, expr = call
 
+        def on_reply(arg_text):
+            self.pending_req = None
+            self._on_func_doc(arg_text, call, is_auto)
+        # Unless asked to show the call tip, the subprocess only finds the
+        # function if it needn't run any code for that.
+        self.pending_req = self.get_func_doc(expr, not is_auto, on_reply)
+
+    def _on_func_doc(self, arg_text, call, is_auto):
         if not arg_text:
-            return and_maybe_beep()
+            if not is_auto:
+                beep()
+            return
 
+        # The user may have typed since the doc was asked for
+        new_call = self._find_call()
+        if new_call is None:
+            return
+        opener, closer, expr = new_call
+        if opener != call[0] or expr != call[2]:
+            return
+
+        sb = self.sourcebuffer
         sb.move_mark(self.start_mark, sb.get_iter_at_offset(opener+1))
         sb.move_mark(self.end_mark, sb.get_iter_at_offset(closer))
 
@@ -0,0 +1,154 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['CommandIndex']
+
+from bisect import bisect_left, insort
+
+# When the commands file is rewritten, only this number of the most recent
+# commands are kept.
+MAX_SAVED_COMMANDS = 10000
+
+def _first_line(cmd):
+    return cmd.split('\n', 1)[0].strip()
+
+class CommandIndex(object):
+    """
+    Index the executed commands by their first line, so that the commands
+    starting with a prefix can be found without going over the textbuffer.
+
+    Each distinct command is stored once, with a sequence number telling when
+    it was last executed. (first_line, command) pairs are kept in a sorted
+    list, so the commands matching a prefix are found with bisect.
+
+    If filename is given, the commands are loaded from it, and executed
+    commands are appended to it. Each line of the file is a command, encoded
+    with the unicode_escape codec.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        # A sorted list of (first_line, command)
+        self._keys = []
+        # Map a command to its sequence number
+        self._seqs = {}
+        self._last_seq = 0
+        # Commands loaded from saved history files get sequence numbers below
+        # all others.
+        self._first_seq = 0
+        if filename is not None:
+            self._load()
+
+    def _add(self, cmd, seq):
+        if cmd not in self._seqs:
+            insort(self._keys, (_first_line(cmd), cmd))
+        self._seqs[cmd] = seq
+
+    def _load(self):
+        try:
+            f = open(self.filename, 'rb')
+            lines = f.read().splitlines()
+            f.close()
+        except IOError:
+            return
+        for line in lines:
+            try:
+                cmd = line.decode('unicode_escape')
+            except UnicodeDecodeError:
+                continue
+            if cmd:
+                self._last_seq += 1
+                self._add(cmd, self._last_seq)
+        if (len(lines) > 2 * len(self._seqs)
+            or len(self._seqs) > MAX_SAVED_COMMANDS):
+            self._save()
+
+    def _save(self):
+        if self.filename is None:
+            return
+        seqs = self._seqs
+        cmds = sorted(seqs, key=seqs.__getitem__)[-MAX_SAVED_COMMANDS:]
+        try:
+            f = open(self.filename, 'wb')
+            for cmd in cmds:
+                f.write(cmd.encode('unicode_escape') + '\n')
+            f.close()
+        except IOError:
+            pass
+
+    def add(self, cmd):
+        """
+        Add an executed command, making it the most recent one.
+        """
+        cmd = cmd.strip()
+        if not cmd:
+            return
+        self._last_seq += 1
+        self._add(cmd, self._last_seq)
+        if self.filename is not None:
+            try:
+                f = open(self.filename, 'ab')
+                f.write(cmd.encode('unicode_escape') + '\n')
+                f.close()
+            except IOError:
+                pass
+
+    def add_loaded(self, cmds):
+        """
+        Add commands from a loaded history file, given oldest first. They are
+        considered older than all known commands, and are not saved.
+        """
+        for cmd in reversed(cmds):
+            cmd = cmd.strip()
+            if cmd and cmd not in self._seqs:
+                self._first_seq -= 1
+                self._add(cmd, self._first_seq)
+
+    def get_seq(self):
+        """
+        Return the sequence number of the last added command. This can later
+        be passed to discard_until.
+        """
+        return self._last_seq
+
+    def discard_until(self, seq):
+        """
+        Forget the commands which were not executed after the sequence number
+        seq. The commands file isn't changed.
+        """
+        seqs = self._seqs
+        self._keys = [key for key in self._keys if seqs[key[1]] > seq]
+        self._seqs = dict((cmd, s) for cmd, s in seqs.iteritems() if s > seq)
+
+    def clear(self):
+        """Forget all commands. The commands file isn't changed."""
+        self.discard_until(self._last_seq)
+
+    def search(self, prefix, min_len=0):
+        """
+        Return the commands whose first line starts with prefix and is longer
+        than min_len chars, most recently executed first.
+        """
+        keys = self._keys
+        r = []
+        i = bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            first_line, cmd = keys[i]
+            if len(first_line) > min_len:
+                r.append(cmd)
+            i += 1
+        r.sort(key=self._seqs.__getitem__, reverse=True)
+        return r
@@ -0,0 +1,127 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['CompletionModel']
+
+import gobject
+import gtk
+
+class CompletionModel(gtk.GenericTreeModel):
+    """
+    A list model with one string column, which shows the range [start, end)
+    of a list of completions without copying it. Changing the range takes
+    the same time however many rows it has, since a row is only looked at
+    when it is drawn.
+
+    The model should be detached from the treeview while set_rows() is
+    called, since no signals are emitted for the changed rows.
+    """
+    def __init__(self):
+        gtk.GenericTreeModel.__init__(self)
+        # The row references are the row numbers. We keep them in
+        # self._refs, so we don't need pygtk to keep them for us.
+        self.props.leak_references = False
+        self._refs = []
+        self._rows = []
+        self._start = 0
+        self._end = 0
+
+    def set_rows(self, rows, start=0, end=None):
+        """
+        Show rows[start:end]. The list isn't copied, so it shouldn't be
+        changed afterwards, except by append_rows().
+        """
+        self._rows = rows
+        self._start = start
+        self._end = len(rows) if end is None else end
+        self._get_ref(self._end - self._start)
+
+    def append_rows(self, items):
+        """
+        Add rows at the end. This should be called when only the whole list
+        is shown.
+        """
+        assert self._start == 0 and self._end == len(self._rows)
+        n = self._end
+        self._rows.extend(items)
+        self._end = len(self._rows)
+        self._get_ref(self._end)
+        for i in xrange(n, self._end):
+            self.row_inserted((i,), self.get_iter((i,)))
+
+    def get_text(self, i):
+        """Return the completion shown in row i."""
+        return self._rows[self._start + i]
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _get_ref(self, i):
+        refs = self._refs
+        if i >= len(refs):
+            refs.extend(xrange(len(refs), max(2 * len(refs), i + 1)))
+        return refs[i]
+
+    # The GenericTreeModel interface
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+    def on_get_n_columns(self):
+        return 1
+
+    def on_get_column_type(self, _index):
+        return gobject.TYPE_STRING
+
+    def on_get_iter(self, path):
+        i = path[0]
+        if i < len(self):
+            return self._get_ref(i)
+        return None
+
+    def on_get_path(self, rowref):
+        return (rowref,)
+
+    def on_get_value(self, rowref, _column):
+        return self._rows[self._start + rowref]
+
+    def on_iter_next(self, rowref):
+        i = rowref + 1
+        if i < len(self):
+            return self._get_ref(i)
+        return None
+
+    def on_iter_children(self, parent):
+        if parent is None and len(self):
+            return self._get_ref(0)
+        return None
+
+    def on_iter_has_child(self, _rowref):
+        return False
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None:
+            return len(self)
+        return 0
+
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and n < len(self):
+            return self._get_ref(n)
+        return None
+
+    def on_iter_parent(self, _child):
+        return None
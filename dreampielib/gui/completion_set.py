@@ -0,0 +1,152 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['CompletionSet', 'PagedCompletionSet', 'find_prefix_range']
+
+from .fuzzy_match import FuzzyMatcher
+
+# The number of completions asked for at a time from a PagedCompletionSet
+PAGE_SIZE = 50
+
+class CompletionSet(object):
+    """
+    A list of completions, split to public and private, prepared for prefix
+    search.
+
+    The lists are sorted by their keys, which are the lowercase strings if
+    is_case_insen, and the strings themselves otherwise. The list including
+    the private completions is only built when it is first needed.
+    CompletionSets are never modified, so they can be kept and reused while
+    the user types more chars.
+
+    If no completion starts with the typed chars, fuzzy_match() can be used
+    to find those which contain them.
+    """
+    is_paged = False
+
+    def __init__(self, public, private, is_case_insen):
+        self.is_case_insen = is_case_insen
+        self.public, self.public_keys = self._sort(public)
+        self._private = private
+        self._combined = None
+        self._matcher = None
+
+    def _sort(self, L):
+        if self.is_case_insen:
+            decorated = [(s.lower(), s) for s in L]
+            decorated.sort()
+            return ([s for _key, s in decorated],
+                    [key for key, _s in decorated])
+        else:
+            L = sorted(L)
+            return L, L
+
+    def key(self, s):
+        """Return the key by which s is searched."""
+        return s.lower() if self.is_case_insen else s
+
+    def get_lists(self, include_private):
+        """
+        Return a tuple (completions, keys) of the public completions, or of
+        all of them if include_private is True.
+        """
+        if not include_private:
+            return self.public, self.public_keys
+        if self._combined is None:
+            self._combined = self._sort(self.public + self._private)
+        return self._combined
+
+    def prefix_range(self, prefix, include_private):
+        """
+        Return a tuple (completions, keys, start, end), where
+        completions[start:end] are the completions starting with prefix.
+        """
+        L, keys = self.get_lists(include_private)
+        start, end = find_prefix_range(keys, self.key(prefix))
+        return L, keys, start, end
+
+    def fuzzy_match(self, query):
+        """
+        Return a list of the completions, including private ones, which
+        contain the chars of query in order, best matches first.
+        """
+        if self._matcher is None:
+            self._matcher = FuzzyMatcher(self.get_lists(True)[0])
+        return self._matcher.match(query)
+
+class PagedCompletionSet(object):
+    """
+    A list of completions which is too long to be sent by the subprocess at
+    once. It is kept there under a handle, and only the pages which are
+    shown are asked for, with get_page_func (see
+    get_completion_page in the subprocess). The completions are sorted
+    case-sensitively. Fuzzy matching isn't supported.
+    """
+    is_paged = True
+    is_case_insen = False
+
+    def __init__(self, handle, n_public, n_private, get_page_func):
+        self.handle = handle
+        self.n_public = n_public
+        self.n_private = n_private
+        self.get_page_func = get_page_func
+
+    def key(self, s):
+        return s
+
+    def get_page(self, prefix, include_private, offset, callback):
+        """
+        Ask for PAGE_SIZE of the completions starting with prefix, from
+        offset. If include_private is None, the private completions are
+        included only if no public one matches.
+        callback will be called with (include_private, n, common, items),
+        where n is the number of matching completions and common is their
+        common prefix, or with None if the completions aren't available.
+        Return the request id.
+        """
+        return self.get_page_func(self.handle, prefix, include_private,
+                                  offset, PAGE_SIZE, callback)
+
+def find_prefix_range(L, prefix):
+    # Find the range in the list L which begins with prefix, using binary
+    # search.
+
+    # start.
+    l = 0
+    r = len(L)
+    while r > l:
+        m = (l + r) // 2
+        if L[m] == prefix:
+            l = r = m
+        elif L[m] < prefix:
+            l = m + 1
+        else:
+            r = m
+    start = l
+
+    # end
+    l = 0
+    r = len(L)
+    while r > l:
+        m = (l + r) // 2
+        if L[m][:len(prefix)] > prefix:
+            r = m
+        else:
+            l = m + 1
+    end = l
+
+    return start, end
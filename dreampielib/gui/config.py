@@ -33,13 +33,17 @@ show-getting-started = True
 font=Courier New 10
 current-theme = Dark
 pprint = True
+profile = False
 use-reshist = True
 reshist-size = 30
 autofold = True
 autofold-numlines = 30
+limit-scrollback = True
+scrollback-size = 2000000
 viewer = ''
 init-code = ''
 autoparen = True
+fuzzy-complete = True
 expects-str-2 = execfile chdir open run runeval
 vertical-layout = True
 ask-on-quit = True
@@ -47,11 +51,15 @@ matplotlib-ia-switch = False
 matplotlib-ia-warn = True
 
 recall-1-char-commands = False
+remember-commands = True
 hide-defs = False
 leave-code = False
 
 start-rpdb2-embedded = False
 
+compress-rpc = False
+compress-rpc-threshold = 65536
+
 [Dark theme]
 is-active = True
 
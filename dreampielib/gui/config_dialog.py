@@ -48,6 +48,8 @@ class ConfigDialog(SimpleGladeApp):
         
         self.pprint_chk.props.active = config.get_bool('pprint')
         
+        self.profile_chk.props.active = config.get_bool('profile')
+        
         self.reshist_chk.props.active = config.get_bool('use-reshist')
         self.on_reshist_chk_toggled(self.reshist_chk)
         self.reshist_spin.props.value = config.get_int('reshist-size')
@@ -141,6 +143,8 @@ class ConfigDialog(SimpleGladeApp):
         
         config.set_bool('pprint', self.pprint_chk.props.active)
         
+        config.set_bool('profile', self.profile_chk.props.active)
+        
         config.set_bool('use-reshist', self.reshist_chk.props.active)
         config.set_int('reshist-size', self.reshist_spin.props.value)
         
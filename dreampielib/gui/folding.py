@@ -17,7 +17,7 @@
 
 all = ['Folding']
 
-from .tags import OUTPUT, COMMAND, FOLDED, FOLD_MESSAGE
+from .tags import OUTPUT, COMMAND, PROFILE, FOLDED, FOLD_MESSAGE
 from .common import beep, get_text
 
 # Maybe someday we'll want translations...
@@ -25,7 +25,7 @@ _ = lambda s: s
 
 class Folding(object):
     """
-    Support folding and unfolding of output and code sections.
+    Support folding and unfolding of output, code and profile sections.
     """
     def __init__(self, textbuffer, LINE_LEN):
         self.textbuffer = tb = textbuffer
@@ -40,25 +40,28 @@ class Folding(object):
         self.fold_message_tag = tt.lookup(FOLD_MESSAGE)
         self.output_tag = tt.lookup(OUTPUT)
         self.command_tag = tt.lookup(COMMAND)
-        self.tags = {OUTPUT: self.output_tag, COMMAND: self.command_tag}
+        self.profile_tag = tt.lookup(PROFILE)
+        self.tags = {OUTPUT: self.output_tag, COMMAND: self.command_tag,
+                     PROFILE: self.profile_tag}
     
     def get_section_status(self, it):
         """
         Get an iterator of the sourcebuffer. Return a tuple:
         (typ, is_folded, start_it)
-        typ: one of tags.OUTPUT, tags.COMMAND
+        typ: one of tags.OUTPUT, tags.COMMAND, tags.PROFILE
         is_folded: boolean (is folded), or None if not folded but too short
                    to fold (1 line or less).
         start_it: An iterator pointing to the beginning of the section.
         
-        If it isn't in an OUTPUT or COMMAND section, return None.
+        If it isn't in an OUTPUT, COMMAND or PROFILE section, return None.
         """
         it = it.copy()
         # The iterator is in an OUTPUT section if it's either tagged with
         # OUTPUT or if it's inside a FOLD_MESSAGE which goes right after
         # the OUTPUT tagged text. The same goes for COMMAND - note that STDIN
         # is marked with both COMMAND and OUTPUT and is considered output, so
-        # we check OUTPUT first.
+        # we check OUTPUT first. PROFILE sections are marked only with
+        # PROFILE.
         # A section is folded iff it's followed by a FOLD_MESSAGE.
         if it.has_tag(self.fold_message_tag):
             if not it.begins_tag(self.fold_message_tag):
@@ -67,8 +70,11 @@ class Folding(object):
                 typ = OUTPUT
             elif it.ends_tag(self.command_tag):
                 typ = COMMAND
+            elif it.ends_tag(self.profile_tag):
+                typ = PROFILE
             else:
-                assert False, "FOLD_MESSAGE doesn't follow OUTPUT/COMMAND"
+                assert False, \
+                       "FOLD_MESSAGE doesn't follow OUTPUT/COMMAND/PROFILE"
             it.backward_to_tag_toggle(self.tags[typ])
             return (typ, True, it)
         else:
@@ -78,6 +84,9 @@ class Folding(object):
             elif it.has_tag(self.command_tag) or it.ends_tag(self.command_tag):
                 typ = COMMAND
                 tag = self.command_tag
+            elif it.has_tag(self.profile_tag) or it.ends_tag(self.profile_tag):
+                typ = PROFILE
+                tag = self.profile_tag
             else:
                 return None
             if not it.ends_tag(tag):
@@ -97,8 +106,8 @@ class Folding(object):
     
     def fold(self, typ, start_it):
         """
-        Get an iterator pointing to the beginning of an unfolded OUTPUT/COMMAND
-        section. Fold it.
+        Get an iterator pointing to the beginning of an unfolded
+        OUTPUT/COMMAND/PROFILE section. Fold it.
         """
         tb = self.textbuffer
         
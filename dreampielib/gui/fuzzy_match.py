@@ -0,0 +1,262 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Find the completions which contain the typed chars as a subsequence, and rank
+them so that matches at the beginning of words come first.
+
+"spl" matches "split", "str_split" and "SplitLines", "sWord" matches
+"snake_word" and "someWord".
+"""
+
+__all__ = ['FuzzyMatcher']
+
+import re
+from bisect import bisect_right
+
+# Only this number of matches are scored. Matches which start with the first
+# char of the query, or have it at the start of a word, are preferred, and
+# then shorter ones. This keeps queries which match almost everything fast.
+MAX_SCORED = 200
+# Stop searching for preferred matches after this number of them
+MAX_PREFERRED = 4 * MAX_SCORED
+# Matches in the middle of words are only searched for if there are fewer
+# preferred matches than this, since they are rarely what the user meant.
+# Stop searching after MAX_MATCHES of them.
+FEW_PREFERRED = 50
+MAX_MATCHES = 2000
+
+# A word begins at the start, after a non-alphanumeric char, at an uppercase
+# char after a lowercase one, and at a digit after a letter.
+_word_start_re = re.compile(
+    r'(?:^|(?<=[^a-zA-Z0-9]))[a-zA-Z0-9]|(?<=[a-z])[A-Z]|(?<=[a-zA-Z])[0-9]')
+
+# Scores for a matched char
+SCORE_CHAR = 1
+SCORE_FIRST = 8
+SCORE_WORD_START = 6
+SCORE_CONSECUTIVE = 4
+SCORE_SAME_CASE = 1
+# Penalty for each skipped char (up to MAX_GAP_PENALTY per gap)
+PENALTY_GAP = 1
+MAX_GAP_PENALTY = 3
+
+class _Blob(object):
+    """
+    Lowercase candidates, each preceded by a newline, so that a single regex
+    search finds all the matching ones.
+    """
+    def __init__(self, indices, lowered):
+        self.indices = indices
+        self.text = u''.join([u'\n' + lowered[i] for i in indices])
+        # The offset in text of each candidate
+        self.starts = starts = []
+        pos = 1
+        for i in indices:
+            starts.append(pos)
+            pos += len(lowered[i]) + 1
+
+    def search(self, regex, max_matches=None, offset=0):
+        """
+        Return a list of the indices of the candidates which regex matches,
+        and whether all of them were found (and not just max_matches, if
+        given).
+        offset is added to the positions of matches before looking them up.
+        """
+        starts = self.starts
+        indices = self.indices
+        r = []
+        last = None
+        for m in regex.finditer(self.text):
+            i = indices[bisect_right(starts, m.start() + offset) - 1]
+            # There may be several matches in one line
+            if i != last:
+                if len(r) == max_matches:
+                    return r, False
+                r.append(i)
+                last = i
+        return r, True
+
+class FuzzyMatcher(object):
+    """
+    Match a list of candidates against queries.
+    The lowercase candidates are prepared when the matcher is created. Word
+    starts are found when a candidate is first scored, and are remembered.
+    When a query extends the previous one, and all the matches of the previous
+    one were found, only they are searched.
+    """
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.lowered = lowered = [s.lower() for s in candidates]
+        self.lengths = [len(s) for s in candidates]
+        self._all = _Blob(range(len(candidates)), lowered)
+        # Map a candidate index to a sorted list of its word start positions,
+        # and a set of them
+        self._word_starts = {}
+        # The last query, its matches and a _Blob of them
+        self._last_query = None
+        self._last_matches = None
+        self._last_blob = None
+
+    def _get_word_starts(self, i):
+        r = self._word_starts.get(i)
+        if r is None:
+            starts = [m.start()
+                      for m in _word_start_re.finditer(self.candidates[i])]
+            r = self._word_starts[i] = (starts, frozenset(starts))
+        return r
+
+    def _score_path(self, query, i, start, prefer_word_starts):
+        """
+        Match the query chars one by one, from the left, starting at start.
+        If prefer_word_starts, a char is matched at a later word start if
+        possible. Return the score, or None if the query wasn't matched.
+        """
+        cand = self.candidates[i]
+        lowered = self.lowered[i]
+        word_starts_list, word_starts = self._get_word_starts(i)
+        query_lower = query.lower()
+        score = 0
+        prev = start - 1
+        for qi, c in enumerate(query_lower):
+            pos = lowered.find(c, prev + 1)
+            if pos == -1:
+                return None
+            if (prefer_word_starts and pos not in word_starts
+                and pos != prev + 1):
+                for ws in word_starts_list:
+                    if ws > pos and lowered[ws] == c:
+                        pos = ws
+                        break
+            score += SCORE_CHAR
+            if pos == 0:
+                score += SCORE_FIRST
+            elif pos in word_starts:
+                score += SCORE_WORD_START
+            if qi == 0:
+                gap = pos
+            elif pos == prev + 1:
+                score += SCORE_CONSECUTIVE
+                gap = 0
+            else:
+                gap = pos - prev - 1
+            score -= min(gap, MAX_GAP_PENALTY) * PENALTY_GAP
+            if cand[pos] == query[qi]:
+                score += SCORE_SAME_CASE
+            prev = pos
+        return score
+
+    def score(self, query, i):
+        """
+        Return the score of the candidate with index i for the query, or
+        None if it doesn't match. This is the best score of matching from the
+        left, and of matching from each word start with the first query char,
+        preferring word starts.
+        """
+        best = self._score_path(query, i, 0, False)
+        if best is None:
+            return None
+        lowered = self.lowered[i]
+        first = query[0].lower()
+        for ws in self._get_word_starts(i)[0]:
+            if lowered[ws] == first:
+                score = self._score_path(query, i, ws, True)
+                if score is not None and score > best:
+                    best = score
+        return best
+
+    def _find(self, query):
+        """
+        Return three lists of indices of candidates matching query: those
+        which start with its first char, those in which it follows a '_' or a
+        '.' (MAX_PREFERRED at most of each), and all of them (MAX_MATCHES at
+        most). If there are FEW_PREFERRED preferred matches, the last list is
+        None.
+        """
+        query_lower = query.lower()
+        if (self._last_query is not None
+            and query_lower.startswith(self._last_query)):
+            if self._last_blob is None:
+                self._last_blob = _Blob(self._last_matches, self.lowered)
+            blob = self._last_blob
+        else:
+            blob = self._all
+        # Patterns which start with a literal are searched quickly, so each
+        # char before the first is searched separately. Negative char sets
+        # avoid backtracking.
+        first = re.escape(query_lower[0])
+        rest = u''.join(u'[^%s\n]*%s' % (re.escape(c), re.escape(c))
+                        for c in query_lower[1:])
+        def search(before, max_matches, offset=0):
+            return blob.search(re.compile(before + first + rest, re.UNICODE),
+                               max_matches, offset)
+        starting, _complete = search(u'\n', MAX_PREFERRED, 1)
+        word, _complete = search(u'_', MAX_PREFERRED)
+        if len(word) < MAX_PREFERRED:
+            word.extend(search(u'\\.', MAX_PREFERRED - len(word))[0])
+        if len(starting) + len(word) >= FEW_PREFERRED:
+            matches = None
+            complete = False
+        else:
+            matches, complete = search(u'', MAX_MATCHES)
+        if complete:
+            self._last_query = query_lower
+            self._last_matches = matches
+        else:
+            # The next query will have to search everything
+            self._last_query = None
+            self._last_matches = None
+        self._last_blob = None
+        return starting, word, matches
+
+    def _select(self, starting, word, matches):
+        """
+        Select MAX_SCORED matches to score: the shortest of those starting
+        with the first char of the query, then of those in which it starts a
+        word, and then the others.
+        """
+        if matches is not None and len(matches) <= MAX_SCORED:
+            return matches
+        lengths = self.lengths
+        selected = []
+        selected_set = set()
+        for tier in (starting, word, matches or []):
+            if tier is not matches:
+                tier = sorted(tier, key=lengths.__getitem__)
+            for i in tier:
+                if len(selected) == MAX_SCORED:
+                    return selected
+                if i not in selected_set:
+                    selected.append(i)
+                    selected_set.add(i)
+        return selected
+
+    def match(self, query):
+        """
+        Return the candidates matching query, best first. If there are many
+        matches, only some of them are returned.
+        """
+        if not query:
+            return list(self.candidates)
+        matches = self._select(*self._find(query))
+        scored = []
+        for i in matches:
+            score = self.score(query, i)
+            if score is not None:
+                scored.append((-score, self.lengths[i], self.candidates[i]))
+        scored.sort()
+        return [cand for _score, _len, cand in scored]
@@ -15,7 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ['HistPersist']
+__all__ = ['HistPersist', 'save_history', 'write_history_body',
+           'load_history_body']
 
 import os
 from HTMLParser import HTMLParser
@@ -31,12 +32,16 @@ class HistPersist(object):
     Provide actions for storing and loading history.
     """
     
-    def __init__(self, window_main, textview, status_bar, recent_manager):
+    def __init__(self, window_main, textview, status_bar, recent_manager,
+                 scrollback, index_commands):
         self.window_main = window_main
         self.textview = textview
         self.textbuffer = textview.get_buffer()
         self.status_bar = status_bar
         self.recent_manager = recent_manager
+        self.scrollback = scrollback
+        # Called with the start and end iters of a loaded history
+        self.index_commands = index_commands
         
         self.filename = None
         
@@ -47,7 +52,7 @@ class HistPersist(object):
         Save history to a file.
         """
         f = open(filename, 'wb')
-        save_history(self.textview, f)
+        save_history(self.textview, f, self.scrollback)
         f.close()
         self.filename = filename
         self.status_bar.set_status(_('History saved.'))
@@ -84,9 +89,17 @@ class HistPersist(object):
 
     def load_filename(self, filename):
         s = open(filename, 'rb').read()
-        parser = Parser(self.textbuffer)
+        tb = self.textbuffer
+        # The loaded history goes after the scrollback placeholder, which
+        # must stay at the beginning of the textbuffer.
+        start_offset = self.scrollback.get_live_start().get_offset()
+        n_chars = tb.get_char_count()
+        parser = Parser(tb, tb.get_iter_at_offset(start_offset))
         parser.feed(s)
         parser.close()
+        end_offset = start_offset + tb.get_char_count() - n_chars
+        self.index_commands(tb.get_iter_at_offset(start_offset),
+                            tb.get_iter_at_offset(end_offset))
         self.status_bar.set_status(_('History loaded.'))
         self.filename = filename
         self.update_title()
@@ -140,9 +153,10 @@ def _html_escape(s):
 def _format_color(color):
     return '#%02x%02x%02x' % (color.red >> 8, color.green >> 8, color.blue >> 8)
 
-def save_history(textview, f):
+def save_history(textview, f, scrollback=None):
     """
     Save the history - the content of the textview - to a HTML file f.
+    If scrollback is given, the sections it archived are saved first.
     """
     tv = textview
     tb = tv.get_buffer()
@@ -192,14 +206,39 @@ body {
 </head>
 <body>""")
     
+    if scrollback is not None:
+        scrollback.write_archive(f)
+        start_it = scrollback.get_live_start()
+    else:
+        start_it = tb.get_start_iter()
+    write_history_body(tb, start_it, tb.get_end_iter(), f)
+    
+    f.write("""\
+</body>
+</html>
+""")
+
+def write_history_body(tb, start_it, end_it, f):
+    """
+    Write the text between start_it and end_it as HTML, with a span for each
+    tag. All spans are closed at the end, so the written fragments of
+    consecutive ranges can be concatenated.
+    """
     cur_tags = []
-    it = tb.get_start_iter()
+    it = start_it.copy()
     while True:
-        new_tags = cur_tags[:]
-        for tag in it.get_toggled_tags(False):
-            new_tags.remove(tag)
-        for tag in it.get_toggled_tags(True):
-            new_tags.append(tag)
+        at_end = it.compare(end_it) >= 0
+        if at_end:
+            new_tags = []
+        elif it.equal(start_it):
+            # Tags which were toggled on before start_it are opened here
+            new_tags = it.get_tags()
+        else:
+            new_tags = cur_tags[:]
+            for tag in it.get_toggled_tags(False):
+                new_tags.remove(tag)
+            for tag in it.get_toggled_tags(True):
+                new_tags.append(tag)
         new_tags.sort(key=lambda tag: -tag.get_priority())
         
         shared_prefix = 0
@@ -211,39 +250,51 @@ body {
         for tag in new_tags[shared_prefix:]:
             f.write('<span class="%s">' % tag.props.name)
         
-        if it.compare(tb.get_end_iter()) == 0:
-            # We reached the end. We break here, because we want to close
-            # the tags.
+        if at_end:
+            # We break here, because we want to close the tags.
             break
         
         new_it = it.copy()
         new_it.forward_to_tag_toggle(None)
+        if new_it.compare(end_it) > 0:
+            new_it = end_it.copy()
         text = get_text(tb, it, new_it)
         text = _html_escape(text)
         f.write(text.encode('utf8'))
         
         it = new_it
         cur_tags = new_tags
-    
-    f.write("""\
-</body>
-</html>
-""")
+
+def load_history_body(tb, it, s):
+    """
+    Insert HTML written by write_history_body into the textbuffer at it.
+    """
+    parser = Parser(tb, it)
+    parser.feed('<meta name="DreamPie Format" content="1"><body>')
+    parser.feed(s)
+    parser.feed('</body>')
+    parser.close()
 
 class LoadError(Exception):
     pass
 
 class Parser(HTMLParser):
-    def __init__(self, textbuffer):
+    """
+    Insert a saved history into a textbuffer, at the given iter or at the
+    beginning.
+    """
+    def __init__(self, textbuffer, it=None):
         HTMLParser.__init__(self)
         
         self.textbuffer = tb = textbuffer
+        if it is None:
+            it = tb.get_start_iter()
 
         self.reached_body = False
         self.version = None
         self.cur_tags = []
-        self.leftmark = tb.create_mark(None, tb.get_start_iter(), True)
-        self.rightmark = tb.create_mark(None, tb.get_start_iter(), False)
+        self.leftmark = tb.create_mark(None, it, True)
+        self.rightmark = tb.create_mark(None, it, False)
     
     def handle_starttag(self, tag, attrs):
         attrs = dict(attrs)
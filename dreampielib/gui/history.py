@@ -17,25 +17,15 @@
 
 __all__ = ['History']
 
-from zlib import adler32 as hash_cmd
-
 from .tags import COMMAND, PROMPT
 from .common import beep, get_text
 
-# In order to filter out repeating commands, we store the number of times a
-# command was encountered. To save memory, we only map the hash of a command
-# to a number. The docs say that adler32 is a fast checksum function. I think
-# that 32 bits should be enough (you'll get a collision if you have 2**16
-# commands, and even that will just mean that a command isn't retreived).
-# To ease debugging, uncomment this:
-# hash_cmd = lambda s: s
-
 class History(object):
     """
     Manage moving between commands on the text view, and recalling commands
     in the source view.
     """
-    def __init__(self, textview, sourceview, sv_changed, config):
+    def __init__(self, textview, sourceview, sv_changed, config, index):
         self.textview = textview
         self.textbuffer = textview.get_buffer()
         self.sourceview = sourceview
@@ -43,16 +33,17 @@ class History(object):
         sv_changed.append(self._on_sv_changed)
         self.recall_1_char_commands = config.get_bool('recall-1-char-commands')
 
-        tb = self.textbuffer
+        # A CommandIndex of the executed commands
+        self.index = index
 
         self.hist_prefix = None
-        # Map a command hash to the number of times it has occured in the search.
-        # This lets us avoid showing the same command twice.
-        self.hist_count = {}
+        # The commands matching hist_prefix, most recent first, and the index
+        # of the recalled one (-1 if none was recalled).
+        self.hist_matches = []
+        self.hist_pos = -1
         self.sb_changed = True
         # A handler_id when sb_changed is False.
         self.changed_handler_id = None
-        self.hist_mark = tb.create_mark('history', tb.get_end_iter(), False)
 
     def _on_sv_changed(self, new_sv):
         if self.changed_handler_id:
@@ -74,6 +65,22 @@ class History(object):
         self.sourcebuffer.disconnect(self.changed_handler_id)
         self.changed_handler_id = None
 
+    def index_commands(self, start_it, end_it):
+        """
+        Add the commands between start_it and end_it, which were loaded from
+        a saved history file, to the index.
+        """
+        command = self.textbuffer.get_tag_table().lookup(COMMAND)
+        cmds = []
+        it = start_it.copy()
+        if not it.begins_tag(command):
+            it.forward_to_tag_toggle(command)
+        while it.compare(end_it) < 0:
+            cmds.append(self.iter_get_command(it))
+            it.forward_to_tag_toggle(command)
+            it.forward_to_tag_toggle(command)
+        self.index.add_loaded(cmds)
+
     def iter_get_command(self, it, only_first_line=False):
         """Get a textiter placed inside (or at the end of) a COMMAND tag.
         Return the text of the tag which doesn't have the PROMPT tag.
@@ -165,9 +172,7 @@ class History(object):
             self.textview.scroll_mark_onscreen(insert)
 
         elif self.sourceview.is_focus():
-            tb = self.textbuffer
             sb = self.sourcebuffer
-            command = tb.get_tag_table().lookup(COMMAND)
             if self.sb_changed:
                 if sb.get_end_iter().get_line() != 0:
                     # Don't allow prefixes of more than one line
@@ -175,42 +180,26 @@ class History(object):
                     return
                 self.hist_prefix = get_text(sb, sb.get_start_iter(),
                                             sb.get_end_iter())
-                self.hist_count = {}
+                min_len = 0 if self.recall_1_char_commands else 2
+                self.hist_matches = self.index.search(self.hist_prefix,
+                                                      min_len)
+                self.hist_pos = -1
                 self._track_change()
-                tb.move_mark(self.hist_mark, tb.get_end_iter())
-            it = tb.get_iter_at_mark(self.hist_mark)
-            if it.is_start():
+            if self.hist_pos + 1 >= len(self.hist_matches):
                 beep()
                 return
-            while True:
-                it.backward_to_tag_toggle(command)
-                if it.ends_tag(command):
-                    it.backward_to_tag_toggle(command)
-                if not it.begins_tag(command):
-                    beep()
-                    break
-                first_line = self.iter_get_command(it, only_first_line=True).strip()
-                if (first_line
-                    and first_line.startswith(self.hist_prefix)
-                    and (len(first_line) > 2 or self.recall_1_char_commands)):
-                    
-                    cmd = self.iter_get_command(it).strip()
-                    cmd_hash = hash_cmd(cmd)
-                    tb.move_mark(self.hist_mark, it)
-                    count = self.hist_count.get(cmd_hash, 0) + 1
-                    self.hist_count[cmd_hash] = count
-                    if count == 1:
-                        sb.set_text(cmd)
-                        self._track_change()
-                        sb.place_cursor(sb.get_end_iter())
-                        break
-                if it.is_start():
-                    beep()
-                    return
+            self.hist_pos += 1
+            self._recall(self.hist_matches[self.hist_pos])
 
         else:
             beep()
 
+    def _recall(self, cmd):
+        sb = self.sourcebuffer
+        sb.set_text(cmd)
+        self._track_change()
+        sb.place_cursor(sb.get_end_iter())
+
     def history_down(self):
         """Called when the history down command is required"""
         if self.textview.is_focus():
@@ -225,45 +214,21 @@ class History(object):
             self.textview.scroll_mark_onscreen(insert)
 
         elif self.sourceview.is_focus():
-            tb = self.textbuffer
             sb = self.sourcebuffer
-            command = tb.get_tag_table().lookup(COMMAND)
             if self.sb_changed:
                 beep()
                 return
-            it = tb.get_iter_at_mark(self.hist_mark)
-            passed_one = False
-            while True:
-                if not it.begins_tag(command):
-                    # Return the source buffer to the prefix and everything
-                    # to initial state.
-                    sb.set_text(self.hist_prefix)
-                    sb.place_cursor(sb.get_end_iter())
-                    # Since we change the text and not called _track_change,
-                    # it's like the user did it and hist_prefix is not longer
-                    # meaningful.
-                    break
-                first_line = self.iter_get_command(it, only_first_line=True).strip()
-                if (first_line
-                    and first_line.startswith(self.hist_prefix)
-                    and (len(first_line) > 2 or self.recall_1_char_commands)):
-                    
-                    cmd = self.iter_get_command(it).strip()
-                    cmd_hash = hash_cmd(cmd)
-                    tb.move_mark(self.hist_mark, it)
-                    if self.hist_count[cmd_hash] == 1:
-                        if passed_one:
-                            sb.set_text(cmd)
-                            self._track_change()
-                            sb.place_cursor(sb.get_end_iter())
-                            break
-                        else:
-                            passed_one = True
-                    self.hist_count[cmd_hash] -= 1
-
-                it.forward_to_tag_toggle(command)
-                it.forward_to_tag_toggle(command)
-                
+            if self.hist_pos > 0:
+                self.hist_pos -= 1
+                self._recall(self.hist_matches[self.hist_pos])
+            else:
+                # Return the source buffer to the prefix and everything
+                # to initial state.
+                sb.set_text(self.hist_prefix)
+                sb.place_cursor(sb.get_end_iter())
+                # Since we change the text and not called _track_change,
+                # it's like the user did it and hist_prefix is not longer
+                # meaningful.
 
         else:
             beep()
@@ -0,0 +1,60 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['format_profile']
+
+# Maybe someday we'll want translations...
+_ = lambda s: s
+
+def _format_size(n):
+    """Format a number of bytes, like '+12.3 MB'."""
+    sign = '-' if n < 0 else '+'
+    n = abs(n)
+    for unit in ('bytes', 'KB', 'MB'):
+        if n < 1024:
+            break
+        n /= 1024.
+    else:
+        unit = 'GB'
+    if unit == 'bytes':
+        return '%s%d %s' % (sign, n, unit)
+    return '%s%.1f %s' % (sign, n, unit)
+
+def format_profile(profile):
+    """
+    Get the profile summary sent by the subprocess after executing a command
+    (see ExecProfile.summary in the subprocess). Return it as text, whose
+    first line has the times and the memory, so that it is what's left when
+    the text is folded.
+    """
+    wall, cpu, mem_kind, mem_delta, funcs = profile
+    parts = [_('%.3f s wall') % wall, _('%.3f s CPU') % cpu]
+    if mem_kind == 'peak':
+        parts.append(_('traced memory peak %s') % _format_size(mem_delta))
+    elif mem_kind == 'rss':
+        parts.append(_('peak memory use %s') % _format_size(mem_delta))
+    lines = [_('Profile: ') + ', '.join(parts) + '\n']
+    if funcs is None:
+        lines.append(_("(cProfile isn't available, so functions aren't "
+                       "shown)\n"))
+    elif funcs:
+        lines.append('%9s %9s %9s  %s\n' % (_('ncalls'), _('tottime'),
+                                            _('cumtime'), _('function')))
+        for desc, ncalls, tottime, cumtime in funcs:
+            lines.append('%9d %9.3f %9.3f  %s\n' % (ncalls, tottime, cumtime,
+                                                   desc))
+    return ''.join(lines)
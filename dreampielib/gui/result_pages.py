@@ -0,0 +1,165 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['ResultPages']
+
+from .tags import OUTPUT, RESULT, RESULT_IND, MORE_RESULT
+from .output import add_breaks
+
+# Maybe someday we'll want translations...
+_ = lambda s: s
+
+class ResultPages(object):
+    """
+    Show the rest of results which weren't sent whole by the subprocess.
+
+    Such a result is followed by a marker line, tagged with MORE_RESULT.
+    Double-clicking it asks the subprocess for the next page of the result,
+    using its index in the result history, and the page is inserted before
+    the marker. After the last page the marker is removed.
+    """
+    def __init__(self, textbuffer, get_page_func):
+        self.textbuffer = tb = textbuffer
+        self.more_tag = tb.get_tag_table().lookup(MORE_RESULT)
+        # get_page_func(res_no, callback) asks for the next page of a result
+        self.get_page_func = get_page_func
+
+        # Map the index of a result to a list [mark, res_rest]. The mark is
+        # at the end of the shown part of the result, before the newline
+        # which precedes the marker. It has right gravity, so it stays after
+        # the text inserted at it.
+        self.results = {}
+        # Indices of results whose next page was asked for
+        self.pending = set()
+
+    @staticmethod
+    def marker_text(res_no, res_rest):
+        """Return the text of the marker of a result."""
+        n_chars, is_exact = res_rest
+        if is_exact:
+            msg = _("[%d more chars of _%d. Double-click to show more]\n")
+        else:
+            msg = _("[About %d more chars of _%d. "
+                    "Double-click to show more]\n")
+        return msg % (n_chars, res_no)
+
+    def add(self, res_no, res_rest):
+        """
+        Remember a result whose marker was just written, so it's the last
+        marker in the textbuffer.
+        """
+        # Forget results whose markers were removed with their sections
+        for old_no in list(self.results):
+            if self._get_marker(old_no) is None:
+                self._remove(old_no, None)
+        tb = self.textbuffer
+        it = tb.get_end_iter()
+        it.backward_to_tag_toggle(self.more_tag)
+        it.backward_to_tag_toggle(self.more_tag)
+        it.backward_char()
+        mark = tb.create_mark(None, it, left_gravity=False)
+        self.results[res_no] = [mark, res_rest]
+
+    def is_marker(self, it):
+        """Return True if it points into a marker."""
+        return it.has_tag(self.more_tag)
+
+    def _get_marker(self, res_no):
+        # Return (start, end) iters of the marker of a result, or None if it
+        # isn't in the textbuffer anymore (it may have been archived).
+        tb = self.textbuffer
+        start = tb.get_iter_at_mark(self.results[res_no][0])
+        start.forward_char()
+        if not start.begins_tag(self.more_tag):
+            return None
+        end = start.copy()
+        end.forward_to_tag_toggle(self.more_tag)
+        return start, end
+
+    def expand(self, it):
+        """
+        Ask for the next page of the result whose marker it points into.
+        Return False if it isn't the marker of a known result.
+        """
+        if not it.begins_tag(self.more_tag):
+            it = it.copy()
+            it.backward_to_tag_toggle(self.more_tag)
+        for res_no in self.results:
+            r = self._get_marker(res_no)
+            if r is not None and r[0].equal(it):
+                break
+        else:
+            return False
+        if res_no not in self.pending:
+            self.pending.add(res_no)
+            self.get_page_func(
+                res_no, lambda r: self._on_page(res_no, r))
+        return True
+
+    def _on_page(self, res_no, r):
+        self.pending.discard(res_no)
+        if res_no not in self.results or self._get_marker(res_no) is None:
+            return
+        if r is None:
+            self._remove(res_no,
+                         _("[The rest of _%d isn't available]\n") % res_no)
+            return
+        res_str, res_rest = r
+        tb = self.textbuffer
+        it = tb.get_iter_at_mark(self.results[res_no][0])
+        tb.insert_with_tags_by_name(
+            it, add_breaks(res_str, it.get_line_offset()), OUTPUT, RESULT)
+        if res_rest is None:
+            self._remove(res_no, None)
+        else:
+            self.results[res_no][1] = res_rest
+            self._replace_marker(res_no, self.marker_text(res_no, res_rest),
+                                 MORE_RESULT)
+
+    def _replace_marker(self, res_no, text, *tag_names):
+        # The new text is inserted before the old marker is deleted, so that
+        # marks after the marker (like the output mark) stay after it.
+        tb = self.textbuffer
+        start, _end = self._get_marker(res_no)
+        if text:
+            tb.insert_with_tags_by_name(start, text, OUTPUT, RESULT_IND,
+                                        *tag_names)
+        end = start.copy()
+        end.forward_to_tag_toggle(self.more_tag)
+        tb.delete(start, end)
+
+    def _remove(self, res_no, text):
+        # Replace the marker of a result by text (or remove it, if text is
+        # None), and forget the result.
+        if self._get_marker(res_no) is not None:
+            self._replace_marker(res_no, text)
+        self.textbuffer.delete_mark(self.results.pop(res_no)[0])
+
+    def clear(self):
+        """
+        Forget all the results, since the subprocess which kept them was
+        restarted.
+        """
+        for res_no in list(self.results):
+            n_chars, is_exact = self.results[res_no][1]
+            if is_exact:
+                msg = _("[%d more chars of the result weren't shown]\n")
+            else:
+                msg = _("[About %d more chars of the result "
+                        "weren't shown]\n")
+            self._remove(res_no, msg % n_chars)
+        self.pending.clear()
@@ -0,0 +1,198 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['Scrollback']
+
+import tempfile
+
+from .tags import COMMAND, MESSAGE, ARCHIVED
+from .hist_persist import write_history_body, load_history_body
+
+# Maybe someday we'll want translations...
+_ = lambda s: s
+
+# When the textbuffer grows beyond the limit, it is trimmed to this fraction
+# of it, so that we don't archive a bit after every command.
+KEEP_FRACTION = 0.75
+
+class Scrollback(object):
+    """
+    Keep the textbuffer from growing without limit, by moving the oldest
+    sections to an archive file.
+
+    The archive is a temporary file to which parts of the history are appended
+    in the HTML format of hist_persist. A placeholder line at the beginning of
+    the textbuffer tells about them, and the most recent archived part can be
+    brought back by expand(). Archived commands can still be recalled, since
+    they are found using the CommandIndex.
+
+    Archived parts are split where sessions start, so the parts of previous
+    sessions can be discarded without those of the current one.
+    """
+    def __init__(self, textbuffer):
+        self.textbuffer = tb = textbuffer
+
+        tt = tb.get_tag_table()
+        self.command_tag = tt.lookup(COMMAND)
+        self.message_tag = tt.lookup(MESSAGE)
+        self.archived_tag = tt.lookup(ARCHIVED)
+
+        # Created when something is first archived
+        self._file = None
+        # A list of (offset, length, starts_session) of the archived parts,
+        # oldest first. starts_session is True if the part begins with the
+        # message which starts a session.
+        self._parts = []
+        # The number of chars brought back by expand(). The limit is raised
+        # by them until the next trim, so that they aren't archived again
+        # right away.
+        self._expanded_chars = 0
+
+    def get_live_start(self):
+        """
+        Return an iter pointing to the beginning of the textbuffer, after the
+        placeholder.
+        """
+        it = self.textbuffer.get_start_iter()
+        if it.begins_tag(self.archived_tag):
+            it.forward_to_tag_toggle(self.archived_tag)
+        return it
+
+    def is_placeholder(self, it):
+        """Return True if it points into the placeholder line."""
+        return it.has_tag(self.archived_tag)
+
+    def _update_placeholder(self):
+        tb = self.textbuffer
+        tb.delete(tb.get_start_iter(), self.get_live_start())
+        if self._parts:
+            tb.insert_with_tags_by_name(
+                tb.get_start_iter(),
+                _("[%d earlier parts of the history were archived. "
+                  "Double-click to show the last of them]\n")
+                % len(self._parts),
+                MESSAGE, ARCHIVED)
+
+    def trim(self, limit):
+        """
+        If the textbuffer is longer than limit chars, archive its oldest
+        sections. The textbuffer is only cut before a command, so an output
+        section which is longer than the limit by itself is kept.
+        """
+        tb = self.textbuffer
+        n_chars = tb.get_char_count()
+        if n_chars <= limit + self._expanded_chars:
+            return
+
+        start_it = self.get_live_start()
+        keep = int(limit * KEEP_FRACTION) + self._expanded_chars
+        cut_it = tb.get_iter_at_offset(n_chars - keep)
+        while not cut_it.begins_tag(self.command_tag) and not cut_it.is_end():
+            cut_it.forward_to_tag_toggle(self.command_tag)
+        if cut_it.is_end() or cut_it.compare(start_it) <= 0:
+            return
+        self._expanded_chars = 0
+
+        # Split where sessions start
+        bounds = [start_it]
+        it = start_it.copy()
+        while (it.forward_to_tag_toggle(self.message_tag)
+               and it.compare(cut_it) < 0):
+            if it.begins_tag(self.message_tag):
+                bounds.append(it.copy())
+        bounds.append(cut_it)
+
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='dreampie-scrollback-')
+        f = self._file
+        f.seek(0, 2)
+        for i in range(len(bounds) - 1):
+            offset = f.tell()
+            write_history_body(tb, bounds[i], bounds[i+1], f)
+            self._parts.append((offset, f.tell() - offset,
+                                bounds[i].begins_tag(self.message_tag)))
+
+        tb.delete(start_it, cut_it)
+        self._update_placeholder()
+
+    def expand(self):
+        """
+        Bring the most recently archived part back to the textbuffer.
+        """
+        offset, length, _starts_session = self._parts.pop()
+        f = self._file
+        f.seek(offset)
+        s = f.read(length)
+        f.seek(offset)
+        f.truncate()
+        tb = self.textbuffer
+        n_chars = tb.get_char_count()
+        load_history_body(tb, self.get_live_start(), s)
+        self._update_placeholder()
+        self._expanded_chars += tb.get_char_count() - n_chars
+
+    def write_archive(self, f):
+        """
+        Write all the archived parts, oldest first, to the file f.
+        """
+        for offset, length, _starts_session in self._parts:
+            self._copy_part(offset, length, f)
+
+    def _copy_part(self, offset, length, f):
+        # Write an archived part to the file f
+        self._file.seek(offset)
+        remaining = length
+        while remaining > 0:
+            s = self._file.read(min(remaining, 64 * 1024))
+            f.write(s)
+            remaining -= len(s)
+
+    def clear(self):
+        """
+        Discard all the archived parts.
+        """
+        self._parts = []
+        self._expanded_chars = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._update_placeholder()
+
+    def discard_previous_sessions(self):
+        """
+        Discard the archived parts which are older than the last archived
+        session start. Called when the current session started in the
+        archive.
+        """
+        for i in range(len(self._parts) - 1, -1, -1):
+            if self._parts[i][2]:
+                break
+        else:
+            return
+        if i == 0:
+            return
+        # Copy the parts which are kept to a new file
+        f = tempfile.TemporaryFile(prefix='dreampie-scrollback-')
+        parts = []
+        for offset, length, starts_session in self._parts[i:]:
+            new_offset = f.tell()
+            self._copy_part(offset, length, f)
+            parts.append((new_offset, length, starts_session))
+        self._file.close()
+        self._file = f
+        self._parts = parts
+        self._update_placeholder()
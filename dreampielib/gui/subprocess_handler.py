@@ -22,22 +22,45 @@ import os
 import time
 if sys.platform != 'win32':
     import signal
+    import fcntl
+    import errno
 else:
     import ctypes
 from .subprocess_interact import Popen, PIPE
 from select import select
-import socket
-import random
+from codecs import getincrementaldecoder
 from logging import debug
 
 import gobject
 
-from ..common.objectstream import send_object, recv_object
+from ..common.objectstream import ObjectStream
+from ..common.transport import (make_listener, default_transports,
+                                UNSUPPORTED_MARKER)
+from .common import TimeoutError
 
 _ = lambda s: s
 
 START_TIMEOUT = 30 # seconds
 
+# On Windows, pipes can't be watched by the main loop, so we poll.
+USE_IO_WATCH = (sys.platform != 'win32'
+                and hasattr(gobject, 'io_add_watch')
+                and hasattr(gobject, 'child_watch_add'))
+POLL_INTERVAL = 10 # milliseconds
+# How much to read from stdout and stderr at once
+READ_SIZE = 64 * 1024
+# How much to read from a pipe before letting the main loop do other things
+MAX_READ = 4 * READ_SIZE
+
+# Output is handed to the GUI once in OUTPUT_FRAME milliseconds, about
+# MAX_FRAME_OUTPUT bytes at a time.
+OUTPUT_FRAME = 16
+MAX_FRAME_OUTPUT = 256 * 1024
+# Stop reading output when this much is waiting to be handed to the GUI, and
+# resume when it drops to OUTPUT_LOW_WATER.
+OUTPUT_HIGH_WATER = 1024 * 1024
+OUTPUT_LOW_WATER = 256 * 1024
+
 class StartError(IOError):
     """Error when starting subprocess"""
     pass
@@ -70,56 +93,90 @@ class StartTimeoutError(StartError):
 class SubprocessHandler(object):
     """
     Manage interaction with the subprocess.
+    Where possible, the pipes, the socket and the process are watched by the
+    main loop, so nothing is done while the subprocess is idle. On Windows
+    they are polled.
     The communication, besides stdout, stderr and stdin, goes like this:
     You can call a function, and get a return value.
-    (This sends over the tuple with the function name and parameters,
-    and waits for the next object, which is the return value.)
+    (This sends over a (req_id, funcname, args) tuple. Every object the
+    subprocess sends back is a (req_id, obj) tuple, so several calls may be
+    in flight at once and each reply goes to the call which asked for it.)
+    A reply can be waited for, handled by a callback, or abandoned, in which
+    case it is dropped when it arrives. A call can also be cancelled, which
+    abandons it and tells the subprocess to skip it if it hasn't started
+    handling it yet.
     You can also get objects asyncronically.
-    (This happens when not waiting for a function's return value.)
+    (These are objects of a request which no one waits for, like the result
+    of 'execute', which is sent after its first reply.)
     """
 
     def __init__(self, pyexec, data_dir,
                  on_stdout_recv, on_stderr_recv, on_object_recv,
-                 on_subp_terminated):
+                 on_subp_terminated, compress_threshold=None):
         self._pyexec = pyexec
         self._data_dir = data_dir
         self._on_stdout_recv = on_stdout_recv
         self._on_stderr_recv = on_stderr_recv
         self._on_object_recv = on_object_recv
         self._on_subp_terminated = on_subp_terminated
+        # Objects of at least this size will be sent compressed, if the
+        # subprocess supports it. None means no compression. Changes take
+        # effect when a subprocess is started.
+        self.compress_threshold = compress_threshold
         
+        # The names of the transports to try when starting, by order of
+        # preference. If the subprocess says that it can't use one, it isn't
+        # tried again.
+        self._transports = default_transports()
         self._sock = None
+        self._stream = None
         # self._popen is None when there's no subprocess
         self._popen = None
         self._last_kill_time = 0
         
-        # I know that polling isn't the best way, but on Windows you have
-        # no choice, and it allows us to do it all by ourselves, not use
-        # gobject's functionality.
-        gobject.timeout_add(10, self._manage_subp)
+        # The id of the next RPC request
+        self._next_req_id = 0
+        # Map request ids to callbacks which should get their replies
+        self._reply_callbacks = {}
+        # Ids of requests whose replies should be dropped when they arrive
+        self._abandoned = set()
+        
+        # Map names to ids of the main loop sources watching the subprocess
+        self._watches = {}
+        # Names of the pipes which weren't closed by the subprocess
+        self._open_pipes = set()
+        # The timer handing output to the GUI, if output was recently handed
+        self._frame_timer = None
+        self._reset_output()
+        if not USE_IO_WATCH:
+            # On Windows there's no choice but to poll.
+            gobject.timeout_add(POLL_INTERVAL, self._manage_subp)
         
     def start(self):
         if self._popen is not None:
             raise ValueError("Subprocess is already living")
-        # Find a socket to listen to
-        ports = range(10000, 10100)
-        random.shuffle(ports)
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        for port in ports:
-            #debug("Trying to listen on port %d..." % port)
+        self._reset_output()
+        transports = self._transports
+        for i, name in enumerate(transports):
             try:
-                s.bind(('localhost', port))
-            except socket.error:
-                #debug("Failed.")
-                pass
+                self._start(name)
+            except StartTerminatedError, e:
+                # Other failures (like a broken sitecustomize) would happen
+                # with any transport, so they are just reported.
+                if (i == len(transports) - 1
+                    or UNSUPPORTED_MARKER not in e.output):
+                    raise
+                debug("Starting subprocess with %s transport failed, "
+                      "trying %s" % (name, transports[i+1]))
+                self._transports = transports[i+1:]
             else:
-                #debug("Ok.")
                 break
-        else:
-            raise IOError("Couldn't find a port to bind to")
-        # Now the socket is bound to port.
+        self._reply_callbacks.clear()
+        self._abandoned.clear()
 
+    def _start(self, transport_name):
         #debug("Spawning subprocess")
+        listener = make_listener(transport_name)
         env = os.environ.copy()
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'UTF-8'
@@ -129,38 +186,65 @@ class SubprocessHandler(object):
         # sys.setdefaultencoding('UTF-8') before importing site, and this is
         # needed because Python 2.5 ignores the PYTHONIOENCODING variable.
         # Hopefully it won't cause problems.
-        popen = Popen([self._pyexec, '-S', script, str(port)],
-                       stdin=PIPE, stdout=PIPE, stderr=PIPE,
-                       env=env)
+        try:
+            popen = Popen([self._pyexec, '-S', script, listener.address],
+                           stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                           env=env)
+        finally:
+            listener.child_started()
         #debug("Waiting for the subprocess to connect")
-        s.listen(1)
-        # We wait for the client to connect, but we also poll stdout and stderr,
-        # and if it writes something then we report an error.
-        s.settimeout(0.1)
+        # We wait for the client to connect and send its features, but we
+        # also poll the process, and if it terminates then we report an error.
         start_time = time.time()
-        while True:
-            try:
-                self._sock, _addr = s.accept()
-            except socket.timeout:
-                pass
-            else:
-                break
-            
-            rc = popen.poll()
-            if rc is not None:
-                out = (popen.recv() or '') + (popen.recv_err() or '')
-                raise StartTerminatedError(rc, out)
-            
-            if time.time() - start_time > START_TIMEOUT:
-                out = (popen.recv() or '') + (popen.recv_err() or '')
-                raise StartTimeoutError(START_TIMEOUT, out)
-        self._sock.setblocking(True)
-            
-        #debug("Connected to addr %r." % (addr,))
-        s.close()
+        sock = None
+        try:
+            while True:
+                if sock is None:
+                    sock = listener.accept(0.1)
+                elif select([sock], [], [], 0.1)[0]:
+                    break
+                
+                rc = popen.poll()
+                if rc is not None:
+                    out = (popen.recv() or '') + (popen.recv_err() or '')
+                    raise StartTerminatedError(rc, out)
+                
+                if time.time() - start_time > START_TIMEOUT:
+                    out = (popen.recv() or '') + (popen.recv_err() or '')
+                    raise StartTimeoutError(START_TIMEOUT, out)
+        finally:
+            listener.close()
+        
+        self._sock = sock
+        self._stream = ObjectStream(sock)
+        try:
+            self._negotiate()
+        except IOError:
+            # The subprocess closed the connection, so it's terminating.
+            rc = popen.wait()
+            out = (popen.recv() or '') + (popen.recv_err() or '')
+            raise StartTerminatedError(rc, out)
+        #debug("Connected using %s" % transport_name)
         self._popen = popen
+        if USE_IO_WATCH:
+            self._add_watches(popen)
+
+    def _negotiate(self):
+        """
+        Agree with the subprocess on the options of the connection.
+        The subprocess sends the features it supports as (name, value) pairs,
+        and we reply with the options to use.
+        """
+        features = dict(self._stream.recv_object())
+        options = []
+        if self.compress_threshold is not None and features.get(u'zlib'):
+            options.append((u'compress-threshold', self.compress_threshold))
+        options = tuple(options)
+        self._stream.send_object(options)
+        self._stream.set_options(options)
 
     def _manage_subp(self):
+        """Poll the subprocess. Used when IO watches aren't available."""
         popen = self._popen
         if popen is None:
             # Just continue looping - there's no subprocess.
@@ -169,60 +253,345 @@ class SubprocessHandler(object):
         # Check if exited
         rc = popen.poll()
         if rc is not None:
-            if time.time() - self._last_kill_time > 10:
-                debug("Process terminated unexpectedly with rc %r" % rc)
-            self._sock.close()
-            self._sock = None
-            self._popen = None
-            self._on_subp_terminated()
+            self._handle_termination(popen)
             return True
 
-        # Read from stdout
-        r = popen.recv()
-        if r:
-            self._on_stdout_recv(r.decode('utf8', 'replace'))
+        if not self._output_paused:
+            # Read from stdout
+            r = popen.recv(READ_SIZE)
+            if r:
+                self._queue_output('stdout', r)
 
-        # Read from stderr
-        r = popen.recv_err()
-        if r:
-            self._on_stderr_recv(r.decode('utf8', 'replace'))
+            # Read from stderr
+            r = popen.recv_err(READ_SIZE)
+            if r:
+                self._queue_output('stderr', r)
         
-        # Read from socket
-        if self.wait_for_object(0):
+        try:
+            self._recv_objects(popen)
+        except IOError:
+            # Could happen when subprocess exits. See bug #525358.
+            # We give the subprocess a second. If it shuts down, we ignore
+            # the exception, since on the next round we will handle that.
+            # Otherwise, the exception remains unexplained so we re-raise.
+            time.sleep(1)
+            if popen.poll() is None:
+                raise
+
+        return True
+
+    def _recv_objects(self, popen):
+        """
+        Handle the objects which were received from the socket. A single recv
+        may bring several objects, so we handle all of them.
+        """
+        while self._popen is popen and self.wait_for_object(0):
+            req_id, obj = self._stream.recv_object()
+            self._dispatch(req_id, obj)
+
+    def _handle_termination(self, popen):
+        """Clean up after the subprocess terminated."""
+        if popen is not self._popen:
+            # Already handled
+            return
+        if time.time() - self._last_kill_time > 10:
+            debug("Process terminated unexpectedly with rc %r"
+                  % popen.returncode)
+        self._deliver_output()
+        for source in self._watches.values():
+            gobject.source_remove(source)
+        self._watches.clear()
+        self._sock.close()
+        self._sock = None
+        self._stream = None
+        self._popen = None
+        self._on_subp_terminated()
+
+    # Output batching.
+    # Output is queued, and handed to the GUI at most once per frame, with
+    # adjacent chunks of the same stream merged. If output arrives faster
+    # than it is handed, we stop reading it, so the subprocess blocks on the
+    # full pipe until the GUI catches up.
+    # Objects which arrive while output is pending are queued after it, so
+    # they are handled after the output which was written before them.
+
+    def _reset_output(self):
+        # A list of (name, chunks) pairs, name being 'stdout' or 'stderr',
+        # and of ('object', (req_id, obj)) pairs.
+        self._pending_output = []
+        self._pending_len = 0
+        self._output_paused = False
+        # Chunks may end in the middle of a UTF-8 sequence
+        self._decoders = dict((name, getincrementaldecoder('utf8')('replace'))
+                              for name in ('stdout', 'stderr'))
+
+    def _queue_output(self, name, data):
+        """Queue data read from stdout or stderr."""
+        pending = self._pending_output
+        if pending and pending[-1][0] == name:
+            pending[-1][1].append(data)
+        else:
+            pending.append((name, [data]))
+        self._pending_len += len(data)
+        if self._frame_timer is None:
+            # Nothing was handed in the current frame, so don't wait.
+            self._deliver_output(MAX_FRAME_OUTPUT)
+            self._frame_timer = gobject.timeout_add(OUTPUT_FRAME,
+                                                    self._on_output_frame)
+        if self._pending_len >= OUTPUT_HIGH_WATER and not self._output_paused:
+            self._pause_output()
+
+    def _on_output_frame(self):
+        if not self._pending_output:
+            self._frame_timer = None
+            return False
+        self._deliver_output(MAX_FRAME_OUTPUT)
+        return True
+
+    def _deliver_output(self, limit=None):
+        """
+        Hand pending output to the GUI, and handle the objects queued after
+        it. If limit is given, hand about that many bytes, breaking after a
+        newline if possible.
+        """
+        pending = self._pending_output
+        while pending:
+            name, chunks = pending[0]
+            if name == 'object':
+                del pending[0]
+                self._handle_object(*chunks)
+                continue
+            if limit is not None and limit <= 0:
+                break
+            data = ''.join(chunks)
+            if limit is not None and len(data) > limit:
+                split = data.rfind('\n', 0, limit) + 1 or limit
+                chunks[:] = [data[split:]]
+                data = data[:split]
+            else:
+                del pending[0]
+            self._pending_len -= len(data)
+            if limit is not None:
+                limit -= len(data)
+            text = self._decoders[name].decode(data)
+            if text:
+                if name == 'stdout':
+                    self._on_stdout_recv(text)
+                else:
+                    self._on_stderr_recv(text)
+        if self._output_paused and self._pending_len <= OUTPUT_LOW_WATER:
+            self._resume_output()
+
+    def _pause_output(self):
+        self._output_paused = True
+        for name in 'stdout', 'stderr':
+            if name in self._watches:
+                gobject.source_remove(self._watches.pop(name))
+
+    def _resume_output(self):
+        self._output_paused = False
+        if USE_IO_WATCH and self._popen is not None:
+            self._add_output_watches(self._popen)
+
+    # Event-driven IO, used when available.
+
+    def _add_watches(self, popen):
+        """Let the main loop call us when the subprocess has something."""
+        for f in popen.stdout, popen.stderr:
+            fd = f.fileno()
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._open_pipes = set(['stdout', 'stderr'])
+        self._add_output_watches(popen)
+        cond = gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR
+        self._watches['sock'] = gobject.io_add_watch(
+            self._sock, cond, self._on_sock_ready, popen)
+        self._watches['child'] = gobject.child_watch_add(
+            popen.pid, self._on_child_exit, popen)
+
+    def _add_output_watches(self, popen):
+        cond = gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR
+        for name in self._open_pipes:
+            if name not in self._watches:
+                self._watches[name] = gobject.io_add_watch(
+                    getattr(popen, name), cond, self._on_output_ready,
+                    popen, name)
+
+    def _read_output(self, popen, name):
+        """
+        Read what's available from popen.stdout or popen.stderr, up to
+        MAX_READ bytes, and queue it. If the pipe was closed, stop watching it.
+        """
+        fd = getattr(popen, name).fileno()
+        n_read = 0
+        while n_read < MAX_READ:
             try:
-                obj = recv_object(self._sock)
-            except IOError:
-                # Could happen when subprocess exits. See bug #525358.
-                # We give the subprocess a second. If it shuts down, we ignore
-                # the exception, since on the next round we will handle that.
-                # Otherwise, the exception remains unexplained so we re-raise.
-                time.sleep(1)
-                if popen.poll() is None:
+                r = os.read(fd, READ_SIZE)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.EAGAIN:
                     raise
-            else:
-                self._on_object_recv(obj)
+                break
+            if not r:
+                self._open_pipes.discard(name)
+                if name in self._watches:
+                    gobject.source_remove(self._watches.pop(name))
+                break
+            n_read += len(r)
+            self._queue_output(name, r)
 
+    def _on_output_ready(self, _source, _condition, popen, name):
+        if popen is not self._popen:
+            return False
+        self._read_output(popen, name)
+        # Reading may have closed the pipe or paused the output
+        return name in self._watches
+
+    def _flush_output(self, popen, force=False):
+        """
+        Read output which the watches haven't handled yet, so that output
+        written before an object was sent will be shown before it is handled.
+        While the output is paused nothing is read, unless force is True.
+        """
+        if self._output_paused and not force:
+            return
+        for name in list(self._open_pipes):
+            self._read_output(popen, name)
+
+    def _on_sock_ready(self, _source, _condition, popen):
+        if popen is not self._popen:
+            return False
+        self._flush_output(popen)
+        try:
+            self._recv_objects(popen)
+        except IOError:
+            # The subprocess closed the connection, probably since it is
+            # terminating. The child watch will handle that.
+            if self._popen is popen:
+                del self._watches['sock']
+            return False
         return True
 
-    def send_object(self, obj):
-        """Send an object to the subprocess"""
+    def _on_buffered_objects(self, popen):
+        if popen is self._popen:
+            self._flush_output(popen)
+            try:
+                self._recv_objects(popen)
+            except IOError:
+                # The socket watch will handle this
+                pass
+        return False
+
+    def _on_child_exit(self, _pid, status, popen):
+        if popen.returncode is None:
+            if os.WIFSIGNALED(status):
+                popen.returncode = -os.WTERMSIG(status)
+            else:
+                popen.returncode = os.WEXITSTATUS(status)
+        if popen is self._popen:
+            del self._watches['child']
+            # Get what the subprocess wrote before terminating
+            self._flush_output(popen, force=True)
+            self._handle_termination(popen)
+        return False
+
+    def _check_killed(self, popen):
+        """
+        Called after kill(). kill() may have reaped the process, in which case
+        the child watch won't be called.
+        """
+        if popen.poll() is not None:
+            self._handle_termination(popen)
+        return False
+
+    def _dispatch(self, req_id, obj):
+        """Handle an object which no one is waiting for."""
+        if self._pending_output:
+            # Output which was received before the object should be shown
+            # first. The frame timer is running, since output is pending.
+            self._pending_output.append(('object', (req_id, obj)))
+        else:
+            self._handle_object(req_id, obj)
+
+    def _handle_object(self, req_id, obj):
+        if req_id in self._abandoned:
+            self._abandoned.discard(req_id)
+        elif req_id in self._reply_callbacks:
+            callback = self._reply_callbacks.pop(req_id)
+            callback(obj)
+        else:
+            self._on_object_recv(obj)
+
+    def send_call(self, funcname, args, callback=None):
+        """
+        Send an RPC request to the subprocess and return its id.
+        If callback is given, it will be called with the reply when it
+        arrives. Otherwise, the reply should be received using wait_for_reply,
+        or dropped using abandon.
+        """
         if self._popen is None:
             raise ValueError("Subprocess not living")
-        send_object(self._sock, obj)
+        req_id = self._next_req_id
+        self._next_req_id += 1
+        self._stream.send_object((req_id, funcname, args))
+        if callback is not None:
+            self._reply_callbacks[req_id] = callback
+        return req_id
+
+    def abandon(self, req_id):
+        """
+        Drop the reply of the given request when it arrives.
+        """
+        self._reply_callbacks.pop(req_id, None)
+        self._abandoned.add(req_id)
+
+    def cancel(self, req_id):
+        """
+        Drop the reply of the given request, and tell the subprocess not to
+        handle it if it hasn't started yet.
+        """
+        if self._popen is None:
+            # Nothing will arrive anyway
+            return
+        self.abandon(req_id)
+        self.abandon(self.send_call(u'cancel', (req_id,)))
+
+    def wait_for_reply(self, req_id, timeout_s=None):
+        """
+        Wait for the reply of the given request and return it. Replies to
+        other requests which arrive before it are dispatched.
+        If timeout_s is given and the reply doesn't arrive in time, the request
+        is abandoned and TimeoutError is raised.
+        """
+        if self._popen is None:
+            raise ValueError("Subprocess not living")
+        if timeout_s is not None:
+            end_time = time.time() + timeout_s
+        while True:
+            if timeout_s is not None:
+                remaining = max(end_time - time.time(), 0)
+                if not self.wait_for_object(remaining):
+                    self.abandon(req_id)
+                    raise TimeoutError
+            reply_id, obj = self._stream.recv_object()
+            if reply_id == req_id:
+                if USE_IO_WATCH and self._stream.has_object():
+                    # The socket watch won't be called for objects which
+                    # were already received.
+                    gobject.idle_add(self._on_buffered_objects, self._popen)
+                return obj
+            self._dispatch(reply_id, obj)
 
     def wait_for_object(self, timeout_s):
         """
         Wait for timeout_s seconds or until the socket is ready for reading.
         Return True if an object was received, and False if the timeout expired.
         """
+        if self._stream.has_object():
+            return True
         return len(select([self._sock], [], [], timeout_s)[0]) > 0
     
-    def recv_object(self):
-        """Wait for an object from the subprocess and return it"""
-        if self._popen is None:
-            raise ValueError("Subprocess not living")
-        return recv_object(self._sock)
-
     def write(self, data):
         """Write data to stdin"""
         if self._popen is None:
@@ -255,6 +624,8 @@ class SubprocessHandler(object):
             kernel32.TerminateProcess(handle, -1)
             kernel32.CloseHandle(handle)
         self._last_kill_time = time.time()
+        if USE_IO_WATCH:
+            gobject.idle_add(self._check_killed, self._popen)
 
     def interrupt(self):
         if self._popen is None:
@@ -44,6 +44,15 @@ FOLD_MESSAGE = 'fold-message'
 # The MESSAGE tag
 MESSAGE = 'message'
 
+# Marks the placeholder of sections which were moved to the scrollback archive
+ARCHIVED = 'archived'
+
+# Marks the line after a result which wasn't shown whole
+MORE_RESULT = 'more-result'
+
+# Marks the profile summary of a command
+PROFILE = 'profile'
+
 # Tags for syntax highlighting
 KEYWORD = 'keyword'; BUILTIN = 'builtin'; STRING = 'string'
 NUMBER = 'number'; COMMENT = 'comment'; BRACKET_MATCH = 'bracket-match'
@@ -114,6 +123,22 @@ a "New Session" message or a "History Discarded" message. When you discard
 previous sessions, the MESSAGE tag is used to understand what are the previous
 sessions.
 
+When the scrollback is limited, old sections are moved to an archive file by
+scrollback.py. A line marked with both MESSAGE and ARCHIVED is then placed at
+the beginning of the textbuffer, and double-clicking it brings the most recent
+archived part back.
+
+A result which was too long to be sent whole by the subprocess is followed
+by a line marked with both RESULT_IND and MORE_RESULT, which tells how many
+chars are left. Double-clicking it asks for the next page of the result,
+which is inserted right before the newline which precedes the line (see
+result_pages.py).
+
+If profiling is turned on, the profile summary of a command is written after
+its output, before the prompt, and is marked with both PROFILE and RESULT_IND.
+It isn't marked with OUTPUT, so it's a section of its own, and it is folded
+when it's written, so only its first line, with the times, is visible.
+
 Text marked with OUTPUT was written by output.py. It includes stdout, stderr,
 result and exception. This text is written at the *output mark*, which means
 that if an output is produced after the code execution was finished (for
@@ -219,6 +244,9 @@ def add_tags(textbuffer):
     tag.props.invisible = True
     tag = textbuffer.create_tag(FOLDED)
     tag.props.invisible = True
+    textbuffer.create_tag(ARCHIVED)
+    textbuffer.create_tag(MORE_RESULT)
+    textbuffer.create_tag(PROFILE)
 
 def apply_theme_text(textview, textbuffer, theme):
     """
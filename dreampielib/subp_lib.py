@@ -42,12 +42,18 @@ dirs = [
 files = [
     'dreampielib/__init__.py',
     'dreampielib/subprocess/__init__.py',
+    'dreampielib/subprocess/bounded_repr.py',
+    'dreampielib/subprocess/code_cache.py',
+    'dreampielib/subprocess/exec_profile.py',
     'dreampielib/subprocess/find_modules.py',
+    'dreampielib/subprocess/source_store.py',
     'dreampielib/subprocess/split_to_singles.py',
+    'dreampielib/subprocess/static_eval.py',
     'dreampielib/subprocess/trunc_traceback.py',
     'dreampielib/common/__init__.py',
     'dreampielib/common/objectstream.py',
     'dreampielib/common/brine.py',
+    'dreampielib/common/transport.py',
     ]
 
 lib_fns = {2: 'subp-py2', 3: 'subp-py3'}
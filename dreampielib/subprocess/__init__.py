@@ -20,7 +20,6 @@ import sys
 py3k = (sys.version_info[0] == 3)
 import os
 import time
-import socket
 from select import select
 from StringIO import StringIO
 import linecache
@@ -30,11 +29,14 @@ import keyword
 import __builtin__
 import inspect
 import pydoc
-import pprint
 import codeop
 import signal
+import hashlib
+import re
 from contextlib import contextmanager
 from itertools import chain
+from collections import deque
+from bisect import bisect_left
 try:
     # Executing multiple statements in 'single' mode (print results) is done
     # with the ast module. Python 2.5 doesn't have it, so we use the compiler
@@ -60,9 +62,16 @@ if sys.platform == 'win32':
     PeekNamedPipe = windll.kernel32.PeekNamedPipe #@UndefinedVariable
 
 from .trunc_traceback import trunc_traceback
-from .find_modules import find_modules
+from .find_modules import find_modules, get_mtime, index as module_index
+from .static_eval import static_eval, static_dir, get_attr, Instance, Unknown
+from .bounded_repr import ReprStream
+from .code_cache import cache as code_cache
+from .source_store import store as cell_sources
+from .exec_profile import ExecProfile
 # We don't use relative import because of a Jython 2.5.1 bug.
-from dreampielib.common.objectstream import send_object, recv_object
+from dreampielib.common.objectstream import ObjectStream, get_features
+from dreampielib.common.transport import (
+    connect, TransportUnsupportedError, UNSUPPORTED_MARKER)
 
 #import rpdb2; rpdb2.start_embedded_debugger('a')
 
@@ -75,6 +84,36 @@ GUI_SLEEP = 0.1
 
 # Maximum result string length to transmit
 MAX_RES_STR_LEN = 1000000
+# If the rest of the result string is up to this length, it is counted
+# exactly. Otherwise, its length is estimated.
+MAX_EXACT_REST_LEN = 100000
+# Results which are kept in the result history are sent a page of this
+# length at a time, and the GUI asks for more. Only the last
+# MAX_PAGED_RESULTS are kept for that.
+RES_PAGE_LEN = 20000
+MAX_PAGED_RESULTS = 8
+
+# Maximum number of complete_attributes results to keep between executions
+MAX_ATTR_CACHE = 32
+
+# Completion lists longer than this are kept by the subprocess, and the GUI
+# asks for pages of them. Only the last MAX_PAGED_COMPLETIONS are kept.
+MAX_SENT_COMPLETIONS = 1000
+MAX_PAGED_COMPLETIONS = 8
+
+# Maximum number of call tips to keep
+MAX_DOC_CACHE = 500
+
+# Idle tasks are run for this many seconds at a time, before checking whether
+# a request arrived
+IDLE_SLICE = 0.005
+
+# Maximum number of expressions whose attributes are found after each command
+MAX_PREWARM = 16
+
+# Match dotted names, like "os.path.join"
+dotted_name_re = re.compile(
+    r'[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*')
 
 rpc_funcs = set()
 # A decorator which adds the function name to rpc_funcs
@@ -145,6 +184,50 @@ def is_key_reprable(obj, max_depth=2):
     else:
         return False
 
+def find_prefix_range(L, prefix):
+    """
+    Return (start, end) such that L[start:end] are the items of the sorted
+    list L which start with prefix.
+    """
+    start = bisect_left(L, prefix)
+    l = start
+    r = len(L)
+    while r > l:
+        m = (l + r) // 2
+        if L[m][:len(prefix)] > prefix:
+            r = m
+        else:
+            l = m + 1
+    return start, l
+
+def get_plain_module(modname):
+    """
+    Return the module named modname if it's a plain module, without a
+    __getattr__ hook, so that getting its attributes doesn't run user code.
+    Otherwise, return None.
+    """
+    if type(modname) not in _string_types:
+        return None
+    mod = sys.modules.get(modname)
+    if type(mod) is not types.ModuleType or '__getattr__' in mod.__dict__:
+        return None
+    return mod
+
+def get_module_source(modname):
+    """
+    Return the source file name of the module named modname, or None.
+    This doesn't run user code.
+    """
+    mod = get_plain_module(modname)
+    if mod is None:
+        return None
+    filename = mod.__dict__.get('__file__')
+    if type(filename) not in _string_types:
+        return None
+    if filename[-4:].lower() in ('.pyc', '.pyo'):
+        filename = filename[:-1]
+    return filename
+
 # SIGINT masking
 
 def can_mask_sigint():
@@ -177,9 +260,17 @@ def mask_sigint():
         pass
 
 class Subprocess(object):
-    def __init__(self, port):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect(('localhost', port))
+    def __init__(self, address):
+        try:
+            self.sock = connect(address)
+        except TransportUnsupportedError, e:
+            # Tell the GUI to try another transport
+            sys.stderr.write('%s %s\n' % (UNSUPPORTED_MARKER, e))
+            sys.exit(1)
+        self.stream = ObjectStream(self.sock)
+        # Tell the GUI what we support, and get the options of the connection
+        self.stream.send_object(get_features())
+        self.stream.set_options(self.stream.recv_object())
 
         # Mask SIGINT/Ctrl-C
         mask_sigint()
@@ -188,6 +279,10 @@ class Subprocess(object):
         self.last_res = None
         sys.displayhook = self.displayhook
 
+        # Let linecache find the lines of cells which were dropped from
+        # linecache.cache, to save memory
+        cell_sources.install()
+
         # Trick things like pdb into thinking that the namespace we create is
         # the main module
         mainmodule = types.ModuleType('__main__')
@@ -212,6 +307,7 @@ class Subprocess(object):
         
         # Config
         self.is_pprint = False
+        self.is_profile = False
         self.is_matplotlib_ia_switch = False
         self.is_matplotlib_ia_warn = False
         self.reshist_size = 0
@@ -221,50 +317,154 @@ class Subprocess(object):
         
         # The result history index of the next value to enter the history
         self.reshist_counter = 0
+        
+        # Completions are cached until the namespace changes. ns_version is
+        # increased by namespace_changed(), which is called whenever code is
+        # executed.
+        self.ns_version = 0
+        # A tuple (key, (public, private)), or None
+        self.firstlevels_cache = None
+        # Map (expr, may_eval) to (entity, (public, private))
+        self.attributes_cache = {}
+        # Map a key returned by doc_cache_key to (ident, mtime, doc)
+        self.doc_cache = {}
+        # Long completion lists, see page_completions. Map a handle to a list
+        # [public, private, combined], where combined is the sorted list of
+        # both, built when first needed. paged_handles is oldest first.
+        self.paged_completions = {}
+        self.paged_handles = deque()
+        self.last_paged_handle = 0
+        # Results which weren't sent whole. Map their index in the result
+        # history to the ReprStream from which the rest is read.
+        # paged_results is oldest first.
+        self.result_streams = {}
+        self.paged_results = deque()
+
+        # Requests which were received but not handled yet, and the ids of
+        # those among them which the GUI cancelled
+        self.requests = deque()
+        self.cancelled = set()
+
+        # Generators which do some work each time they are resumed. They are
+        # run in turn when there are no requests. See add_idle_task.
+        self.idle_tasks = deque()
+        # The idle task updating the module index, so that it isn't queued
+        # twice
+        self.module_index_task = None
+        # The idle task filling the completion caches after the last command.
+        # The task of the command before is dropped, since the namespace has
+        # changed since.
+        self.prewarm_task = None
 
         # Run endless loop
         self.loop()
 
+    def recv_request(self):
+        """
+        Receive a request and add it to self.requests. A 'cancel' request is
+        handled immediately, so that the request it cancels will be skipped.
+        """
+        req_id, funcname, args = self.stream.recv_object()
+        if funcname == 'cancel':
+            cancelled_id, = args
+            if any(r[0] == cancelled_id for r in self.requests):
+                self.cancelled.add(cancelled_id)
+            self.stream.send_object((req_id, None))
+        else:
+            self.requests.append((req_id, funcname, args))
+
     def loop(self):
         while True:
-            if not self.idle_paused:
-                self.handle_gui_events(self.sock)
-            funcname, args = recv_object(self.sock)
-            if funcname in rpc_funcs:
+            if not self.requests:
+                if not self.idle_paused:
+                    self.handle_idle()
+                self.recv_request()
+            # Receive the requests which were already sent, so that if one of
+            # them cancels an earlier request, we won't handle it.
+            while (self.stream.has_object()
+                   or select([self.sock], [], [], 0)[0]):
+                self.recv_request()
+            if not self.requests:
+                continue
+            # Every reply is tagged with the id of the request, so that the
+            # GUI can match replies to calls and drop replies it gave up on.
+            req_id, funcname, args = self.requests.popleft()
+            if req_id in self.cancelled:
+                # The GUI has abandoned it, so the reply will be dropped.
+                self.cancelled.discard(req_id)
+                self.stream.send_object((req_id, None))
+            elif funcname in rpc_funcs:
                 func = getattr(self, funcname)
                 try:
                     r = func(*args)
                     if isinstance(r, types.GeneratorType):
                         for obj in r:
-                            send_object(self.sock, obj)
+                            self.stream.send_object((req_id, obj))
                     else:
-                        send_object(self.sock, r)
+                        self.stream.send_object((req_id, r))
                 except Exception:
                     # This may help in debugging exceptions.
                     traceback.print_exc()
-                    send_object(self.sock, None)
+                    self.stream.send_object((req_id, None))
             else:
                 # aid in debug
                 sys.stderr.write("Unknown command: %s\n" % funcname)
-                send_object(self.sock, None)
+                self.stream.send_object((req_id, None))
 
     def displayhook(self, res):
         if res is not None:
             self.last_res = res
 
-    def handle_gui_events(self, sock):
+    def add_idle_task(self, task):
+        """
+        Add a generator to be run when there are no requests. It should do
+        only a bit of work each time it's resumed, so that requests which
+        arrive in the meantime are handled soon.
         """
-        Handle GUI events until there's something to read from sock.
-        If there's no graphic toolkit, just return.
+        self.idle_tasks.append(task)
+
+    def run_idle_tasks(self):
         """
+        Run the idle tasks in turn for IDLE_SLICE seconds, or until all of
+        them are done.
+        """
+        end_time = time.time() + IDLE_SLICE
+        tasks = self.idle_tasks
+        while tasks and time.time() < end_time:
+            task = tasks.popleft()
+            try:
+                task.next()
+            except StopIteration:
+                pass
+            except Exception:
+                # Idle tasks do optional work, so there's no need to bother
+                # the user with it.
+                pass
+            else:
+                tasks.append(task)
+
+    def handle_idle(self):
+        """
+        Run idle tasks and handle GUI events until there's something to read
+        from the socket. If there are no idle tasks and no graphic toolkit,
+        just return.
+        """
+        sock = self.sock
         sock.setblocking(False)
         try:
-            while not select([sock], [], [], 0)[0]:
+            while (not self.stream.has_object()
+                   and not select([sock], [], [], 0)[0]):
+                if self.idle_tasks:
+                    self.run_idle_tasks()
+                    # Only handle the pending GUI events
+                    delay = 0
+                else:
+                    delay = GUI_SLEEP
                 executed = False
                 for handler in self.gui_handlers:
-                    cur_executed = handler.handle_events(GUI_SLEEP)
+                    cur_executed = handler.handle_events(delay)
                     executed = executed or cur_executed
-                if not executed:
+                if not executed and not self.idle_tasks:
                     break
         finally:
             sock.setblocking(True)
@@ -294,7 +494,7 @@ class Subprocess(object):
                 cur_flags |= feature.compiler_flag
         return cur_flags
     
-    def compile_ast(self, source):
+    def compile_ast(self, source, persist=False):
         """
         Compile source into a list of code objects, updating linecache, self.gid
         and self.flags.
@@ -302,13 +502,18 @@ class Subprocess(object):
         Return False, reason on syntax error.
         This version uses the ast module available in Python 2.6 and Jython 2.5.
         This version always returns a list with one item.
+        Code objects are kept in the code cache, and are also saved to files
+        if persist is True.
         """
         filename = '<pyshell#%d>' % self.gid
-        try:
-            a = compile(source, filename, 'exec',
-                        ast.PyCF_ONLY_AST | self.flags)
+        flags = self.flags
+        def make(filename):
+            a = compile(source, filename, 'exec', ast.PyCF_ONLY_AST | flags)
             b = ast.Interactive(a.body)
-            codeob = compile(b, filename, 'single', self.flags)
+            return compile(b, filename, 'single', flags)
+        try:
+            codeob = code_cache.get((source, 'single', str(flags)), filename,
+                                    make, persist)
         except SyntaxError, e:
             # Sometimes lineno or offset are not defined. Zero them in that case.
             lineno = e.lineno if e.lineno is not None else 1
@@ -320,8 +525,7 @@ class Subprocess(object):
             
         # Update gid, linecache, flags
         self.gid += 1
-        lines = [x+'\n' for x in source.split("\n")]
-        linecache.cache[filename] = len(source)+1, None, lines, filename
+        cell_sources.add(filename, source)
         self.flags = self.update_features(self.flags, codeob.co_flags)
         
         return True, [codeob]
@@ -366,8 +570,7 @@ class Subprocess(object):
             # which had no effect
             filename = '<pyshell#%d>' % self.gid
             self.gid += 1
-            lines = [x+'\n' for x in src.split("\n")]
-            linecache.cache[filename] = len(src)+1, None, lines, filename
+            cell_sources.add(filename, src)
             codeob = compile(src, filename, 'single', self.flags)
             self.flags = self.update_features(self.flags, codeob.co_flags)
             codeobs.append(codeob)
@@ -375,39 +578,61 @@ class Subprocess(object):
         return True, codeobs
     
     @staticmethod
-    def safe_pformat(obj):
+    def format_result(obj, is_pprint, length):
         """
-        Use pprint to format an object.
-        In case of an exception, warn and use regular repr instead.
+        Return a tuple (res_str, stream). res_str is the first length chars
+        of the repr of obj, or of its pprint layout if is_pprint, as a
+        unicode string. stream is the ReprStream from which the rest can be
+        read, or None if there is no more.
+        In case of an exception in pprint mode, warn and use regular repr.
         """
+        stream = ReprStream(obj, is_pprint)
         try:
-            return unicode(pprint.pformat(obj))
+            res_str = stream.read(length)
         except:
+            if not is_pprint:
+                raise
             from warnings import warn
             warn('pprint raised an exception, using repr instead. '
                  'To reproduce, run: "from pprint import pprint; pprint(_)"')
-            return unicode(repr(obj))
+            stream = ReprStream(obj, False)
+            res_str = stream.read(length)
+        res_str = unicode(res_str)
+        if stream.at_end():
+            stream = None
+        return res_str, stream
     
     @rpc_func
-    def execute(self, source):
+    def execute(self, source, persist=False):
         """
         Get the source code to execute (a unicode string).
-        Compile it. If there was a syntax error, return
+        Compile it. If persist is True, the code object is saved in the code
+        cache dir, so it isn't compiled again in the next session (this is
+        used for the init code). If there was a syntax error, return
         (False, (msg, line, col)).
         If compilation was successful, return (True, None), then run the code
-        and then send (is_success, res_no, res_str, exception_string, rem_stdin).
+        and then send (is_success, res_no, res_str, res_rest, exception_string,
+        rem_stdin, profile).
         is_success - True if there was no exception.
         res_no - number of the result in the history count, or None if there
                  was no result or there's no history.
         res_str - a string representation of the result.
+        res_rest - None if res_str is the whole string. Otherwise, the result
+                   is in the history and res_str is its first page. res_rest
+                   is then (n_chars, is_exact) for the rest, which can be
+                   read with get_result_page.
         exception_string - description of the exception, or None if is_success.
         rem_stdin - data that was sent into stdin and wasn't consumed.
+        profile - None, or if profiling was turned on with set_profile, a
+                  summary of running the code, as returned by
+                  ExecProfile.summary.
         """
         # pause_idle was called before execute, disable it.
         self.idle_paused = False
+        self.namespace_changed()
         
         if ast:
-            success, r = self.compile_ast(source)
+            success, r = self.compile_ast(source, persist)
         else:
             success, r = self.compile_no_ast(source)
         if not success:
@@ -418,12 +643,22 @@ class Subprocess(object):
         codeobs = r
             
         self.last_res = None
+        if self.is_profile:
+            profile = ExecProfile()
+        else:
+            profile = None
         try:
             unmask_sigint()
             try:
                 # Execute
-                for codeob in codeobs:
-                    exec codeob in self.locs
+                if profile is not None:
+                    profile.start()
+                try:
+                    for codeob in codeobs:
+                        exec codeob in self.locs
+                finally:
+                    if profile is not None:
+                        profile.stop()
                 # Work around http://bugs.python.org/issue8213 - stdout buffered
                 # in Python 3.
                 if not sys.stdout.closed:
@@ -433,16 +668,19 @@ class Subprocess(object):
                 # Convert the result to a string. This is here because exceptions
                 # may be raised here.
                 if self.last_res is not None:
-                    if self.is_pprint:
-                        res_str = self.safe_pformat(self.last_res)
+                    if self.reshist_size > 0:
+                        length = RES_PAGE_LEN
                     else:
-                        res_str = unicode(repr(self.last_res))
-                    if len(res_str) > MAX_RES_STR_LEN:
-                        res_str = (res_str[:MAX_RES_STR_LEN]
-                                   +'\n[%d chars truncated]' % (
-                                        len(res_str)-MAX_RES_STR_LEN))
+                        length = MAX_RES_STR_LEN
+                    res_str, res_stream = self.format_result(
+                        self.last_res, self.is_pprint, length)
+                    if res_stream is not None:
+                        res_rest = res_stream.estimate_rest(
+                            MAX_EXACT_REST_LEN)
+                    else:
+                        res_rest = None
                 else:
-                    res_str = None
+                    res_str = res_stream = res_rest = None
             finally:
                 mask_sigint()
         except:
@@ -454,6 +692,7 @@ class Subprocess(object):
             is_success = False
             res_no = None
             res_str = None
+            res_rest = None
         else:
             is_success = True
             exception_string = None
@@ -461,6 +700,14 @@ class Subprocess(object):
                 res_no = self.store_in_reshist(self.last_res)
             else:
                 res_no = None
+            if res_rest is not None:
+                if res_no is not None:
+                    self.keep_result_stream(res_no, res_stream)
+                else:
+                    n, is_exact = res_rest
+                    res_str += u'\n[%s%d chars truncated]' % (
+                        u'' if is_exact else u'about ', n)
+                    res_rest = None
         # Discard the reference to the result
         self.last_res = None
             
@@ -490,7 +737,64 @@ class Subprocess(object):
         # Check if matplotlib in non-interactive mode was imported
         self.check_matplotlib_ia()
 
-        yield is_success, res_no, res_str, exception_string, rem_stdin
+        if self.prewarm_task in self.idle_tasks:
+            self.idle_tasks.remove(self.prewarm_task)
+        self.prewarm_task = self.prewarm_completions(source)
+        self.add_idle_task(self.prewarm_task)
+
+        # The profile is sent also if there was an exception, since it tells
+        # where an interrupted command spent its time.
+        if profile is not None:
+            profile = profile.summary()
+
+        yield (is_success, res_no, res_str, res_rest, exception_string,
+               rem_stdin, profile)
+
+    def prewarm_completions(self, source):
+        """
+        An idle task which fills the completion caches for the names used in
+        source, since they are likely to be completed again.
+        """
+        yield
+        self.complete_firstlevels()
+        exprs = []
+        for m in dotted_name_re.finditer(source):
+            parts = m.group().split('.')
+            for i in range(1, len(parts)+1):
+                expr = '.'.join(parts[:i])
+                if expr not in exprs:
+                    exprs.append(expr)
+        n_done = 0
+        for expr in exprs:
+            if n_done == MAX_PREWARM:
+                break
+            yield
+            self.get_attributes(expr)
+            n_done += 1
+        # The functions used are likely to be called again, so their call
+        # tips are prepared too.
+        n_done = 0
+        for expr in exprs:
+            if n_done == MAX_PREWARM:
+                break
+            try:
+                obj = static_eval(expr, self.locs)
+            except Unknown:
+                continue
+            if self.can_prewarm_doc(obj):
+                yield
+                # The namespace may have changed while yielding
+                if self.can_prewarm_doc(obj):
+                    self.get_doc(obj, use_pydoc=False)
+                    n_done += 1
+
+    def namespace_changed(self):
+        """Drop the cached completions."""
+        self.ns_version += 1
+        self.firstlevels_cache = None
+        self.attributes_cache.clear()
+        self.paged_completions.clear()
+        self.paged_handles.clear()
 
     @rpc_func
     def pause_idle(self):
@@ -509,6 +813,10 @@ class Subprocess(object):
     def set_pprint(self, is_pprint):
         self.is_pprint = is_pprint
     
+    @rpc_func
+    def set_profile(self, is_profile):
+        self.is_profile = is_profile
+    
     @rpc_func
     def set_matplotlib_ia(self, is_switch, is_warn):
         self.is_matplotlib_ia_switch = is_switch
@@ -520,12 +828,16 @@ class Subprocess(object):
             for i in range(self.reshist_counter-self.reshist_size,
                            self.reshist_counter-new_reshist_size):
                 self.locs.pop('_%d' % i, None)
+                self.drop_result_stream(i)
         self.reshist_size = new_reshist_size
+        self.namespace_changed()
     
     @rpc_func
     def clear_reshist(self):
         for i in range(self.reshist_counter-self.reshist_size, self.reshist_counter):
             self.locs.pop('_%d' % i, None)
+            self.drop_result_stream(i)
+        self.namespace_changed()
 
     def store_in_reshist(self, res):
         """
@@ -549,8 +861,57 @@ class Subprocess(object):
         del_index = self.reshist_counter - self.reshist_size
         if del_index >= 0:
             self.locs.pop('_%d' % del_index, None)
+            self.drop_result_stream(del_index)
         self.reshist_counter += 1
         return res_index
+
+    def keep_result_stream(self, res_no, stream):
+        """
+        Keep the stream of a result which wasn't sent whole, so that the GUI
+        can ask for the rest with get_result_page.
+        """
+        if len(self.paged_results) >= MAX_PAGED_RESULTS:
+            self.drop_result_stream(self.paged_results[0])
+        self.result_streams[res_no] = stream
+        self.paged_results.append(res_no)
+
+    def drop_result_stream(self, res_no):
+        if res_no in self.result_streams:
+            del self.result_streams[res_no]
+            self.paged_results.remove(res_no)
+
+    @rpc_func
+    def get_result_page(self, res_no):
+        """
+        Get the next page of the result with index res_no, which wasn't sent
+        whole by execute. Return a tuple (res_str, res_rest), where res_rest
+        is None if this is the last page, and (n_chars, is_exact) otherwise.
+        Return None if the rest of the result is no longer kept, or if it
+        can't be formatted (for example, if a dict was changed since, or if
+        the user interrupted a slow __repr__ method).
+        """
+        try:
+            stream = self.result_streams[res_no]
+        except KeyError:
+            return None
+        # The stream calls the __repr__ methods of the objects in the result,
+        # so the user may need to interrupt it.
+        try:
+            unmask_sigint()
+            try:
+                res_str = unicode(stream.read(RES_PAGE_LEN))
+                if stream.at_end():
+                    res_rest = None
+                else:
+                    res_rest = stream.estimate_rest(MAX_EXACT_REST_LEN)
+            finally:
+                mask_sigint()
+        except (Exception, KeyboardInterrupt):
+            self.drop_result_stream(res_no)
+            return None
+        if res_rest is None:
+            self.drop_result_stream(res_no)
+        return res_str, res_rest
     
     @staticmethod
     def split_list(L, public_set):
@@ -575,35 +936,145 @@ class Subprocess(object):
                     private.append(x)
         return public, private
 
+    def page_completions(self, public, private):
+        """
+        Return (public, private) if there aren't many completions. Otherwise,
+        keep them, and return (handle, n_public, n_private). The GUI then
+        asks for the completions it shows with get_completion_page.
+        """
+        if len(public) + len(private) <= MAX_SENT_COMPLETIONS:
+            return public, private
+        if len(self.paged_handles) >= MAX_PAGED_COMPLETIONS:
+            del self.paged_completions[self.paged_handles.popleft()]
+        self.last_paged_handle += 1
+        handle = self.last_paged_handle
+        self.paged_completions[handle] = [sorted(public), sorted(private),
+                                          None]
+        self.paged_handles.append(handle)
+        return handle, len(public), len(private)
+
+    @rpc_func
+    def get_completion_page(self, handle, prefix, include_private,
+                            offset, count):
+        """
+        Get a page of the completions which were kept under handle by
+        page_completions, and which start with prefix.
+        If include_private is None, the private completions are included
+        only if no public completion starts with prefix.
+        Return (include_private, n, common, items): n is the number of
+        matching completions, common is their longest common prefix, and
+        items are count of them, starting at offset. Return None if the
+        completions are no longer kept.
+        """
+        try:
+            entry = self.paged_completions[handle]
+        except KeyError:
+            return None
+        if include_private is None:
+            start, end = find_prefix_range(entry[0], prefix)
+            include_private = (start == end)
+        if include_private:
+            if entry[2] is None:
+                entry[2] = sorted(entry[0] + entry[1])
+            L = entry[2]
+        else:
+            L = entry[0]
+        start, end = find_prefix_range(L, prefix)
+        if start == end:
+            return include_private, 0, prefix, []
+        first = L[start]
+        last = L[end-1]
+        i = len(prefix)
+        while i < len(first) and i < len(last) and first[i] == last[i]:
+            i += 1
+        items = L[start+offset:min(start+offset+count, end)]
+        return include_private, end - start, first[:i], items
+
+    def find_object(self, expr, may_eval):
+        """
+        Find what expr refers to, for completions and call tips. It is first
+        found without running any user code (see static_eval), so the result
+        may be an Instance. If it can't be, and may_eval is True, expr is
+        evaluated. Raise Unknown if the object isn't found.
+        """
+        try:
+            return static_eval(expr, self.locs)
+        except Unknown:
+            if not may_eval:
+                raise
+        try:
+            return eval(expr, self.locs)
+        except Exception:
+            raise Unknown
+
     @rpc_func
-    def complete_attributes(self, expr):
+    def complete_attributes(self, expr, may_eval=False):
         """
-        Evaluate expr in the namespace, and return its attributes as two
+        Find the object expr refers to, and return its attributes as two
         sorted lists - public and private.
         public - completions that are thought to be relevant.
         private - completions that are not so.
+        Unless may_eval is True, no user code is run (see find_object), so
+        attributes which are added by __dir__ methods are missed.
+        If there are many of them, they are paged (see page_completions).
+        """
+        return self.page_completions(*self.get_attributes(expr, may_eval))
+
+    def get_attributes(self, expr, may_eval=False):
+        """
+        Return the (public, private) attributes of expr, for
+        complete_attributes.
+        The result is cached until the namespace changes, as long as expr
+        refers to the same object. (Attributes added to it in the meantime,
+        for example by a GUI callback, will be missed.)
         """
         try:
-            entity = eval(expr, self.locs)
-            ids = dir(entity)
+            entity = self.find_object(expr, may_eval)
+        except Unknown:
+            return [], []
+        is_instance = type(entity) is Instance
+        # Instances are created each time, so their class is compared
+        ident = entity.cls if is_instance else entity
+        cached = self.attributes_cache.get((expr, may_eval))
+        if cached is not None and cached[0] is ident:
+            return cached[1]
+        try:
+            if is_instance or not may_eval:
+                ids = static_dir(entity)
+            else:
+                ids = dir(entity)
             ids = map(unicodify, ids)
             ids.sort()
-            if (isinstance(entity, types.ModuleType)
-                and hasattr(entity, '__all__')):
-                all_set = set(entity.__all__)
-            else:
-                all_set = None
+            all_set = None
+            if issubclass(type(entity), types.ModuleType):
+                # A module subclass may define __getattribute__, and __all__
+                # may be of any type, so only a plain list or tuple is used.
+                d = types.ModuleType.__dict__['__dict__'].__get__(entity)
+                if type(d.get('__all__')) in (list, tuple):
+                    all_set = set(x for x in d['__all__']
+                                  if type(x) in _string_types)
             public, private = self.split_list(ids, all_set)
         except Exception:
             public = private = []
 
+        if len(self.attributes_cache) >= MAX_ATTR_CACHE:
+            self.attributes_cache.clear()
+        self.attributes_cache[expr, may_eval] = (ident, (public, private))
         return public, private
 
     @rpc_func
     def complete_firstlevels(self):
         """
         Get (public, private) names (globals, builtins, keywords).
+        The result is cached until the namespace changes. Since names may also
+        be added by GUI callbacks between executions, the number of names is
+        part of the cache key.
         """
+        key = (self.ns_version, len(self.locs), len(__builtin__.__dict__))
+        if self.firstlevels_cache is not None:
+            cached_key, r = self.firstlevels_cache
+            if cached_key == key:
+                return r
         namespace = self.locs.copy()
         namespace.update(__builtin__.__dict__)
         ids = eval("dir()", namespace) + keyword.kwlist
@@ -615,14 +1086,15 @@ class Subprocess(object):
             all_set = None
         public, private = self.split_list(ids, all_set)
         
+        self.firstlevels_cache = (key, (public, private))
         return public, private
         
     @rpc_func
     def get_func_args(self, expr):
         """Return the argument names of the function (a list of strings)"""
         try:
-            obj = eval(expr, self.locs)
-        except Exception:
+            obj = self.find_object(expr, False)
+        except Unknown:
             return None
         try:
             if not py3k:
@@ -652,16 +1124,17 @@ class Subprocess(object):
                 return repr(str(x))
     
     @rpc_func
-    def complete_dict_keys(self, expr):
+    def complete_dict_keys(self, expr, may_eval=False):
         """
         Return the reprs of the dict's keys (a list of strings)
         Returns only those which have a simple-enough repr.
+        expr is evaluated only if may_eval is True (see find_object).
         """
         try:
-            obj = eval(expr, self.locs)
-        except Exception:
+            obj = self.find_object(expr, may_eval)
+        except Unknown:
             return None
-        if not isinstance(obj, dict) or len(obj) > 1000:
+        if type(obj) is not dict or len(obj) > 1000:
             return None
         return sorted(unicodify(self.dict_key_repr(x)) for x in obj if is_key_reprable(x))
         
@@ -673,7 +1146,35 @@ class Subprocess(object):
         else:
             package = []
         return [unicodify(s) for s in find_modules(package)]
+
+    @rpc_func
+    def index_modules(self, dirname):
+        """
+        Keep the index of the importable modules in a file in the given dir,
+        and update it in idle time.
+        """
+        # The names of extension modules depend on the interpreter
+        key = hashlib.md5((sys.executable + sys.version).encode('utf8'))
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        except OSError:
+            pass
+        else:
+            module_index.use_file(
+                os.path.join(dirname, 'modules-%s' % key.hexdigest()[:16]))
+        if self.module_index_task not in self.idle_tasks:
+            self.module_index_task = module_index.update_steps()
+            self.add_idle_task(self.module_index_task)
     
+    @rpc_func
+    def use_code_cache(self, dirname):
+        """
+        Save the code objects of the init code and of run files in the
+        given dir, so that they won't be compiled again.
+        """
+        code_cache.use_dir(dirname)
+
     @rpc_func
     def get_module_members(self, mod_name):
         try:
@@ -685,7 +1186,7 @@ class Subprocess(object):
         else:
             all_set = None
         ids = [unicodify(x) for x in mod.__dict__.iterkeys()]
-        return self.split_list(ids, all_set)
+        return self.page_completions(*self.split_list(ids, all_set))
     
     @rpc_func
     def complete_filenames(self, str_prefix, text, str_char, add_quote):
@@ -792,12 +1293,114 @@ class Subprocess(object):
         return None
 
     @rpc_func
-    def get_func_doc(self, expr):
-        """Get a string describing the arguments for the given object"""
+    def get_func_doc(self, expr, may_eval=False):
+        """
+        Get a string describing the arguments for the given object.
+        expr is evaluated only if may_eval is True (see find_object).
+        """
         try:
-            obj = eval(expr, self.locs)
-        except Exception:
+            obj = self.find_object(expr, may_eval)
+        except Unknown:
+            return None
+        if type(obj) is Instance:
+            return None
+        return self.get_doc(obj)
+
+    @staticmethod
+    def doc_cache_key(obj):
+        """
+        Return (key, ident, filename) for caching the call tip of obj, or None
+        if it isn't cached. The key is the code object for functions and
+        methods, and (module, name) for classes. ident is the function or
+        class, which the cached call tip must be of, and filename is the
+        source file, whose mtime must not change.
+        This doesn't run user code, so it can be called in idle time.
+        """
+        if type(obj) is types.MethodType:
+            obj = obj.im_func
+        if type(obj) is types.FunctionType:
+            code = obj.func_code
+            return code, obj, code.co_filename
+        if type(obj) is types.ClassType:
+            modname = obj.__dict__.get('__module__')
+            name = obj.__name__
+        elif issubclass(type(obj), type):
+            # Use type's descriptors, so that the metaclass can't interfere
+            modname = type.__dict__['__module__'].__get__(obj)
+            name = type.__dict__.get('__qualname__',
+                                     type.__dict__['__name__']).__get__(obj)
+        else:
+            return None
+        if type(modname) not in _string_types:
             return None
+        return (modname, name), obj, get_module_source(modname)
+
+    @staticmethod
+    def can_prewarm_doc(obj):
+        """
+        Check whether the call tip of obj can be made in idle time, when
+        user code mustn't run since SIGINT is masked. This is so for plain
+        functions and classes without a metaclass, whose source is found
+        using inspect (pydoc gets any attribute, so it isn't used for them.)
+        """
+        if type(obj) is types.FunctionType:
+            modname = obj.__module__
+        elif type(obj) in (type, types.ClassType):
+            modname = obj.__dict__.get('__module__')
+        else:
+            return False
+        mod = get_plain_module(modname)
+        if mod is None:
+            return False
+        # make_doc uses the module attribute of the same name, for decorated
+        # functions
+        obj = mod.__dict__.get(obj.__name__, obj)
+        if type(obj) is types.FunctionType:
+            __doc__ = obj.__doc__
+            if __doc__ is None:
+                return True
+            return (type(__doc__) in _string_types
+                    and __doc__ in obj.func_code.co_consts)
+        elif type(obj) in (type, types.ClassType):
+            # type's __doc__ descriptor calls the __get__ of the class __doc__
+            d = obj.__dict__
+            return (get_plain_module(d.get('__module__')) is not None
+                    and type(d.get('__doc__')) in _string_types + (type(None),))
+        else:
+            return False
+
+    def get_doc(self, obj, use_pydoc=True):
+        """
+        Return the call tip of obj, made by make_doc. Call tips of
+        functions and classes are cached, until they are redefined or their
+        source file changes.
+        If use_pydoc is False, return None and cache nothing if the source
+        of obj can't be found.
+        """
+        r = self.doc_cache_key(obj)
+        if r is None:
+            return self.make_doc(obj, use_pydoc)
+        key, ident, filename = r
+        mtime = get_mtime(filename) if filename else None
+        cached = self.doc_cache.get(key)
+        if cached is not None and cached[0] is ident:
+            if cached[1] == mtime:
+                return cached[2]
+            # The source was changed, and linecache may have the old lines
+            linecache.checkcache(filename)
+        doc = self.make_doc(obj, use_pydoc)
+        if doc is None and not use_pydoc:
+            return None
+        if len(self.doc_cache) >= MAX_DOC_CACHE:
+            self.doc_cache.clear()
+        self.doc_cache[key] = (ident, mtime, doc)
+        return doc
+
+    def make_doc(self, obj, use_pydoc=True):
+        """
+        Make the call tip of obj: its source or its documentation.
+        If use_pydoc is False, return None instead of pydoc's documentation.
+        """
         if isinstance(obj, (types.BuiltinFunctionType,
                             types.BuiltinMethodType)):
             # These don't have source code, and using pydoc will only
@@ -833,12 +1436,16 @@ class Subprocess(object):
         if co_consts is not None and __doc__ is not None:
             if __doc__ not in co_consts:
                 # Return pydoc's documentation
+                if not use_pydoc:
+                    return None
                 return unicodify(textdoc.document(obj).strip())
         
         try:
             source = inspect.getsource(obj)
         except (TypeError, IOError):
             # If can't get the source, return pydoc's documentation
+            if not use_pydoc:
+                return None
             return unicodify(textdoc.document(obj).strip())
         else:
             # If we can get the source, return it.
@@ -858,14 +1465,20 @@ class Subprocess(object):
         Also checks whether obj.__expects_str__ is True, which means that
         the expected argument is a string so quotes will be added.
         Returns (is_callable_only, expects_str)
+        No user code is run (see find_object).
         """
         try:
-            obj = eval(what, self.locs)
-        except Exception:
+            obj = self.find_object(what, False)
+        except Unknown:
+            return False, False
+        if type(obj) is Instance:
             return False, False
         typ = type(obj)
         
-        expects_str = bool(getattr(obj, '__expects_str__', False))
+        try:
+            expects_str = bool(get_attr(obj, '__expects_str__'))
+        except Unknown:
+            expects_str = False
         
         # Check cache
         try:
@@ -873,8 +1486,9 @@ class Subprocess(object):
         except KeyError:
             pass
         
+        names = set(static_dir(obj))
         r = (callable(obj)
-             and not any(hasattr(obj, att) for att in operator_methods))
+             and not any(att in names for att in operator_methods))
         
         is_callable_cache[id(typ)] = r
         return r, expects_str
@@ -1043,5 +1657,5 @@ class TkHandler(GuiHandler):
         time.sleep(delay)
         return True
 
-def main(port):
-    _subp = Subprocess(port)
+def main(address):
+    _subp = Subprocess(address)
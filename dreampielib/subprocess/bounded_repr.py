@@ -0,0 +1,383 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Make the repr of an object, or its pprint layout, a piece at a time, so that
+only as much of it as is shown is made. The repr of a list with 10**8 items
+is never made as a whole - only its beginning is read, and the length of the
+rest is estimated.
+
+Lists, tuples, dicts, sets and frozensets (but not subclasses with their own
+__repr__) and long strings are formatted by ReprStream. The reprs of other
+objects are made by repr().
+"""
+
+__all__ = ['ReprStream']
+
+import sys
+
+py3k = (sys.version_info[0] == 3)
+
+# Containers with more items than this aren't sorted by pformat, since only
+# their beginning is shown anyway.
+MAX_SORTED = 100000
+
+# Strings longer than this are formatted a piece of this size at a time
+STR_PIECE_LEN = 4096
+
+# The number of items of a list or a tuple which are formatted to estimate
+# the length of those not read, and the number of chars read of each
+N_SAMPLES = 16
+SAMPLE_LEN = 1000
+
+# pprint splits a container into lines if its repr is longer than the width
+# minus the indentation, the allowance for the closing brackets after it, and
+# this margin.
+_WIDTH_MARGIN = 0 if py3k else 1
+
+# Task kinds
+_OBJ, _LITERAL, _STR_PIECE, _NEXT = range(4)
+
+def _get_brackets(obj):
+    """
+    If obj is a container formatted by ReprStream, return (open, close)
+    for its repr. Otherwise, return None.
+    """
+    typ = type(obj)
+    r = typ.__repr__
+    if issubclass(typ, list) and r is list.__repr__:
+        return '[', ']'
+    if issubclass(typ, tuple) and r is tuple.__repr__:
+        return '(', ')'
+    if issubclass(typ, dict) and r is dict.__repr__:
+        return '{', '}'
+    if not ((issubclass(typ, set) and r is set.__repr__) or
+            (issubclass(typ, frozenset) and r is frozenset.__repr__)):
+        return None
+    if py3k:
+        if typ is set:
+            return '{', '}'
+        return typ.__name__ + '({', '})'
+    return typ.__name__ + '([', '])'
+
+def _empty_repr(obj, brackets):
+    if isinstance(obj, (set, frozenset)):
+        if py3k:
+            return type(obj).__name__ + '()'
+        return type(obj).__name__ + '([])'
+    return brackets[0] + brackets[1]
+
+def _str_quote(s):
+    # The quote which repr(s) uses
+    if "'" in s and '"' not in s:
+        return '"'
+    return "'"
+
+def _piece_repr(piece, quote):
+    # The repr of piece without the prefix and the quotes, as part of the
+    # repr of a string which uses quote. Chars are escaped one by one, so
+    # only the quote needs care: the suffix makes repr use the same quote.
+    if quote == '"':
+        r = repr(piece + "'")
+        start = r.index('"') + 1
+        return r[start:-2]
+    else:
+        r = repr(piece + '\'"')
+        start = r.index("'") + 1
+        return r[start:-4]
+
+class _Frame(object):
+    """A container which is being formatted."""
+    __slots__ = ['obj', 'obj_id', 'it', 'n', 'i', 'is_dict', 'sep', 'close',
+                 'indent', 'allowance', 'start', 'item_start']
+
+class ReprStream(object):
+    """
+    Read the repr of obj, or its pprint layout if is_pprint is True. Then
+    dicts are sorted, and containers which don't fit in width chars are
+    split into lines, like pprint.pformat does.
+
+    read(n) returns the next n chars. at_end() tells whether all of them
+    were read, and estimate_rest() returns the number of chars left.
+
+    Containers are formatted with an explicit stack, so deeply nested ones
+    don't raise a RuntimeError as repr() does.
+    """
+    def __init__(self, obj, is_pprint=False, width=80, sort_dicts=None,
+                 active=None, long_recursion=None, sort_sets=None):
+        self.is_pprint = is_pprint
+        self.width = width
+        self.sort_dicts = is_pprint if sort_dicts is None else sort_dicts
+        # pprint sorts sets which are split into lines. In Python 2, it also
+        # sorts those which fit in one line.
+        self.sort_sets = is_pprint if sort_sets is None else sort_sets
+        # Whether recursion is shown with the id of the container, as pprint
+        # does. The streams used for parts of a pprint layout do it too.
+        self.long_recursion = (is_pprint if long_recursion is None
+                               else long_recursion)
+        # The ids of the containers being formatted, to find recursion. It
+        # is shared with the streams used for parts of a pprint layout.
+        self.active = set() if active is None else active
+        self.stack = []
+        # The number of chars made
+        self.pos = 0
+        # The chars made and not read yet
+        self.buf = ''
+        # The number of chars not made yet of a long string
+        self.str_rest = 0
+        self.it = self._iter(obj)
+        self.ended = False
+
+    def _next_chunk(self):
+        # Return the next chunk, or None if there are no more
+        if self.ended:
+            return None
+        try:
+            return next(self.it)
+        except StopIteration:
+            self.ended = True
+            self.close()
+            return None
+
+    def read(self, n):
+        """Return the next n chars, or less if they end before."""
+        chunks = [self.buf]
+        length = len(self.buf)
+        while length < n:
+            s = self._next_chunk()
+            if s is None:
+                break
+            chunks.append(s)
+            length += len(s)
+        s = ''.join(chunks)
+        self.buf = s[n:]
+        return s[:n]
+
+    def at_end(self):
+        """Return True if all the chars were read."""
+        while not self.buf:
+            s = self._next_chunk()
+            if s is None:
+                return True
+            self.buf = s
+        return False
+
+    def estimate_rest(self, max_exact=0):
+        """
+        Return a tuple (n_chars, is_exact) for the chars which were not read
+        yet. If they are up to max_exact chars, they are made and counted.
+        Otherwise, the length of the items of a container which weren't
+        formatted yet is estimated by the average length of some of them,
+        for lists and tuples, and of those which were formatted, for others.
+        """
+        chunks = [self.buf]
+        length = len(self.buf)
+        while length <= max_exact:
+            s = self._next_chunk()
+            if s is None:
+                break
+            chunks.append(s)
+            length += len(s)
+        self.buf = ''.join(chunks)
+        if self.at_end():
+            return 0, True
+        if self.ended:
+            return len(self.buf), True
+        is_exact = not self.stack and not self.str_rest
+        # The number of chars left in the item being formatted
+        rest = self.str_rest
+        for f in reversed(self.stack):
+            if f.i < f.n and isinstance(f.obj, (list, tuple)):
+                avg = self._sample_len(f) + len(f.sep)
+            else:
+                item_len = self.pos - f.item_start + rest
+                avg = float(f.item_start - f.start + item_len) / max(f.i, 1)
+            rest += int(avg * (f.n - f.i)) + len(f.close)
+        return len(self.buf) + rest, is_exact
+
+    def _sample_len(self, f):
+        # The average length of items of f which weren't formatted yet
+        n_left = f.n - f.i
+        step = max(n_left // N_SAMPLES, 1)
+        total = 0
+        n = 0
+        for i in range(f.i, f.n, step)[:N_SAMPLES]:
+            sub = ReprStream(f.obj[i], False, active=self.active,
+                             long_recursion=self.long_recursion)
+            total += len(sub.read(SAMPLE_LEN))
+            if not sub.at_end():
+                total += sub.estimate_rest()[0]
+            sub.close()
+            n += 1
+        return float(total) / n
+
+    def close(self):
+        """Stop formatting, so that parts of obj aren't seen as recursion."""
+        for f in self.stack:
+            self.active.discard(f.obj_id)
+        del self.stack[:]
+        self.ended = True
+
+    # Making the chars
+
+    def _one_line(self, obj, avail):
+        # Return the repr of obj if it's up to avail chars, otherwise None
+        if avail < 2:
+            return None
+        sub = ReprStream(obj, False, sort_dicts=self.sort_dicts,
+                         active=self.active,
+                         long_recursion=self.long_recursion,
+                         sort_sets=self.sort_sets and not py3k)
+        s = sub.read(avail + 1)
+        sub.close()
+        if len(s) > avail:
+            return None
+        return s
+
+    def _recursion(self, obj, brackets):
+        if self.long_recursion:
+            return '<Recursion on %s with id=%s>' % (type(obj).__name__,
+                                                     id(obj))
+        return brackets[0] + '...' + brackets[1]
+
+    def _iter(self, obj):
+        # Yield the chunks of the repr
+        stack = self.stack
+        active = self.active
+        todo = [(_OBJ, obj, 0, 0)]
+        while todo:
+            task = todo.pop()
+            kind = task[0]
+            if kind == _LITERAL:
+                s = task[1]
+            elif kind == _STR_PIECE:
+                _kind, obj, offset, quote = task
+                end = offset + STR_PIECE_LEN
+                s = _piece_repr(obj[offset:end], quote)
+                if end < len(obj):
+                    todo.append((_STR_PIECE, obj, end, quote))
+                    self.str_rest = len(obj) - end
+                else:
+                    s += quote
+                    self.str_rest = 0
+            elif kind == _OBJ:
+                _kind, obj, indent, allowance = task
+                brackets = _get_brackets(obj)
+                if brackets is None:
+                    if (isinstance(obj, basestring)
+                        and len(obj) > STR_PIECE_LEN):
+                        quote = _str_quote(obj)
+                        s = repr(obj[:0])[:-2] + quote
+                        todo.append((_STR_PIECE, obj, 0, quote))
+                    else:
+                        s = repr(obj)
+                elif id(obj) in active:
+                    s = self._recursion(obj, brackets)
+                elif not obj:
+                    s = _empty_repr(obj, brackets)
+                else:
+                    s = None
+                    if self.is_pprint:
+                        s = self._one_line(
+                            obj,
+                            self.width - _WIDTH_MARGIN - indent - allowance)
+                    if s is None:
+                        s = brackets[0]
+                        f = self._push(obj, brackets, indent, allowance)
+                        f.start = f.item_start = self.pos + len(s)
+                        todo.append((_NEXT, f))
+            else:
+                f = task[1]
+                try:
+                    item = next(f.it)
+                except StopIteration:
+                    stack.pop()
+                    active.discard(f.obj_id)
+                    s = f.close
+                else:
+                    todo.append(task)
+                    s = f.sep if f.i else ''
+                    f.i += 1
+                    f.item_start = self.pos + len(s)
+                    if not f.is_dict:
+                        todo.append((_OBJ, item, f.indent,
+                                     self._item_allowance(f)))
+                    elif not self.is_pprint:
+                        key, value = item
+                        todo.append((_OBJ, value, 0, 0))
+                        todo.append((_LITERAL, ': '))
+                        todo.append((_OBJ, key, 0, 0))
+                    else:
+                        # The value is indented by the length of the key
+                        key, value = item
+                        sub = ReprStream(key, False,
+                                         sort_dicts=self.sort_dicts,
+                                         active=active,
+                                         long_recursion=self.long_recursion,
+                                         sort_sets=self.sort_sets and not py3k)
+                        key_repr = sub.read(self.width)
+                        if not sub.at_end():
+                            key_repr += sub.read(sys.maxsize)
+                        todo.append((_OBJ, value,
+                                     f.indent + len(key_repr) + 2,
+                                     self._item_allowance(f)))
+                        s += key_repr + ': '
+                    if not s:
+                        continue
+            self.pos += len(s)
+            yield s
+
+    def _item_allowance(self, f):
+        # The allowance of the item of f which was just started. In Python 3,
+        # pprint leaves room for the closing brackets only after the last
+        # item, and for a comma after the others.
+        if py3k and f.i < f.n:
+            return 1
+        return f.allowance
+
+    def _push(self, obj, brackets, indent, allowance):
+        # Start formatting the items of a container
+        f = _Frame()
+        f.obj = obj
+        f.obj_id = id(obj)
+        self.active.add(f.obj_id)
+        f.n = len(obj)
+        f.i = 0
+        f.is_dict = isinstance(obj, dict)
+        items = obj.iteritems() if f.is_dict else obj
+        is_set = isinstance(obj, (set, frozenset))
+        if (f.n <= MAX_SORTED and
+            ((f.is_dict and self.sort_dicts) or (is_set and self.sort_sets))):
+            try:
+                items = sorted(items)
+            except TypeError:
+                items = obj.iteritems() if f.is_dict else obj
+        f.it = iter(items)
+        f.close = brackets[1]
+        if isinstance(obj, tuple) and f.n == 1:
+            f.close = ',' + f.close
+        f.indent = indent + len(brackets[0])
+        if py3k:
+            f.allowance = allowance + len(f.close)
+        else:
+            f.allowance = allowance + 1
+        if self.is_pprint:
+            f.sep = ',\n' + ' ' * f.indent
+        else:
+            f.sep = ', '
+        self.stack.append(f)
+        return f
@@ -0,0 +1,183 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Keep the code objects compiled from sources, so that running the same source
+again doesn't compile it again. Code objects are kept in memory, and those
+of the init code and of run files are also saved to files, so that they
+aren't compiled again when DreamPie is started again.
+"""
+
+__all__ = ['CodeCache', 'cache', 'run_file', 'rename_code']
+
+import sys
+import os
+from os.path import join, exists
+import types
+import marshal
+import hashlib
+from collections import deque
+
+# The number of code objects kept in memory, and in files
+MAX_CACHED = 100
+MAX_SAVED = 50
+
+# The version of the marshal format depends on the interpreter
+_interp_key = sys.executable + sys.version
+
+def rename_code(co, filename):
+    """
+    Return a copy of the code object co, and of the code objects in it, with
+    co_filename set to filename.
+    """
+    consts = tuple(rename_code(c, filename)
+                   if isinstance(c, types.CodeType) else c
+                   for c in co.co_consts)
+    if hasattr(co, 'replace'):
+        # Python 3.8 and up
+        return co.replace(co_filename=filename, co_consts=consts)
+    args = [co.co_argcount, co.co_nlocals, co.co_stacksize, co.co_flags,
+            co.co_code, consts, co.co_names, co.co_varnames, filename,
+            co.co_name, co.co_firstlineno, co.co_lnotab, co.co_freevars,
+            co.co_cellvars]
+    if hasattr(co, 'co_kwonlyargcount'):
+        args.insert(1, co.co_kwonlyargcount)
+    return types.CodeType(*args)
+
+def _hash(*parts):
+    h = hashlib.md5(_interp_key.encode('utf8'))
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf8')
+        h.update(('%d:' % len(part)).encode('ascii'))
+        h.update(part)
+    return h.hexdigest()
+
+class CodeCache(object):
+    """
+    Map a key, made of the source and of everything else which affects the
+    compilation, to a code object. The last MAX_CACHED code objects used are
+    kept in memory. After use_dir() is called, code objects which are
+    compiled with persist=True are also saved to files in that dir.
+    """
+    def __init__(self):
+        self.dirname = None
+        self.codeobs = {}
+        # The keys of self.codeobs, least recently used first
+        self.keys = deque()
+
+    def use_dir(self, dirname):
+        """Save and load the code objects of persistent sources in dirname."""
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        except OSError:
+            return
+        self.dirname = dirname
+
+    def get(self, key_parts, filename, make, persist=False):
+        """
+        Return the code object compiled from a source, with its filename set
+        to filename. key_parts is a tuple of strings which determine the
+        code object - the source, the mode and the flags. If it isn't known,
+        make(filename) is called to compile it. It may raise SyntaxError.
+        """
+        key = _hash(*key_parts)
+        codeob = self.codeobs.get(key)
+        if codeob is not None:
+            self.keys.remove(key)
+            self.keys.append(key)
+            if codeob.co_filename != filename:
+                codeob = rename_code(codeob, filename)
+            return codeob
+        if persist:
+            codeob = self._load(key)
+            if codeob is not None and codeob.co_filename != filename:
+                codeob = rename_code(codeob, filename)
+        if codeob is None:
+            codeob = make(filename)
+            if persist:
+                self._save(key, codeob)
+        if len(self.keys) >= MAX_CACHED:
+            del self.codeobs[self.keys.popleft()]
+        self.codeobs[key] = codeob
+        self.keys.append(key)
+        return codeob
+
+    def _load(self, key):
+        if self.dirname is None:
+            return None
+        try:
+            f = open(join(self.dirname, key), 'rb')
+            try:
+                codeob = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(codeob, types.CodeType):
+            return None
+        return codeob
+
+    def _save(self, key, codeob):
+        if self.dirname is None:
+            return
+        # Write to a temporary file and rename it, so that other subprocesses
+        # won't read a half written file.
+        fn = join(self.dirname, key)
+        tmp_fn = '%s.%d' % (fn, os.getpid())
+        try:
+            f = open(tmp_fn, 'wb')
+            try:
+                marshal.dump(codeob, f)
+            finally:
+                f.close()
+            if sys.platform == 'win32' and exists(fn):
+                os.remove(fn)
+            os.rename(tmp_fn, fn)
+            self._remove_old()
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _remove_old(self):
+        # Keep only the MAX_SAVED most recently saved files
+        fns = [join(self.dirname, fn) for fn in os.listdir(self.dirname)]
+        if len(fns) <= MAX_SAVED:
+            return
+        fns.sort(key=os.path.getmtime)
+        for fn in fns[:-MAX_SAVED]:
+            os.remove(fn)
+
+cache = CodeCache()
+
+def run_file(filename, namespace):
+    """
+    Run the file filename in namespace, like exec(open(filename).read())
+    does, but without compiling it again if it didn't change.
+    The run file given to DreamPie is run by this.
+    """
+    f = open(filename, 'rb')
+    try:
+        source = f.read()
+    finally:
+        f.close()
+    # Let compile() find the encoding, but make the newlines like those of
+    # a file opened in text mode.
+    source = source.replace('\r\n'.encode('ascii'), '\n'.encode('ascii'))
+    make = lambda fn: compile(source, fn, 'exec', 0, True)
+    codeob = cache.get((source, 'exec'), filename, make, persist=True)
+    exec codeob in namespace
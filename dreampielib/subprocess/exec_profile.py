@@ -0,0 +1,179 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the execution of a command: profile it with cProfile, and measure
+the wall time, the CPU time and the growth of the peak memory use.
+"""
+
+__all__ = ['ExecProfile']
+
+import sys
+import os
+import time
+from os.path import basename, splitext
+
+try:
+    import cProfile
+except ImportError:
+    # Jython and IronPython don't have it
+    cProfile = None
+
+try:
+    # Python 3.4 and up
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if sys.platform == 'win32':
+    from ctypes import Structure, byref, sizeof, c_size_t, c_ulong, windll
+
+    class _PROCESS_MEMORY_COUNTERS(Structure):
+        _fields_ = [('cb', c_ulong),
+                    ('PageFaultCount', c_ulong),
+                    ('PeakWorkingSetSize', c_size_t),
+                    ('WorkingSetSize', c_size_t),
+                    ('QuotaPeakPagedPoolUsage', c_size_t),
+                    ('QuotaPagedPoolUsage', c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', c_size_t),
+                    ('QuotaNonPagedPoolUsage', c_size_t),
+                    ('PagefileUsage', c_size_t),
+                    ('PeakPagefileUsage', c_size_t)]
+
+# The number of functions sent, those with the largest cumulative time
+N_TOP_FUNCS = 20
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+def _max_rss():
+    # Return the peak memory use of the process in bytes, or None if it
+    # isn't known.
+    if resource is not None:
+        # ru_maxrss is in kilobytes, except on OS X, where it's in bytes
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            rss *= 1024
+        return rss
+    if sys.platform == 'win32':
+        counters = _PROCESS_MEMORY_COUNTERS()
+        counters.cb = sizeof(counters)
+        if windll.psapi.GetProcessMemoryInfo(
+            windll.kernel32.GetCurrentProcess(), byref(counters),
+            counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+def _is_own(key):
+    # Is this a function of the profiler, or the exec builtin which runs
+    # the command? Those aren't interesting.
+    filename, _lineno, funcname = key
+    if filename == '~':
+        return ('_lsprof.Profiler' in funcname
+                or funcname in ('<built-in method exec>',
+                                '<built-in method builtins.exec>'))
+    return splitext(filename)[0] == splitext(__file__)[0]
+
+def _func_desc(key):
+    # Like pstats.func_std_string, with the base name of the file
+    filename, lineno, funcname = key
+    if filename == '~':
+        # A builtin, whose name is like "<method 'append' of 'list' objects>"
+        return funcname
+    return '%s:%d(%s)' % (basename(filename), lineno, funcname)
+
+class ExecProfile(object):
+    """
+    Call start() before running a command and stop() after it, even if it
+    raised an exception. Then summary() returns what was measured.
+
+    The memory is measured by tracemalloc if the user started it, since
+    starting it makes the command several times slower. Otherwise, the
+    growth of the peak memory use of the process is measured, which is zero
+    if the command used less memory than the process used before.
+    """
+    def __init__(self):
+        self.profiler = None
+        self.wall = self.cpu = 0.0
+        # 'peak' if tracemalloc measures the memory, 'rss' if the peak
+        # memory use of the process does
+        self.mem_kind = None
+        self.mem_start = self.mem_delta = 0
+
+    def start(self):
+        if (tracemalloc is not None and tracemalloc.is_tracing()
+            and hasattr(tracemalloc, 'reset_peak')):
+            # reset_peak was added in Python 3.9
+            tracemalloc.reset_peak()
+            self.mem_kind = 'peak'
+            self.mem_start = tracemalloc.get_traced_memory()[0]
+        else:
+            self.mem_start = _max_rss()
+            if self.mem_start is not None:
+                self.mem_kind = 'rss'
+        if cProfile is not None:
+            self.profiler = cProfile.Profile()
+        self.wall = time.time()
+        self.cpu = _cpu_time()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.cpu = _cpu_time() - self.cpu
+        self.wall = time.time() - self.wall
+        if self.mem_kind == 'peak':
+            self.mem_delta = (tracemalloc.get_traced_memory()[1]
+                              - self.mem_start)
+        elif self.mem_kind == 'rss':
+            self.mem_delta = _max_rss() - self.mem_start
+
+    def summary(self):
+        """
+        Return a tuple (wall, cpu, mem_kind, mem_delta, funcs).
+        wall and cpu are the times in seconds.
+        mem_kind is u'peak' if mem_delta is the growth of the memory
+        allocated by Python, as traced by tracemalloc, u'rss' if it's the
+        growth of the peak memory use of the process, and None if it isn't
+        known. mem_delta is in bytes.
+        funcs is a tuple of (desc, ncalls, tottime, cumtime) for the functions
+        with the largest cumulative time, or None if there's no profiler.
+        """
+        funcs = None
+        if self.profiler is not None:
+            self.profiler.create_stats()
+            stats = [(ct, key, nc, tt)
+                     for key, (_cc, nc, tt, ct, _callers)
+                     in self.profiler.stats.items()
+                     if not _is_own(key)]
+            stats.sort(reverse=True)
+            funcs = []
+            for ct, key, nc, tt in stats[:N_TOP_FUNCS]:
+                desc = _func_desc(key)
+                if not isinstance(desc, unicode):
+                    desc = desc.decode('utf8', 'replace')
+                funcs.append((desc, nc, tt, ct))
+            funcs = tuple(funcs)
+        mem_kind = unicode(self.mem_kind) if self.mem_kind else None
+        return (self.wall, self.cpu, mem_kind, int(self.mem_delta), funcs)
@@ -15,6 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
 
+"""
+Find the modules which can be imported, for completing import statements.
+
+The modules in each dir are kept in a ModuleIndex, together with the mtime of
+the dir, so a dir is only listed again if it changed. The index can be built
+in idle time and saved to a file, so that the first completion after the
+subprocess starts doesn't have to list anything.
+"""
+
 import sys
 import os
 from os.path import join, isdir, exists
@@ -22,54 +31,224 @@ import stat
 import imp
 import re
 import time
+import marshal
+import zipfile
 
-TIMEOUT = 1 # Stop after 1 second
+TIMEOUT = 1 # Stop listing dirs which aren't in the index after 1 second
 
 # Match any of the suffixes
 suffix_re = re.compile(
     r'(?:%s)$' % '|'.join(re.escape(suffix[0]) for suffix in imp.get_suffixes()))
 
-# A mapping from absolute names to (mtime, module_names) tuple.
-cache = {}
+# Increase when the format of the index file changes
+INDEX_VERSION = 1
 
-def find_in_dir(dirname):
+def list_dir(dirname):
     """
-    Yield all names of modules in the given dir.
+    Return a tuple (modules, packages) with the names of the modules in the
+    given dir, and those of them which are packages.
     """
     if dirname == '':
         dirname = '.'
     try:
         basenames = os.listdir(dirname)
     except OSError:
-        return
+        return [], []
+    modules = []
+    packages = []
     for basename in basenames:
         m = suffix_re.search(basename)
         if m:
-            yield basename[:m.start()]
+            modules.append(basename[:m.start()])
         else:
             if '.' not in basename and isdir(join(dirname, basename)):
                 init = join(dirname, basename, '__init__.py')
                 if exists(init) or exists(init+'c'):
-                    yield basename    
+                    modules.append(basename)
+                    packages.append(basename)
+    return modules, packages
 
-def find_in_dir_cached(dirname):
-    if dirname not in cache:
-        # If it is in cache, it's already absolute.
-        dirname = os.path.abspath(dirname)
+def list_zip(filename):
+    """
+    Return a dict which maps the names of the packages in the given zip file
+    ('' for the toplevel) to lists of the names of their modules.
+    """
+    z = zipfile.ZipFile(filename)
     try:
-        st = os.stat(dirname)
-    except OSError:
-        return ()
-    if not stat.S_ISDIR(st.st_mode):
-        return ()
+        names = z.namelist()
+    finally:
+        z.close()
+    found = {}
+    for name in names:
+        parts = name.split('/')
+        m = suffix_re.search(parts[-1])
+        if m:
+            package = '.'.join(parts[:-1])
+            found.setdefault(package, set()).add(parts[-1][:m.start()])
+    # Only dirs with an __init__ module are packages
+    r = {'': set()}
+    for package, modules in found.items():
+        if package == '' or '__init__' in modules:
+            r[package] = modules
+    for package in list(r):
+        if package:
+            parent, _dot, name = package.rpartition('.')
+            if parent in r:
+                r[parent].add(name)
+    return dict((package, sorted(modules - set(['__init__'])))
+                for package, modules in r.items())
+
+def get_mtime(filename):
+    """Return the mtime of a file, or None if it doesn't exist."""
     try:
-        mtime, modules = cache[dirname]
-    except KeyError:
-        mtime = 0
-    if mtime != st.st_mtime:
-        modules = list(find_in_dir(dirname))
-        cache[dirname] = (st.st_mtime, modules)
-    return modules
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+class ModuleIndex(object):
+    """
+    Keep the names of the modules in dirs and zip files.
+
+    dirs maps an absolute dir name to (mtime, modules, packages), as returned
+    by list_dir. zips maps a zip file name to (mtime, packages), as returned
+    by list_zip. An entry is used only if the mtime didn't change.
+
+    update() lists all the dirs and zip files in sys.path whose mtime changed,
+    and the packages in them. update_steps() does the same in small steps,
+    so that it can be run in idle time. It builds new dicts and replaces the
+    old ones when it's done, so the index can be used in the meantime.
+    After use_file() is called, updating also saves the index to a file.
+    """
+    def __init__(self):
+        self.filename = None
+        self.dirs = {}
+        self.zips = {}
+        self.updating = False
+
+    def use_file(self, filename):
+        """
+        Load the index from the given file, and save it there when updated.
+        Since the names of extension modules depend on the interpreter, each
+        interpreter should use its own file.
+        """
+        self.filename = filename
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                version, dirs, zips = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return
+        if version == INDEX_VERSION:
+            self.dirs, self.zips = dirs, zips
+
+    def save(self):
+        if self.filename is None:
+            return
+        # Write to a temporary file and rename it, so that other subprocesses
+        # won't read a half written file.
+        tmp_fn = '%s.%d' % (self.filename, os.getpid())
+        try:
+            f = open(tmp_fn, 'wb')
+            try:
+                marshal.dump((INDEX_VERSION, self.dirs, self.zips), f)
+            finally:
+                f.close()
+            if sys.platform == 'win32' and exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp_fn, self.filename)
+        except (IOError, OSError):
+            pass
+
+    def get_dir(self, dirname):
+        """
+        Return a list of the modules in the given dir, listing it if it isn't
+        in the index or if it changed.
+        """
+        dirname = os.path.abspath(dirname)
+        try:
+            st = os.stat(dirname)
+        except OSError:
+            return []
+        if not stat.S_ISDIR(st.st_mode):
+            return []
+        entry = self.dirs.get(dirname)
+        if entry is None or entry[0] != st.st_mtime:
+            modules, packages = list_dir(dirname)
+            entry = self.dirs[dirname] = (st.st_mtime, modules, packages)
+        return entry[1]
+
+    def get_zip(self, filename, package):
+        """
+        Return a list of the modules in the given package in a zip file, if
+        the zip file is in the index and didn't change, and None otherwise.
+        """
+        entry = self.zips.get(filename)
+        if entry is None or entry[0] != get_mtime(filename):
+            return None
+        return entry[1].get('.'.join(package), [])
+
+    def update_steps(self):
+        """
+        Update the index with all the dirs and zip files in sys.path and the
+        packages in them, and save it. This is a generator, which yields after
+        listing each dir or zip file, so it can be run in idle time.
+        """
+        self.updating = True
+        try:
+            dirs = {}
+            zips = {}
+            # The real paths of the listed dirs, so that symlinks won't make
+            # us loop forever
+            seen = set()
+            for entry in list(sys.path):
+                entry = os.path.abspath(entry or '.')
+                try:
+                    st = os.stat(entry)
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    todo = [(entry, st.st_mtime)]
+                    while todo:
+                        dirname, mtime = todo.pop()
+                        realpath = os.path.realpath(dirname)
+                        if realpath in seen:
+                            continue
+                        seen.add(realpath)
+                        dir_entry = self.dirs.get(dirname)
+                        if dir_entry is None or dir_entry[0] != mtime:
+                            modules, packages = list_dir(dirname)
+                            dir_entry = (mtime, modules, packages)
+                        dirs[dirname] = dir_entry
+                        for package in dir_entry[2]:
+                            package_dir = join(dirname, package)
+                            package_mtime = get_mtime(package_dir)
+                            if package_mtime is not None:
+                                todo.append((package_dir, package_mtime))
+                        yield
+                elif (entry in self.zips
+                      and self.zips[entry][0] == st.st_mtime):
+                    zips[entry] = self.zips[entry]
+                elif zipfile.is_zipfile(entry):
+                    try:
+                        zips[entry] = (st.st_mtime, list_zip(entry))
+                    except (IOError, zipfile.BadZipfile):
+                        pass
+                    yield
+            self.dirs = dirs
+            self.zips = zips
+            self.save()
+        finally:
+            self.updating = False
+
+    def update(self):
+        """Update the index at once."""
+        for _step in self.update_steps():
+            pass
+
+# The index used by find_modules
+index = ModuleIndex()
 
 def find_package_path(package):
     """
@@ -107,10 +286,14 @@ def find_modules(package):
     """
     start_time = time.time()
     r = set()
+    for entry in sys.path:
+        modules = index.get_zip(os.path.abspath(entry or '.'), package)
+        if modules is not None:
+            r.update(modules)
     path = find_package_path(package)
     if path:
         for dirname in path:
-            r.update(find_in_dir_cached(dirname))
+            r.update(index.get_dir(dirname))
             if time.time() - start_time > TIMEOUT:
                 break
     prefix = ''.join(s+'.' for s in package)
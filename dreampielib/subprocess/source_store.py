@@ -0,0 +1,181 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Keep the sources of the executed cells for linecache, so that tracebacks and
+inspect can show their lines, without keeping all of them in memory in long
+sessions.
+"""
+
+__all__ = ['SourceStore', 'store']
+
+import linecache
+import tempfile
+
+# The number of source chars kept in memory. When there are more, the least
+# recently used sources are dropped until this fraction of it is left.
+MAX_MEM_CHARS = 1000000
+KEEP_FRACTION = 0.75
+
+# The maximum size of the file. When it gets larger, the least recently used
+# sources are forgotten until KEEP_FRACTION of it is left, and the file is
+# rewritten.
+MAX_FILE_BYTES = 50 * 1024 * 1024
+
+class SourceStore(object):
+    """
+    Keep the sources of cells, which have made up filenames like
+    '<pyshell#5>'. Every source is also written to a temporary file, and
+    only the recently used ones are kept in memory (and in linecache.cache),
+    up to MAX_MEM_CHARS chars. Others are read from the file when linecache
+    is asked for them. The file is kept up to MAX_FILE_BYTES bytes, so the
+    sources of very old cells may be forgotten.
+    """
+    def __init__(self):
+        self._file = None
+        # Map a filename to the (offset, length) of its source in the file
+        self.offsets = {}
+        # The size of the file, and the number of its bytes which are of
+        # sources in offsets. The others are of replaced sources.
+        self.file_bytes = 0
+        self.live_bytes = 0
+        # Map a filename to the lines kept in memory, and to their size
+        self.lines = {}
+        self.sizes = {}
+        # Map a filename in lines or in offsets to a counter of when it was
+        # last used
+        self.last_used = {}
+        self.counter = 0
+        self.n_chars = 0
+        self._orig_getlines = linecache.getlines
+
+    def install(self):
+        """
+        Make linecache.getlines get the lines of sources which aren't kept
+        in memory from the file.
+        """
+        self._orig_getlines = linecache.getlines
+        linecache.getlines = self.getlines
+
+    def add(self, filename, source):
+        """
+        Keep the source (a unicode string) of the cell filename. If it can't
+        be written to the file, it's always kept in memory.
+        """
+        try:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(
+                    prefix='dreampie-sources-')
+            f = self._file
+            f.seek(0, 2)
+            offset = f.tell()
+            f.write(source.encode('utf8'))
+            self.file_bytes = f.tell()
+        except (IOError, OSError):
+            pass
+        else:
+            if filename in self.offsets:
+                self.live_bytes -= self.offsets[filename][1]
+            self.offsets[filename] = (offset, self.file_bytes - offset)
+            self.live_bytes += self.file_bytes - offset
+        self._keep(filename, source)
+        if self.file_bytes > MAX_FILE_BYTES:
+            self._compact(filename)
+
+    def _keep(self, filename, source):
+        lines = [x+'\n' for x in source.split("\n")]
+        size = len(source)+1
+        self.lines[filename] = lines
+        self.sizes[filename] = size
+        self.counter += 1
+        self.last_used[filename] = self.counter
+        self.n_chars += size
+        linecache.cache[filename] = size, None, lines, filename
+        if self.n_chars > MAX_MEM_CHARS:
+            self._drop_old(filename)
+
+    def _forget(self, filename):
+        # Drop the source from memory
+        self.n_chars -= self.sizes.pop(filename)
+        del self.lines[filename]
+        linecache.cache.pop(filename, None)
+
+    def _drop_old(self, keep_filename):
+        # Drop the least recently used sources from memory
+        limit = int(MAX_MEM_CHARS * KEEP_FRACTION)
+        filenames = sorted(self.lines, key=self.last_used.__getitem__)
+        for filename in filenames:
+            if self.n_chars <= limit:
+                break
+            if filename == keep_filename or filename not in self.offsets:
+                continue
+            self._forget(filename)
+
+    def _compact(self, keep_filename):
+        # Forget the least recently used sources, and rewrite the file
+        # without them and without the replaced sources
+        limit = int(MAX_FILE_BYTES * KEEP_FRACTION)
+        filenames = sorted(self.offsets, key=self.last_used.__getitem__)
+        for filename in filenames:
+            if self.live_bytes <= limit:
+                break
+            if filename == keep_filename:
+                continue
+            self.live_bytes -= self.offsets.pop(filename)[1]
+            del self.last_used[filename]
+            if filename in self.lines:
+                self._forget(filename)
+        old_f = self._file
+        offsets = {}
+        try:
+            f = tempfile.TemporaryFile(prefix='dreampie-sources-')
+            for filename, (offset, length) in self.offsets.iteritems():
+                old_f.seek(offset)
+                offsets[filename] = (f.tell(), length)
+                f.write(old_f.read(length))
+        except (IOError, OSError):
+            # Keep the old file. It will be compacted with the next source.
+            return
+        old_f.close()
+        self._file = f
+        self.offsets = offsets
+        self.file_bytes = self.live_bytes
+
+    def getlines(self, filename, module_globals=None):
+        """A replacement of linecache.getlines."""
+        if filename in self.lines:
+            self.counter += 1
+            self.last_used[filename] = self.counter
+            lines = self.lines[filename]
+            if filename not in linecache.cache:
+                # linecache.clearcache() was called
+                linecache.cache[filename] = (
+                    self.sizes[filename], None, lines, filename)
+            return lines
+        if filename in self.offsets:
+            offset, length = self.offsets[filename]
+            f = self._file
+            try:
+                f.seek(offset)
+                source = f.read(length).decode('utf8')
+            except (IOError, OSError, ValueError):
+                return []
+            self._keep(filename, source)
+            return self.lines[filename]
+        return self._orig_getlines(filename, module_globals)
+
+store = SourceStore()
@@ -0,0 +1,275 @@
+# Copyright 2010 Noam Yorav-Raphael
+#
+# This file is part of DreamPie.
+#
+# DreamPie is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DreamPie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DreamPie.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Find what an expression refers to, and its attributes, without running code
+which may be defined by the user - no properties, __getattr__ or __dir__
+methods, and no calls except to classes, whose result is only known by its
+class. This is used for completions, which shouldn't hang the subprocess or
+have side effects.
+"""
+
+__all__ = ['static_eval', 'static_dir', 'Instance', 'Unknown']
+
+import re
+import types
+import inspect
+import __builtin__
+try:
+    import ast
+except ImportError:
+    ast = None
+
+class Unknown(Exception):
+    """Raised when an expression can't be evaluated without running code."""
+    pass
+
+class Instance(object):
+    """An instance of cls, which wasn't created."""
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __repr__(self):
+        return '<Instance of %r>' % (self.cls,)
+
+InstanceType = getattr(types, 'InstanceType', None)
+ClassTypes = (type, types.ClassType)
+
+# The __get__ of these descriptors is implemented in C by Python itself
+_builtin_descriptors = (
+    types.FunctionType, staticmethod, classmethod, property,
+    types.GetSetDescriptorType, types.MemberDescriptorType,
+    type(str.join), type(object.__init__), type(dict.__dict__['fromkeys']))
+# The data descriptors among them whose value isn't computed by user code
+# (property calls its getter)
+_builtin_data_descriptors = (types.GetSetDescriptorType,
+                             types.MemberDescriptorType)
+
+_dotted_name_re = re.compile(
+    r'^[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+def _is(obj, classes):
+    # Like isinstance, but doesn't look at obj.__class__, which may be a
+    # property
+    return issubclass(type(obj), classes)
+
+def get_class(obj):
+    """Return the class of obj, also if it's an old-style instance."""
+    if InstanceType is not None and type(obj) is InstanceType:
+        return obj.__class__
+    return type(obj)
+
+def _get_mro(cls):
+    if _is(cls, type):
+        # Use type's descriptor, since the metaclass may define
+        # __getattribute__
+        return type.__dict__['__mro__'].__get__(cls)
+    # Attributes of old-style classes are found by Python itself
+    return inspect.getmro(cls)
+
+def _get_dict(obj):
+    # Get the __dict__ of a class or a module, which may be of a subclass
+    # defining __getattribute__
+    if _is(obj, type):
+        return type.__dict__['__dict__'].__get__(obj)
+    elif _is(obj, types.ModuleType):
+        return types.ModuleType.__dict__['__dict__'].__get__(obj)
+    return obj.__dict__
+
+def _lookup(cls, name):
+    """
+    Look for name in the dicts of cls and its bases. Return a tuple
+    (found, value).
+    """
+    for base in _get_mro(cls):
+        d = _get_dict(base)
+        if name in d:
+            return True, d[name]
+    return False, None
+
+def _get_instance_dict(obj, cls):
+    """Return the __dict__ of obj, or None if it doesn't have a plain one."""
+    if InstanceType is not None and type(obj) is InstanceType:
+        return obj.__dict__
+    found, descr = _lookup(cls, '__dict__')
+    if found and _is(descr, types.GetSetDescriptorType):
+        d = descr.__get__(obj, cls)
+        if _is(d, dict):
+            return d
+    return None
+
+def _is_data_descriptor(x):
+    typ = type(x)
+    return (_lookup(typ, '__get__')[0]
+            and (_lookup(typ, '__set__')[0] or _lookup(typ, '__delete__')[0]))
+
+def _has_get(x):
+    return _lookup(type(x), '__get__')[0]
+
+def _get_class_attr(cls, name):
+    # Get an attribute of a class, like cls.name would
+    if not _is(cls, type):
+        # An old-style class
+        found, x = _lookup(cls, name)
+        if not found:
+            raise Unknown
+        if _is(x, _builtin_descriptors):
+            return x.__get__(None, cls)
+        return x
+    meta = type(cls)
+    meta_found, meta_x = _lookup(meta, name)
+    if meta_found and _is_data_descriptor(meta_x):
+        if _is(meta_x, _builtin_data_descriptors):
+            return meta_x.__get__(cls, meta)
+        raise Unknown
+    found, x = _lookup(cls, name)
+    if found:
+        if not _has_get(x):
+            return x
+        if _is(x, _builtin_descriptors):
+            return x.__get__(None, cls)
+        raise Unknown
+    if meta_found:
+        if not _has_get(meta_x):
+            return meta_x
+        if _is(meta_x, _builtin_descriptors):
+            return meta_x.__get__(cls, meta)
+    raise Unknown
+
+def _get_instance_attr(obj, cls, name):
+    # Get an attribute of an instance of cls. obj is the instance, or None
+    # if only its class is known.
+    found, x = _lookup(cls, name)
+    if found and _is_data_descriptor(x):
+        if obj is not None and _is(x, _builtin_data_descriptors):
+            return x.__get__(obj, cls)
+        raise Unknown
+    if obj is not None:
+        d = _get_instance_dict(obj, cls)
+        if d is not None and name in d:
+            return d[name]
+    if not found:
+        raise Unknown
+    if not _has_get(x):
+        return x
+    if _is(x, _builtin_descriptors):
+        # Without the instance, methods are found as they are in the class
+        return x.__get__(obj, cls)
+    raise Unknown
+
+def get_attr(value, name):
+    """
+    Return value.name (value may be an Instance), if it can be found without
+    running user code. Otherwise, raise Unknown.
+    """
+    if _is(value, Instance):
+        return _get_instance_attr(None, value.cls, name)
+    elif _is(value, types.ModuleType):
+        try:
+            return _get_dict(value)[name]
+        except KeyError:
+            raise Unknown
+    elif _is(value, ClassTypes):
+        return _get_class_attr(value, name)
+    else:
+        return _get_instance_attr(value, get_class(value), name)
+
+def _get_name(name, namespace):
+    try:
+        return namespace[name]
+    except KeyError:
+        try:
+            return __builtin__.__dict__[name]
+        except KeyError:
+            raise Unknown
+
+if ast is not None:
+    _literal_types = {ast.List: list, ast.Tuple: tuple, ast.Dict: dict,
+                      ast.ListComp: list,
+                      ast.GeneratorExp: types.GeneratorType}
+    for _name, _type in [('Set', set), ('SetComp', set), ('DictComp', dict)]:
+        if hasattr(ast, _name):
+            _literal_types[getattr(ast, _name)] = _type
+    del _name, _type
+    _const_nodes = tuple(getattr(ast, name)
+                         for name in ('Constant', 'Str', 'Bytes', 'Num')
+                         if hasattr(ast, name))
+
+def _eval_node(node, namespace):
+    if isinstance(node, ast.Name):
+        return _get_name(node.id, namespace)
+    elif isinstance(node, ast.Attribute):
+        return get_attr(_eval_node(node.value, namespace), node.attr)
+    elif isinstance(node, ast.Call):
+        func = _eval_node(node.func, namespace)
+        if _is(func, ClassTypes):
+            return Instance(func)
+        raise Unknown
+    elif isinstance(node, _const_nodes):
+        for field in ('value', 's', 'n'):
+            if hasattr(node, field):
+                return Instance(type(getattr(node, field)))
+        raise Unknown
+    else:
+        try:
+            return Instance(_literal_types[type(node)])
+        except KeyError:
+            raise Unknown
+
+def static_eval(expr, namespace):
+    """
+    Find what expr refers to in namespace, without running code which may
+    be defined by the user. Return the object, or an Instance if only its
+    class is known. Raise Unknown if it can't be found.
+    """
+    if ast is None:
+        # Only handle dotted names
+        if not _dotted_name_re.match(expr):
+            raise Unknown
+        parts = expr.split('.')
+        value = _get_name(parts[0], namespace)
+        for name in parts[1:]:
+            value = get_attr(value, name)
+        return value
+    try:
+        node = compile(expr, '<expr>', 'eval', ast.PyCF_ONLY_AST).body
+    except (SyntaxError, ValueError, TypeError):
+        raise Unknown
+    return _eval_node(node, namespace)
+
+def static_dir(value):
+    """
+    Return the attribute names of value (which may be an Instance), like
+    dir() but without calling __dir__ or __getattr__ methods.
+    """
+    if _is(value, types.ModuleType):
+        return list(_get_dict(value))
+    if _is(value, Instance):
+        cls = value.cls
+        d = None
+    elif _is(value, ClassTypes):
+        cls = value
+        d = None
+    else:
+        cls = get_class(value)
+        d = _get_instance_dict(value, cls)
+    names = set()
+    if d is not None:
+        names.update(d)
+    for base in _get_mro(cls):
+        names.update(_get_dict(base))
+    return [x for x in names if _is(x, basestring)]
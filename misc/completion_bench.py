@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# Measure how long the completion popup takes to update when a char is typed,
+# for lists of different lengths. The rows are shown with the CompletionModel
+# used by the popup, and, for comparison, by refilling a gtk.ListStore, as
+# was done before. The time includes drawing the treeview. An update should
+# take less than one frame (16 ms).
+# Run from the source directory: python misc/completion_bench.py [sizes...]
+
+import sys
+from os.path import dirname, abspath
+import time
+from bisect import bisect_left
+
+import gobject
+import gtk
+
+# Import the module directly, so that the whole GUI isn't loaded
+sys.path.insert(0, dirname(dirname(abspath(__file__))) + '/dreampielib/gui')
+from completion_model import CompletionModel
+sys.path.insert(0, dirname(abspath(__file__)))
+from fuzzy_bench import make_candidates
+
+FRAME_MS = 16
+N_ROWS = 10
+REPEAT = 3
+# The text typed, char by char, after showing the whole list
+QUERY = 'reshape'
+
+def prefix_range(L, prefix):
+    # Like find_prefix_range
+    start = bisect_left(L, prefix)
+    end = start
+    while end < len(L) and L[end].startswith(prefix):
+        end += 1
+    return start, end
+
+def make_treeview(model):
+    cellrend = gtk.CellRendererText()
+    cellrend.props.ypad = 0
+    col = gtk.TreeViewColumn('col', cellrend, text=0)
+    col.props.sizing = gtk.TREE_VIEW_COLUMN_FIXED
+    tv = gtk.TreeView(model)
+    tv.props.headers_visible = False
+    tv.append_column(col)
+    tv.props.fixed_height_mode = True
+    cellrend.props.text = 'a_quite_lengthy_identifier'
+    _, _, width, height = cellrend.get_size(tv, None)
+    tv.set_size_request(width, (height+2)*N_ROWS)
+    sw = gtk.ScrolledWindow()
+    sw.props.hscrollbar_policy = gtk.POLICY_NEVER
+    sw.props.vscrollbar_policy = gtk.POLICY_ALWAYS
+    sw.add(tv)
+    window = gtk.Window(gtk.WINDOW_POPUP)
+    window.add(sw)
+    window.show_all()
+    return window, tv
+
+def flush():
+    while gtk.events_pending():
+        gtk.main_iteration(False)
+
+def show_with_model(tv, model, L, start, end):
+    tv.set_model(None)
+    model.set_rows(L, start, end)
+    tv.set_model(model)
+    tv.get_selection().select_path(0)
+    tv.scroll_to_cell((0,))
+
+def show_with_liststore(tv, liststore, L, start, end):
+    liststore.clear()
+    for i, s in enumerate(L[start:end]):
+        liststore.insert(i, [s])
+    tv.get_selection().select_path(0)
+    tv.scroll_to_cell((0,))
+
+def time_typing(L, make_model, show):
+    """
+    Show the whole list, and then type QUERY. Return the time of showing the
+    whole list and of the slowest keystroke, in ms.
+    """
+    model = make_model()
+    window, tv = make_treeview(model)
+    flush()
+    times = []
+    for i in range(len(QUERY) + 1):
+        start, end = prefix_range(L, QUERY[:i])
+        if start == end:
+            break
+        t0 = time.time()
+        show(tv, model, L, start, end)
+        flush()
+        times.append((time.time() - t0) * 1000)
+    window.destroy()
+    flush()
+    return times[0], max(times[1:])
+
+def main():
+    if len(sys.argv) > 1:
+        sizes = [int(x) for x in sys.argv[1:]]
+    else:
+        sizes = [100, 1000, 10000, 50000]
+    print '%8s %12s %12s %12s %12s' % ('rows', 'model all', 'model key',
+                                       'store all', 'store key')
+    worst = 0
+    for n in sizes:
+        L = make_candidates(n)
+        r = []
+        for make_model, show in [
+            (CompletionModel, show_with_model),
+            (lambda: gtk.ListStore(gobject.TYPE_STRING), show_with_liststore)]:
+            results = [time_typing(L, make_model, show)
+                       for _rep in range(REPEAT)]
+            r.extend([min(t[0] for t in results), min(t[1] for t in results)])
+        worst = max(worst, r[0], r[1])
+        print '%8d %12.2f %12.2f %12.2f %12.2f' % tuple([n] + r)
+    print 'Slowest update with CompletionModel: %.2f ms (%s)' % (
+        worst, 'OK' if worst < FRAME_MS else 'more than a frame')
+
+if __name__ == '__main__':
+    main()
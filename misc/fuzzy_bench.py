@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Measure the time the fuzzy completion matcher takes per keystroke, on a
+# list of generated identifiers. A keystroke should take less than one frame
+# (16 ms). Each query is typed several times, with a new matcher, and the
+# fastest time of each keystroke is taken, to reduce the noise.
+# Run from the source directory: python misc/fuzzy_bench.py [n_candidates]
+
+import sys
+from os.path import dirname, abspath
+import time
+import random
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+# Import the module directly, so that gtk isn't needed
+sys.path.insert(0, dirname(dirname(abspath(__file__))) + '/dreampielib/gui')
+from fuzzy_match import FuzzyMatcher
+
+FRAME_MS = 16
+REPEAT = 5
+
+WORDS = ['array', 'get', 'set', 'value', 'index', 'matrix', 'linalg', 'fft',
+         'random', 'sum', 'mean', 'axis', 'dtype', 'shape', 'reshape', 'item',
+         'float', 'int', 'complex', 'string', 'buffer', 'copy', 'view', 'sort',
+         'search', 'sorted', 'count', 'nonzero', 'where', 'take', 'put']
+
+def make_candidates(n):
+    random.seed(0)
+    names = set()
+    while len(names) < n:
+        words = random.sample(WORDS, random.randint(1, 3))
+        style = random.random()
+        if style < 0.5:
+            name = '_'.join(words)
+        elif style < 0.8:
+            name = words[0] + ''.join(w.capitalize() for w in words[1:])
+        else:
+            name = ''.join(w.capitalize() for w in words)
+        if random.random() < 0.3:
+            name += str(random.randint(0, 999))
+        if random.random() < 0.1:
+            name = '_' + name
+        names.add(unicode(name))
+    return sorted(names)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    candidates = make_candidates(n)
+    t0 = time.time()
+    matcher = FuzzyMatcher(candidates)
+    print 'Preparing %d candidates: %.1f ms' % (n, (time.time() - t0) * 1000)
+    print '%-16s %8s %10s %10s' % ('query', 'shown', 'last ms', 'worst ms')
+    worst = 0
+    for query in ['gvi', 'getValueIndex', 'rs', 'reshape_ax', 'lnf', 'xyz',
+                  'SrtCnt', 'a']:
+        # Type the query char by char, like the completion window does
+        times = [[] for _i in range(len(query))]
+        for _rep in range(REPEAT):
+            matcher = FuzzyMatcher(candidates)
+            for i in range(1, len(query) + 1):
+                t0 = time.time()
+                r = matcher.match(query[:i])
+                times[i-1].append((time.time() - t0) * 1000)
+        times = [min(t) for t in times]
+        elapsed = times[-1]
+        query_worst = max(times)
+        worst = max(worst, query_worst)
+        print '%-16s %8d %10.2f %10.2f' % (query, len(r), elapsed, query_worst)
+    print 'Slowest keystroke: %.2f ms (%s)' % (
+        worst, 'OK' if worst < FRAME_MS else 'more than a frame')
+
+if __name__ == '__main__':
+    main()
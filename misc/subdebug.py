@@ -50,6 +50,11 @@ def main():
     sock, addr = s.accept()
     debug("Connected to addr %r!" % (addr,))
     s.close()
+    # The subprocess sends its features, and we reply with the options of
+    # the connection. We use the defaults.
+    features = recv_object(sock)
+    debug("Subprocess features: %r" % (features,))
+    send_object(sock, ())
 
     # Start the play
     while True:
@@ -69,6 +74,8 @@ def main():
             line = sys.stdin.readline()
             if not line:
                 break
+            # Requests are (req_id, funcname, args) tuples, for example
+            # (0, 'execute', (u'1+1',))
             obj = eval(line)
             send_object(sock, obj)
 
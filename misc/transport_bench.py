@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Measure the startup time and the RPC round-trip time of the subprocess
+# for each of the transports in dreampielib.common.transport.
+# Run from the source directory: python misc/transport_bench.py [executable]
+
+import sys
+import os
+from os.path import join, dirname, abspath
+import time
+from subprocess import Popen, PIPE
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from dreampielib.common.objectstream import ObjectStream
+from dreampielib.common.transport import (
+    make_listener, default_transports, TRANSPORTS)
+from dreampielib.subp_lib import build
+
+N_STARTS = 10
+N_CALLS = 2000
+
+def start(executable, script, transport_name):
+    """
+    Start a subprocess using the given transport, and wait until it sends
+    its features. Return (popen, stream).
+    """
+    listener = make_listener(transport_name)
+    devnull = open(os.devnull, 'w')
+    try:
+        popen = Popen([executable, '-S', script, listener.address],
+                      stdin=PIPE, stdout=devnull, stderr=devnull)
+    finally:
+        listener.child_started()
+        devnull.close()
+    sock = None
+    while sock is None:
+        sock = listener.accept(1)
+        if popen.poll() is not None:
+            raise IOError("Subprocess terminated with rc %r"
+                          % popen.returncode)
+    listener.close()
+    stream = ObjectStream(sock)
+    stream.recv_object()
+    stream.send_object(())
+    return popen, stream
+
+def stop(popen, stream):
+    stream.sock.close()
+    popen.stdin.close()
+    popen.kill()
+    popen.wait()
+
+def bench(executable, script, transport_name):
+    start_times = []
+    for _i in range(N_STARTS):
+        t0 = time.time()
+        popen, stream = start(executable, script, transport_name)
+        start_times.append(time.time() - t0)
+        stop(popen, stream)
+
+    popen, stream = start(executable, script, transport_name)
+    t0 = time.time()
+    for req_id in xrange(N_CALLS):
+        stream.send_object((req_id, u'set_pprint', (True,)))
+        while True:
+            # Skip the idle-time events the subprocess might send
+            reply_id, _obj = stream.recv_object()
+            if reply_id == req_id:
+                break
+    rtt = (time.time() - t0) / N_CALLS
+    stop(popen, stream)
+    return min(start_times), sum(start_times) / len(start_times), rtt
+
+def main():
+    executable = sys.argv[1] if len(sys.argv) > 1 else sys.executable
+    build()
+    script = join(dirname(dirname(abspath(__file__))),
+                  'dreampielib', 'data', 'subp_main.py')
+    print 'Default transports: %s' % ', '.join(default_transports())
+    print '%-12s %14s %14s %10s' % (
+        'transport', 'min start ms', 'avg start ms', 'RTT us')
+    for name in ['socketpair', 'abstract', 'tcp']:
+        if name not in TRANSPORTS:
+            continue
+        try:
+            min_start, avg_start, rtt = bench(executable, script, name)
+        except Exception, e:
+            print '%-12s failed: %s' % (name, e)
+            continue
+        print '%-12s %14.1f %14.1f %10.1f' % (
+            name, min_start * 1000, avg_start * 1000, rtt * 1e6)
+
+if __name__ == '__main__':
+    main()